@@ -0,0 +1,215 @@
+"""
+Gravação de logs de acesso (ip_logs) fora do caminho crítico da requisição
+No modo assíncrono os registros vão para uma fila em memória limitada e uma
+thread em segundo plano grava em lote (executemany, uma transação por lote).
+A retenção e o arquivamento das linhas antigas ficam em manutencao.AgendadorManutencao,
+para uma passada longa nunca segurar a fila.
+BufferUltimoAcesso faz o mesmo para usuarios.ultimo_acesso, mantendo só o último
+acesso de cada usuário entre duas gravações.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict
+
+class GravadorAcessos:
+    def __init__(self, db=None, modo: str = None, intervalo_ms: int = None, lote_max: int = None, fila_max: int = None):
+        self.db = db
+        # Configuração via variáveis de ambiente, com os argumentos tendo precedência
+        self.modo = (modo or os.getenv('IP_LOG_MODE', 'async')).lower()
+        self.intervalo = (intervalo_ms or int(os.getenv('IP_LOG_FLUSH_MS', 200))) / 1000
+        self.lote_max = lote_max or int(os.getenv('IP_LOG_BATCH_SIZE', 500))
+        self.fila = queue.Queue(maxsize=fila_max or int(os.getenv('IP_LOG_QUEUE_SIZE', 10000)))
+        
+        self._reiniciar_estado()
+        atexit.register(self.parar)
+    
+    def _reiniciar_estado(self):
+        """Contadores, thread e lock (também usado no filho após um fork)"""
+        self.gravados = 0
+        self.descartados = 0
+        self.falhas = 0
+        self.lotes = 0
+        
+        self._thread = None
+        self._parar = threading.Event()
+        self._lock = threading.Lock()
+    
+    def reiniciar_apos_fork(self):
+        """No processo filho: fila, locks e thread novos (a thread do pai não existe aqui)"""
+        self.fila = queue.Queue(maxsize=self.fila.maxsize)
+        self._reiniciar_estado()
+    
+    def registrar(self, ip_address: str, user_agent: str = '', path: str = '', method: str = '', user_id: str = None, session_id: str = None, country: str = None, city: str = None):
+        """Registra um acesso (enfileira no modo assíncrono, grava direto no modo síncrono)"""
+        # Mesmo formato de CURRENT_TIMESTAMP (UTC), fixado no momento da requisição
+        data_acesso = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        registro = (ip_address, user_agent, path, method, user_id, session_id, country, city, data_acesso)
+        
+        if self.modo != 'async':
+            self._gravar([registro])
+            return
+        
+        self._iniciar()
+        try:
+            self.fila.put_nowait(registro)
+        except queue.Full:
+            with self._lock:
+                self.descartados += 1
+    
+    def _iniciar(self):
+        """Inicia a thread de gravação no primeiro uso (depois de um eventual fork)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._parar.clear()
+                self._thread = threading.Thread(target=self._executar, name='gravador-acessos', daemon=True)
+                self._thread.start()
+    
+    def _executar(self):
+        """Loop da thread: junta registros por até intervalo_ms ou lote_max e grava"""
+        while not self._parar.is_set():
+            try:
+                lote = [self.fila.get(timeout=self.intervalo)]
+            except queue.Empty:
+                continue
+            
+            # Aguardar o restante da janela juntando mais registros
+            prazo = time.monotonic() + self.intervalo
+            while len(lote) < self.lote_max:
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self.fila.get(timeout=restante))
+                except queue.Empty:
+                    break
+            self._gravar(lote)
+    
+    def _gravar(self, lote):
+        """Grava um lote em uma única transação e atualiza os contadores"""
+        gravados = self.db.registrar_ips_lote(lote)
+        with self._lock:
+            self.gravados += gravados
+            self.falhas += len(lote) - gravados
+            self.lotes += 1
+    
+    def flush(self):
+        """Grava imediatamente tudo o que estiver na fila"""
+        while True:
+            lote = []
+            while len(lote) < self.lote_max:
+                try:
+                    lote.append(self.fila.get_nowait())
+                except queue.Empty:
+                    break
+            if not lote:
+                return
+            self._gravar(lote)
+    
+    def parar(self):
+        """Para a thread de gravação e grava os registros pendentes (desligamento do worker)"""
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+    
+    def estatisticas(self) -> Dict:
+        """Contadores do gravador"""
+        return {
+            'modo': self.modo,
+            'pendentes': self.fila.qsize(),
+            'gravados': self.gravados,
+            'descartados': self.descartados,
+            'falhas': self.falhas,
+            'lotes': self.lotes
+        }
+
+class BufferUltimoAcesso:
+    def __init__(self, db=None, intervalo_s: float = None):
+        self.db = db
+        # ULTIMO_ACESSO_FLUSH_S=0 grava direto, sem buffer
+        self.intervalo = intervalo_s if intervalo_s is not None else float(os.getenv('ULTIMO_ACESSO_FLUSH_S', 5))
+        self._reiniciar_estado()
+        atexit.register(self.parar)
+    
+    def _reiniciar_estado(self):
+        """Contadores, thread e lock (também usado no filho após um fork)"""
+        # email -> data do último acesso (UTC), sobrescrito a cada login
+        self._pendentes = {}
+        self.gravados = 0
+        self.coalescidos = 0
+        
+        self._thread = None
+        self._parar = threading.Event()
+        self._lock = threading.Lock()
+    
+    def reiniciar_apos_fork(self):
+        """No processo filho: estado novo; os acessos pendentes pertencem ao pai, que os grava"""
+        self._reiniciar_estado()
+    
+    def registrar(self, email: str):
+        """Marca o acesso do usuário agora; a gravação acontece no próximo flush"""
+        data_acesso = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        if self.intervalo <= 0:
+            self._gravar({email: data_acesso})
+            return
+        
+        self._iniciar()
+        with self._lock:
+            if email in self._pendentes:
+                self.coalescidos += 1
+            self._pendentes[email] = data_acesso
+    
+    def _iniciar(self):
+        """Inicia a thread de gravação no primeiro uso (depois de um eventual fork)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._parar.clear()
+                self._thread = threading.Thread(target=self._executar, name='buffer-ultimo-acesso', daemon=True)
+                self._thread.start()
+    
+    def _executar(self):
+        """Loop da thread: grava os pendentes a cada intervalo segundos"""
+        while not self._parar.wait(self.intervalo):
+            self.flush()
+    
+    def _gravar(self, pendentes: Dict[str, str]):
+        """Grava {email: data_acesso}; em caso de erro apenas registra (é só um carimbo de acesso)"""
+        try:
+            self.db.atualizar_ultimos_acessos(pendentes.items())
+            with self._lock:
+                self.gravados += len(pendentes)
+        except Exception as e:
+            print(f"Error updating ultimo_acesso: {e}")
+    
+    def flush(self):
+        """Grava os acessos pendentes em uma única transação"""
+        with self._lock:
+            pendentes, self._pendentes = self._pendentes, {}
+        if pendentes:
+            self._gravar(pendentes)
+    
+    def parar(self):
+        """Para a thread e grava o que estiver pendente (desligamento do worker)"""
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+    
+    def estatisticas(self) -> Dict:
+        """Contadores do buffer"""
+        with self._lock:
+            return {
+                'pendentes': len(self._pendentes),
+                'gravados': self.gravados,
+                'coalescidos': self.coalescidos
+            }
@@ -1,39 +1,189 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
-from database import Database
+from flask import Flask, Blueprint, render_template, request, jsonify, session, redirect, url_for, Response, stream_with_context
+from werkzeug.middleware.proxy_fix import ProxyFix
+from database import obter_database
 from osint_tools import OSINTTools
 from auth_system import criar_conta, fazer_login, fazer_logout, is_authenticated, get_user_info, alterar_senha
-from middleware import log_request, is_admin, has_permission, get_client_ip
+from hash_senhas import SobrecargaHash
+from cache_respostas import CacheRespostas
+from backup import AgendadorSnapshots
+from manutencao import AgendadorManutencao
+from metricas import metricas
+import auth_system
+import hash_senhas
+import middleware
+from middleware import log_request, limitar_requisicao, finalizar_requisicao, iniciar_medicao, registrar_status, finalizar_medicao, is_admin, has_permission, get_client_ip, permissao_usuario, cache_permissoes
+import base64
+import csv
+import io
+import itertools
 import json
 import os
 import secrets
-from datetime import datetime
+from datetime import datetime, timezone
 from functools import wraps
 
-app = Flask(__name__)
-app.secret_key = os.getenv('SECRET_KEY', secrets.token_hex(16))
-db = Database()
-osint = OSINTTools()
+# Rotas e hooks ficam no blueprint; create_app monta o app e os objetos compartilhados
+bp = Blueprint('principal', __name__)
+db = None
+osint = None
+# Respostas das rotas de polling (TTL por RESPOSTA_CACHE_TTL_S); o banco é ligado em create_app
+cache_respostas = CacheRespostas()
+# Snapshots periódicos a cada BACKUP_INTERVALO_S segundos e sob demanda pela rota de admin
+agendador_snapshots = AgendadorSnapshots()
+# Retenção e arquivamento a cada IP_LOGS_PODA_INTERVALO_S segundos, em um processo por intervalo
+agendador_manutencao = AgendadorManutencao()
+
+def create_app(config: dict = None) -> Flask:
+    """
+    Cria o app Flask. `config` sobrepõe as chaves padrão (SECRET_KEY, DATABASE_PATH, DATABASE_URL etc.).
+    Com o preload do gunicorn isto roda uma vez no master: as migrações acontecem antes
+    do fork e a SECRET_KEY aleatória de fallback fica igual em todos os workers.
+    """
+    global db, osint
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', secrets.token_hex(16))
+    # Arquivo SQLite, ignorado quando DATABASE_URL aponta para um PostgreSQL (ver obter_database)
+    app.config['DATABASE_PATH'] = 'osint_database.db'
+    app.config['DATABASE_URL'] = os.getenv('DATABASE_URL', '')
+    # Número de proxies confiáveis na frente do app (0: o cliente fala direto com o gunicorn)
+    app.config['PROXY_SALTOS'] = int(os.getenv('PROXY_SALTOS', 0))
+    app.config.update(config or {})
+    if app.config['PROXY_SALTOS']:
+        # remote_addr passa a ser o IP que o último proxy confiável viu, não o que o cliente declarou
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_SALTOS'])
+    
+    db = obter_database(app.config['DATABASE_PATH'], app.config['DATABASE_URL'])
+    osint = OSINTTools()
+    middleware.configurar(db)
+    auth_system.configurar(db)
+    cache_respostas.db = db
+    agendador_snapshots.db = db
+    agendador_manutencao.db = db
+    app.register_blueprint(bp)
+    return app
+
+def reiniciar_apos_fork():
+    """
+    Reinicia o estado por processo herdado do master: conexões SQLite, threads de gravação,
+    locks e caches em memória. Chamado pelo post_fork do gunicorn.conf.py.
+    """
+    db.reiniciar_apos_fork()
+    middleware.gravador_acessos.reiniciar_apos_fork()
+    middleware.cache_permissoes.reiniciar_apos_fork()
+    middleware.limitador.reiniciar_apos_fork()
+    auth_system.buffer_ultimo_acesso.reiniciar_apos_fork()
+    hash_senhas.pool_hash.reiniciar_apos_fork()
+    cache_respostas.reiniciar_apos_fork()
+    metricas.reiniciar_apos_fork()
+    agendador_snapshots.reiniciar_apos_fork()
+    agendador_manutencao.reiniciar_apos_fork()
+
+def parar_worker():
+    """Grava o que estiver pendente nos buffers em memória (desligamento do worker)"""
+    middleware.gravador_acessos.parar()
+    auth_system.buffer_ultimo_acesso.parar()
+    agendador_snapshots.parar()
+    agendador_manutencao.parar()
+    db.fechar_conexoes()
+
+def usuario_id_atual():
+    """Id do usuário logado, usado para atribuir as buscas (None para buscas anônimas)"""
+    user = get_user_info()
+    return int(user['id']) if user and user.get('id') else None
+
+def resposta_sobrecarga(erro):
+    """503 com Retry-After quando o pool de hash de senhas está saturado"""
+    return jsonify({'sucesso': False, 'erro': str(erro)}), 503, {'Retry-After': str(erro.retry_after)}
+
+def codificar_cursor(data, id_linha):
+    """Cursor opaco de paginação: (data, id) da última linha entregue"""
+    bruto = json.dumps([data, id_linha], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip('=')
+
+def decodificar_cursor(cursor):
+    """Inverso de codificar_cursor; levanta ValueError para cursores inválidos"""
+    if not cursor:
+        return None
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data, id_linha = json.loads(bruto)
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(data, str) or not isinstance(id_linha, int):
+        raise ValueError('Invalid cursor')
+    return data, id_linha
+
+def parametros_pagina(limite_padrao, limite_maximo):
+    """Lê ?limit= e ?cursor= da requisição, limitando o tamanho da página"""
+    limite = request.args.get('limit', limite_padrao, type=int)
+    limite = max(1, min(limite, limite_maximo))
+    return limite, decodificar_cursor(request.args.get('cursor', ''))
+
+def resposta_paginada(itens, limite, coluna_data):
+    """
+    Transmite {"itens": [...], "next_cursor": ...} item a item, sem montar a lista em memória.
+    next_cursor só é preenchido quando a página veio cheia (pode haver mais linhas).
+    """
+    def gerar():
+        yield '{"itens":['
+        ultimo = None
+        total = 0
+        for item in itens:
+            yield (',' if total else '') + json.dumps(item, ensure_ascii=False, separators=(',', ':'), default=str)
+            ultimo = item
+            total += 1
+        proximo = codificar_cursor(ultimo[coluna_data], ultimo['id']) if ultimo and total >= limite else None
+        yield '],"next_cursor":' + json.dumps(proximo) + '}'
+    return Response(stream_with_context(gerar()), mimetype='application/json')
+
+def parametro_data(nome):
+    """Lê ?desde=/?ate= (data ou data e hora ISO 8601) no formato das colunas de data, em UTC"""
+    valor = request.args.get(nome, '').strip()
+    if not valor:
+        return None
+    try:
+        data = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'Invalid {nome}: use YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS')
+    if data.tzinfo is not None:
+        data = data.astimezone(timezone.utc).replace(tzinfo=None)
+    return data.strftime('%Y-%m-%d %H:%M:%S')
 
 # Middleware para capturar IPs em todas as requisições
-@app.before_request
+@bp.before_app_request
 def before_request():
+    iniciar_medicao()
+    agendador_snapshots.iniciar()
+    agendador_manutencao.iniciar()
+    recusa = limitar_requisicao()
+    if recusa:
+        return recusa
     log_request()
 
-@app.route('/')
+@bp.after_app_request
+def after_request(resposta):
+    return registrar_status(resposta)
+
+@bp.teardown_app_request
+def teardown_request(exc):
+    finalizar_requisicao()
+    finalizar_medicao()
+
+@bp.route('/')
 def index():
     """Página principal"""
     if not is_authenticated():
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     return render_template('index.html')
 
-@app.route('/login')
+@bp.route('/login')
 def login():
     """Página de login"""
     if is_authenticated():
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     return render_template('login.html')
 
-@app.route('/api/auth/register', methods=['POST'])
+@bp.route('/api/auth/register', methods=['POST'])
 def register():
     """API para criar conta"""
     try:
@@ -52,16 +202,21 @@ def register():
         
         if resultado.get('sucesso'):
             # Fazer login automático após registro
-            login_result = fazer_login(email, senha)
+            try:
+                login_result = fazer_login(email, senha)
+            except SobrecargaHash:
+                login_result = {}
             if login_result.get('sucesso'):
                 return jsonify({'sucesso': True, 'mensagem': 'Account created successfully'}), 200
             return jsonify({'sucesso': True, 'mensagem': 'Account created. Please login.'}), 200
         else:
             return jsonify(resultado), 400
+    except SobrecargaHash as e:
+        return resposta_sobrecarga(e)
     except Exception as e:
         return jsonify({'sucesso': False, 'erro': str(e)}), 500
 
-@app.route('/api/auth/login', methods=['POST'])
+@bp.route('/api/auth/login', methods=['POST'])
 def login_api():
     """API para fazer login"""
     try:
@@ -78,10 +233,12 @@ def login_api():
             return jsonify({'sucesso': True, 'mensagem': 'Login successful'}), 200
         else:
             return jsonify(resultado), 401
+    except SobrecargaHash as e:
+        return resposta_sobrecarga(e)
     except Exception as e:
         return jsonify({'sucesso': False, 'erro': str(e)}), 500
 
-@app.route('/api/buscar/nome', methods=['POST'])
+@bp.route('/api/buscar/nome', methods=['POST'])
 def buscar_nome():
     """API para buscar por nome"""
     try:
@@ -95,24 +252,25 @@ def buscar_nome():
         resultado = osint.buscar_nome(nome)
         
         # Salvar no banco de dados
-        for fonte in resultado.get('fontes', []):
-            db.salvar_busca_nome(
-                nome=nome,
-                resultado=fonte.get('resultado', ''),
-                fonte=fonte.get('nome', ''),
-                tipo_busca='nome'
-            )
-            db.salvar_historico(
-                tipo_busca='nome',
-                termo_busca=nome,
-                resultado=json.dumps(resultado, ensure_ascii=False)
-            )
+        # (uma transação: uma linha por fonte + uma linha de histórico)
+        db.salvar_busca_completa(
+            tipo_busca='nome',
+            termo_busca=nome,
+            linhas=[{
+                'nome': nome,
+                'resultado': fonte.get('resultado', ''),
+                'fonte': fonte.get('nome', ''),
+                'tipo_busca': 'nome'
+            } for fonte in resultado.get('fontes', [])],
+            resultado=json.dumps(resultado, ensure_ascii=False),
+            usuario_id=usuario_id_atual()
+        )
         
         return jsonify(resultado), 200
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
 
-@app.route('/api/buscar/processo', methods=['POST'])
+@bp.route('/api/buscar/processo', methods=['POST'])
 def buscar_processo():
     """API para buscar por processo"""
     try:
@@ -130,24 +288,25 @@ def buscar_processo():
         resultado = osint.buscar_processo(numero_processo)
         
         # Salvar no banco de dados
-        for fonte in resultado.get('fontes', []):
-            db.salvar_busca_processo(
-                numero_processo=numero_processo,
-                resultado=fonte.get('resultado', ''),
-                fonte=fonte.get('nome', ''),
-                status=resultado.get('status', 'pendente')
-            )
-            db.salvar_historico(
-                tipo_busca='processo',
-                termo_busca=numero_processo,
-                resultado=json.dumps(resultado, ensure_ascii=False)
-            )
+        # (uma transação: uma linha por fonte + uma linha de histórico)
+        db.salvar_busca_completa(
+            tipo_busca='processo',
+            termo_busca=numero_processo,
+            linhas=[{
+                'numero_processo': numero_processo,
+                'resultado': fonte.get('resultado', ''),
+                'fonte': fonte.get('nome', ''),
+                'status': resultado.get('status', 'pendente')
+            } for fonte in resultado.get('fontes', [])],
+            resultado=json.dumps(resultado, ensure_ascii=False),
+            usuario_id=usuario_id_atual()
+        )
         
         return jsonify(resultado), 200
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
 
-@app.route('/api/buscar/foto', methods=['POST'])
+@bp.route('/api/buscar/foto', methods=['POST'])
 def buscar_foto():
     """API para buscar por foto"""
     try:
@@ -162,25 +321,26 @@ def buscar_foto():
         resultado = osint.buscar_foto(termo_busca, url_imagem if url_imagem else None)
         
         # Salvar no banco de dados
-        for fonte in resultado.get('fontes', []):
-            db.salvar_busca_foto(
-                termo_busca=termo_busca,
-                url_imagem=url_imagem if url_imagem else '',
-                resultado=fonte.get('resultado', ''),
-                fonte=fonte.get('nome', ''),
-                hash_imagem=resultado.get('hash_imagem', '')
-            )
-            db.salvar_historico(
-                tipo_busca='foto',
-                termo_busca=termo_busca,
-                resultado=json.dumps(resultado, ensure_ascii=False)
-            )
+        # (uma transação: uma linha por fonte + uma linha de histórico)
+        db.salvar_busca_completa(
+            tipo_busca='foto',
+            termo_busca=termo_busca,
+            linhas=[{
+                'termo_busca': termo_busca,
+                'url_imagem': url_imagem if url_imagem else '',
+                'resultado': fonte.get('resultado', ''),
+                'fonte': fonte.get('nome', ''),
+                'hash_imagem': resultado.get('hash_imagem', '')
+            } for fonte in resultado.get('fontes', [])],
+            resultado=json.dumps(resultado, ensure_ascii=False),
+            usuario_id=usuario_id_atual()
+        )
         
         return jsonify(resultado), 200
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
 
-@app.route('/api/buscar/cpf', methods=['POST'])
+@bp.route('/api/buscar/cpf', methods=['POST'])
 def buscar_cpf():
     """API para buscar por CPF"""
     try:
@@ -202,63 +362,68 @@ def buscar_cpf():
         cpf_formatado = resultado.get('cpf', '')
         informacoes = json.dumps(resultado.get('informacoes', {}), ensure_ascii=False)
         
-        for fonte in resultado.get('fontes', []):
-            db.salvar_busca_cpf(
-                cpf=cpf_limpo,
-                cpf_formatado=cpf_formatado,
-                resultado=fonte.get('resultado', ''),
-                fonte=fonte.get('nome', ''),
-                informacoes=informacoes,
-                status=resultado.get('status', 'encontrado')
-            )
-            db.salvar_historico(
-                tipo_busca='cpf',
-                termo_busca=cpf_formatado,
-                resultado=json.dumps(resultado, ensure_ascii=False)
-            )
+        # (uma transação: uma linha por fonte + uma linha de histórico)
+        db.salvar_busca_completa(
+            tipo_busca='cpf',
+            termo_busca=cpf_formatado,
+            linhas=[{
+                'cpf': cpf_limpo,
+                'cpf_formatado': cpf_formatado,
+                'resultado': fonte.get('resultado', ''),
+                'fonte': fonte.get('nome', ''),
+                'informacoes': informacoes,
+                'status': resultado.get('status', 'encontrado')
+            } for fonte in resultado.get('fontes', [])],
+            resultado=json.dumps(resultado, ensure_ascii=False),
+            usuario_id=usuario_id_atual()
+        )
         
         return jsonify(resultado), 200
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
 
-@app.route('/api/historico', methods=['GET'])
+@bp.route('/api/historico', methods=['GET'])
+@cache_respostas.em_cache(['buscas'], argumentos=['limit', 'cursor'], condicao=lambda: not request.args.get('termo'))
 def obter_historico():
     """API para obter histórico de buscas"""
     try:
         tipo = request.args.get('tipo', '')
         termo = request.args.get('termo', '')
+        try:
+            limite, apos = parametros_pagina(50, 500)
+        except ValueError as e:
+            return jsonify({'erro': str(e)}), 400
         
-        if tipo == 'nome' and termo:
-            historico = db.buscar_historico_nome(termo)
-        elif tipo == 'processo' and termo:
-            historico = db.buscar_historico_processo(termo)
-        elif tipo == 'foto' and termo:
-            historico = db.buscar_historico_foto(termo)
+        if tipo in db.HISTORICO_POR_TIPO and termo:
+            historico = db.iterar_historico_termo(tipo, termo, apos=apos, limite=limite)
         else:
-            historico = db.obter_todas_buscas()
+            historico = db.iterar_historico(apos=apos, limite=limite)
         
-        return jsonify(historico), 200
+        return resposta_paginada(historico, limite, 'data_busca')
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
 
-@app.route('/api/estatisticas', methods=['GET'])
+@bp.route('/api/historico/<int:historico_id>', methods=['GET'])
+def obter_historico_detalhe(historico_id):
+    """API para obter uma busca do histórico com o resultado completo"""
+    try:
+        detalhe = db.obter_resultado_historico(historico_id)
+        if not detalhe:
+            return jsonify({'erro': 'Busca não encontrada'}), 404
+        return jsonify(detalhe), 200
+    except Exception as e:
+        return jsonify({'erro': str(e)}), 500
+
+@bp.route('/api/estatisticas', methods=['GET'])
+@cache_respostas.em_cache(['buscas'])
 def obter_estatisticas():
     """API para obter estatísticas do banco de dados"""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # Contar buscas por tipo
-        cursor.execute('SELECT COUNT(*) FROM nome_buscas')
-        total_nomes = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(*) FROM processo_buscas')
-        total_processos = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(*) FROM foto_buscas')
-        total_fotos = cursor.fetchone()[0]
-        
-        conn.close()
+        # Contar buscas por tipo (contadores mantidos por triggers)
+        contadores = db.obter_contadores()
+        total_nomes = contadores['nome_buscas']
+        total_processos = contadores['processo_buscas']
+        total_fotos = contadores['foto_buscas']
         
         return jsonify({
             'total_nomes': total_nomes,
@@ -269,13 +434,13 @@ def obter_estatisticas():
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
 
-@app.route('/api/auth/logout', methods=['POST'])
+@bp.route('/api/auth/logout', methods=['POST'])
 def logout():
     """Logout user"""
     fazer_logout()
     return jsonify({'sucesso': True}), 200
 
-@app.route('/api/auth/change-password', methods=['POST'])
+@bp.route('/api/auth/change-password', methods=['POST'])
 def change_password():
     """API para alterar senha"""
     try:
@@ -302,10 +467,12 @@ def change_password():
             return jsonify(resultado), 200
         else:
             return jsonify(resultado), 400
+    except SobrecargaHash as e:
+        return resposta_sobrecarga(e)
     except Exception as e:
         return jsonify({'sucesso': False, 'erro': str(e)}), 500
 
-@app.route('/api/user/profile', methods=['GET'])
+@bp.route('/api/user/profile', methods=['GET'])
 def user_profile():
     """Get user profile information"""
     try:
@@ -314,31 +481,21 @@ def user_profile():
             user_id = user.get('id')
             email = user.get('email')
             
-            # Get user info from database
-            usuario = db.obter_usuario_por_email(email)
-            permissao = usuario.get('permissao', 'user') if usuario else 'user'
+            # Permissão vem do cache (sem consulta a usuarios em acerto)
+            permissao = permissao_usuario(email) or 'user'
             
-            # Get user statistics from database
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT COUNT(*) FROM nome_buscas WHERE fonte LIKE ?', (f'%{user_id}%',))
-            name_searches = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM processo_buscas WHERE fonte LIKE ?', (f'%{user_id}%',))
-            process_searches = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM foto_buscas WHERE fonte LIKE ?', (f'%{user_id}%',))
-            photo_searches = cursor.fetchone()[0]
-            
-            conn.close()
+            # Get user statistics from database (per-user counters, one indexed lookup)
+            contadores = db.obter_contadores_usuario(int(user_id))
+            name_searches = contadores.get('nome', 0)
+            process_searches = contadores.get('processo', 0)
+            photo_searches = contadores.get('foto', 0)
             
             return jsonify({
                 'authenticated': True,
                 'name': user.get('name'),
                 'email': email,
                 'permissao': permissao,
-                'is_admin': is_admin(email),
+                'is_admin': permissao == 'admin',
                 'stats': {
                     'name_searches': name_searches,
                     'process_searches': process_searches,
@@ -358,38 +515,85 @@ def admin_required(f):
         if not is_authenticated():
             return jsonify({'erro': 'Authentication required'}), 401
         
-        user = get_user_info()
-        if not is_admin(user.get('email')):
+        if not is_admin():
             return jsonify({'erro': 'Admin access required'}), 403
         
         return f(*args, **kwargs)
     return decorated_function
 
-@app.route('/admin')
+@bp.route('/admin')
 def admin_panel():
     """Admin panel page"""
     if not is_authenticated():
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     
     user = get_user_info()
     if not is_admin(user.get('email')):
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
     
     return render_template('admin.html')
 
-@app.route('/api/admin/ips', methods=['GET'])
+@bp.route('/api/admin/ips', methods=['GET'])
 @admin_required
 def admin_get_ips():
     """Get IP logs"""
     try:
-        limite = request.args.get('limit', 100, type=int)
-        ips = db.obter_ips_recentes(limite)
-        return jsonify(ips), 200
+        try:
+            limite, apos = parametros_pagina(100, 1000)
+        except ValueError as e:
+            return jsonify({'erro': str(e)}), 400
+        return resposta_paginada(db.iterar_ips(apos=apos, limite=limite), limite, 'data_acesso')
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
 
-@app.route('/api/admin/ips/stats', methods=['GET'])
+@bp.route('/api/admin/export/<nome>', methods=['GET'])
 @admin_required
+def admin_exportar(nome):
+    """
+    Exporta ip_logs (ips) ou o histórico (historico) em NDJSON ou CSV, filtrando por
+    ?desde= (inclusive) e ?ate= (exclusive). O corpo é transmitido um bloco do cursor
+    por vez: memória constante e primeiro byte imediato mesmo com milhões de linhas.
+    """
+    if nome not in db.EXPORTACOES:
+        return jsonify({'erro': 'Unknown export'}), 404
+    formato = request.args.get('formato', 'ndjson')
+    if formato not in ('ndjson', 'csv'):
+        return jsonify({'erro': 'Invalid format: use ndjson or csv'}), 400
+    try:
+        desde, ate = parametro_data('desde'), parametro_data('ate')
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
+    
+    colunas = db.EXPORTACOES[nome][1]
+    blocos = db.iterar_exportacao(nome, desde=desde, ate=ate)
+    
+    def gerar_ndjson():
+        # Um encoder para a exportação inteira (json.dumps com opções cria um por chamada)
+        codificar = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=str).encode
+        for bloco in blocos:
+            yield ''.join(codificar(dict(zip(colunas, linha))) + '\n' for linha in bloco)
+    
+    def gerar_csv():
+        saida = io.StringIO()
+        escritor = csv.writer(saida)
+        escritor.writerow(colunas)
+        for bloco in itertools.chain([()], blocos):
+            # O primeiro bloco vazio envia o cabeçalho antes da primeira consulta
+            escritor.writerows(bloco)
+            yield saida.getvalue()
+            saida.seek(0)
+            saida.truncate()
+    
+    gerar, mimetype = (gerar_csv, 'text/csv') if formato == 'csv' else (gerar_ndjson, 'application/x-ndjson')
+    arquivo = f"{nome}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{formato}"
+    return Response(stream_with_context(gerar()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{arquivo}"'})
+
+# Em cache só pelo TTL: cada lote de logs de acesso muda os rollups, então uma geração de escrita
+# mudaria a cada poucas requisições e nenhuma entrada (nem o ETag) sobreviveria a ela
+@bp.route('/api/admin/ips/stats', methods=['GET'])
+@admin_required
+@cache_respostas.em_cache([])
 def admin_ip_stats():
     """Get IP statistics"""
     try:
@@ -398,8 +602,9 @@ def admin_ip_stats():
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
 
-@app.route('/api/admin/usuarios', methods=['GET'])
+@bp.route('/api/admin/usuarios', methods=['GET'])
 @admin_required
+@cache_respostas.em_cache(['usuarios'])
 def admin_get_usuarios():
     """Get all users"""
     try:
@@ -408,7 +613,85 @@ def admin_get_usuarios():
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
 
-@app.route('/api/admin/usuarios/permissao', methods=['POST'])
+@bp.route('/api/admin/metrics', methods=['GET'])
+@admin_required
+def admin_metricas():
+    """Métricas deste processo no formato texto do Prometheus"""
+    componentes = {
+        'gravador_acessos': middleware.gravador_acessos.estatisticas(),
+        'ultimo_acesso': auth_system.buffer_ultimo_acesso.estatisticas(),
+        'cache_permissoes': cache_permissoes.estatisticas(),
+        'cache_respostas': cache_respostas.estatisticas(),
+        'limitador': middleware.limitador.estatisticas(),
+        'pool_hash': hash_senhas.pool_hash.estatisticas(),
+        'snapshots': agendador_snapshots.estatisticas(),
+        'manutencao': agendador_manutencao.estatisticas(),
+    }
+    return Response(metricas.texto_prometheus(componentes), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/api/admin/metrics/lentas', methods=['GET'])
+@admin_required
+def admin_consultas_lentas():
+    """Consultas lentas recentes (acima de SQL_LENTA_MS) com o plano de execução"""
+    return jsonify(metricas.consultas_lentas()), 200
+
+@bp.route('/api/admin/contadores/reconstruir', methods=['POST'])
+@admin_required
+def admin_reconstruir_contadores():
+    """Recalcula os contadores de linhas e retorna as diferenças corrigidas"""
+    try:
+        resultado = db.reconstruir_contadores()
+        return jsonify(resultado), 200 if resultado.get('sucesso') else 500
+    except Exception as e:
+        return jsonify({'erro': str(e)}), 500
+
+@bp.route('/api/admin/arquivos', methods=['GET'])
+@admin_required
+def admin_listar_arquivos():
+    """Meses arquivados fora do banco principal (ver Database.arquivar)"""
+    if not db.ARQUIVOS:
+        return jsonify({'erro': 'Monthly archives are not available with PostgreSQL'}), 501
+    try:
+        return jsonify({'arquivos': db.listar_arquivos()}), 200
+    except Exception as e:
+        return jsonify({'erro': str(e)}), 500
+
+@bp.route('/api/admin/arquivos', methods=['POST'])
+@admin_required
+def admin_arquivar():
+    """Move para os arquivos mensais as linhas mais antigas que {"dias": N} (padrão: ARQUIVO_DIAS)"""
+    if not db.ARQUIVOS:
+        return jsonify({'erro': 'Monthly archives are not available with PostgreSQL'}), 501
+    try:
+        dias = (request.get_json(silent=True) or {}).get('dias')
+        if dias is not None and (not isinstance(dias, int) or dias <= 0):
+            return jsonify({'erro': 'dias must be a positive integer'}), 400
+        return jsonify({'sucesso': True, 'movidas': db.arquivar(dias)}), 200
+    except Exception as e:
+        return jsonify({'sucesso': False, 'erro': str(e)}), 500
+
+@bp.route('/api/admin/backups', methods=['GET'])
+@admin_required
+def admin_listar_backups():
+    """Snapshots gravados e o estado do agendador deste processo"""
+    if not db.SNAPSHOTS:
+        return jsonify({'erro': 'Snapshots are not available with PostgreSQL; use pg_dump'}), 501
+    try:
+        return jsonify({'snapshots': db.listar_snapshots(), 'agendador': agendador_snapshots.estatisticas()}), 200
+    except Exception as e:
+        return jsonify({'erro': str(e)}), 500
+
+@bp.route('/api/admin/backups', methods=['POST'])
+@admin_required
+def admin_criar_backup():
+    """Pede um snapshot agora; a cópia roda em segundo plano (acompanhe por GET /api/admin/backups)"""
+    if not db.SNAPSHOTS:
+        return jsonify({'erro': 'Snapshots are not available with PostgreSQL; use pg_dump'}), 501
+    if not agendador_snapshots.pedir():
+        return jsonify({'erro': 'A backup is already running'}), 409
+    return jsonify({'sucesso': True, 'mensagem': 'Backup started'}), 202
+
+@bp.route('/api/admin/usuarios/permissao', methods=['POST'])
 @admin_required
 def admin_update_permissao():
     """Update user permission"""
@@ -427,12 +710,24 @@ def admin_update_permissao():
         resultado = db.atualizar_permissao(email, permissao, user.get('email'))
         
         if resultado.get('sucesso'):
+            # Efeito imediato neste processo; os demais percebem pela versão no banco
+            cache_permissoes.invalidar()
             return jsonify({'sucesso': True, 'mensagem': f'Permission updated to {permissao}'}), 200
         else:
             return jsonify({'erro': resultado.get('erro', 'Error updating permission')}), 500
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
 
+def __getattr__(nome):
+    """
+    Compatibilidade com `gunicorn app:app` e `from app import app`: cria o app padrão
+    no primeiro acesso a app.app, em vez de na importação do módulo.
+    """
+    if nome == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+
 if __name__ == '__main__':
     print("=" * 50)
     print("Seita Research starting...")
@@ -442,7 +737,7 @@ if __name__ == '__main__':
     print("Default account created:")
     print("  Admin: finmogg@gmail.com / MOGG1212")
     print("=" * 50)
-    # Em produção, debug deve ser False
+    # Servidor de desenvolvimento; em produção use gunicorn -c gunicorn.conf.py (ver Procfile)
     debug_mode = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
-    app.run(debug=debug_mode, host='0.0.0.0', port=port)
+    create_app().run(debug=debug_mode, host='0.0.0.0', port=port, threaded=True)
 
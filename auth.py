@@ -1,5 +1,4 @@
 from flask import session, redirect, url_for
-from authlib.integrations.flask_client import OAuth
 import os
 
 # Google OAuth configuration
@@ -18,6 +17,8 @@ def init_oauth(app):
         print("   To enable Google login, set GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET environment variables.")
         return None
     
+    # authlib só é necessário (e importado) com o OAuth configurado
+    from authlib.integrations.flask_client import OAuth
     oauth = OAuth(app)
     
     try:
@@ -1,9 +1,18 @@
-from werkzeug.security import generate_password_hash, check_password_hash
-from database import Database
+from access_log import BufferUltimoAcesso
+from hash_senhas import gerar_hash, verificar_hash
 from flask import session
 import secrets
 
-db = Database()
+# O banco é escolhido por create_app (ver configurar)
+db = None
+# ultimo_acesso é gravado em lote a cada ULTIMO_ACESSO_FLUSH_S segundos
+buffer_ultimo_acesso = BufferUltimoAcesso()
+
+def configurar(banco):
+    """Liga as funções de conta e o buffer de ultimo_acesso ao Database do app"""
+    global db
+    db = banco
+    buffer_ultimo_acesso.db = banco
 
 def criar_conta(email: str, nome: str, senha: str) -> dict:
     """Cria uma nova conta de usuário"""
@@ -12,15 +21,14 @@ def criar_conta(email: str, nome: str, senha: str) -> dict:
     if usuario:
         return {'sucesso': False, 'erro': 'Email already registered'}
     
-    # Hash da senha
-    senha_hash = generate_password_hash(senha)
+    # Hash da senha (no pool limitado; pode levantar SobrecargaHash)
+    senha_hash = gerar_hash(senha)
     
     # Verificar se é o primeiro usuário (sem admins)
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM usuarios WHERE permissao = ?', ('admin',))
-    admin_count = cursor.fetchone()[0]
-    conn.close()
+    with db.conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM usuarios WHERE permissao = ?', ('admin',))
+        admin_count = cursor.fetchone()[0]
     
     # Se não há admins, tornar o primeiro usuário admin
     permissao = 'admin' if admin_count == 0 else 'user'
@@ -47,7 +55,7 @@ def fazer_login(email: str, senha: str) -> dict:
     
     # Verificar senha
     senha_hash = usuario.get('senha_hash')
-    if not senha_hash or not check_password_hash(senha_hash, senha):
+    if not senha_hash or not verificar_hash(senha_hash, senha):
         return {'sucesso': False, 'erro': 'Invalid email or password'}
     
     # Criar sessão
@@ -58,12 +66,8 @@ def fazer_login(email: str, senha: str) -> dict:
         'permissao': usuario.get('permissao')
     }
     
-    # Atualizar último acesso
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE usuarios SET ultimo_acesso = CURRENT_TIMESTAMP WHERE email = ?', (email,))
-    conn.commit()
-    conn.close()
+    # Atualizar último acesso (write-behind, coalescido por usuário)
+    buffer_ultimo_acesso.registrar(email)
     
     return {'sucesso': True, 'usuario': usuario}
 
@@ -92,22 +96,18 @@ def alterar_senha(email: str, senha_atual: str, nova_senha: str) -> dict:
     
     # Verificar senha atual
     senha_hash = usuario.get('senha_hash')
-    if not senha_hash or not check_password_hash(senha_hash, senha_atual):
+    if not senha_hash or not verificar_hash(senha_hash, senha_atual):
         return {'sucesso': False, 'erro': 'Current password is incorrect'}
     
     # Validar nova senha
     if len(nova_senha) < 6:
         return {'sucesso': False, 'erro': 'New password must be at least 6 characters'}
     
-    # Atualizar senha
+    # Atualizar senha (o hash fica fora do try para SobrecargaHash chegar à rota como 503)
+    nova_senha_hash = gerar_hash(nova_senha)
     try:
-        nova_senha_hash = generate_password_hash(nova_senha)
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE usuarios SET senha_hash = ? WHERE email = ?', 
-                      (nova_senha_hash, email))
-        conn.commit()
-        conn.close()
+        if not db.atualizar_senha(email, nova_senha_hash):
+            return {'sucesso': False, 'erro': 'User not found'}
         
         return {'sucesso': True, 'mensagem': 'Password changed successfully'}
     except Exception as e:
@@ -0,0 +1,130 @@
+"""
+Snapshots do banco (Database.snapshot) em uma thread em segundo plano
+Com BACKUP_INTERVALO_S > 0 a thread acorda no início de cada intervalo (contado a partir da
+meia-noite UTC) e todos os workers pedem o snapshot daquele instante; só um deles o grava.
+A rota de admin pede um snapshot fora de hora pelo mesmo caminho (pedir).
+"""
+import atexit
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict
+
+class AgendadorSnapshots:
+    def __init__(self, db=None, intervalo_s: float = None):
+        self.db = db
+        # BACKUP_INTERVALO_S=0 (padrão) grava só os snapshots pedidos pela rota de admin
+        self.intervalo = intervalo_s if intervalo_s is not None else float(os.getenv('BACKUP_INTERVALO_S', 0))
+        self._reiniciar_estado()
+        atexit.register(self.parar)
+    
+    def _reiniciar_estado(self):
+        """Contadores, thread e lock (também usado no filho após um fork)"""
+        self.concluidos = 0
+        self.ignorados = 0  # intervalos já gravados por outro processo
+        self.falhas = 0
+        self.ultimo = None  # resultado do último snapshot gravado por este processo
+        self.restantes = 0
+        self.total = 0
+        self.em_andamento = False
+        
+        self._pedido = False
+        self._thread = None
+        self._parar = threading.Event()
+        self._acordar = threading.Event()
+        self._lock = threading.Lock()
+    
+    def reiniciar_apos_fork(self):
+        """No processo filho: estado novo (um snapshot em andamento no pai continua lá)"""
+        self._reiniciar_estado()
+    
+    def iniciar(self):
+        """Inicia a thread se houver intervalo configurado (chamado a cada requisição; barato depois da primeira)"""
+        if self.intervalo > 0 and self.db.SNAPSHOTS:
+            self._iniciar()
+    
+    def _iniciar(self):
+        """Inicia a thread no primeiro uso (depois de um eventual fork)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._parar.clear()
+                self._thread = threading.Thread(target=self._executar, name='agendador-snapshots', daemon=True)
+                self._thread.start()
+    
+    def pedir(self) -> bool:
+        """Pede um snapshot agora; False se este processo já estiver gravando ou com um pedido na fila"""
+        with self._lock:
+            if self.em_andamento or self._pedido:
+                return False
+            self._pedido = True
+        self._iniciar()
+        self._acordar.set()
+        return True
+    
+    def _executar(self):
+        """Loop da thread: espera o próximo intervalo (ou um pedido) e grava o snapshot"""
+        while not self._parar.is_set():
+            espera = self.intervalo - time.time() % self.intervalo if self.intervalo > 0 else None
+            pedido = self._acordar.wait(espera)
+            if self._parar.is_set():
+                return
+            self._acordar.clear()
+            if pedido:
+                instante = None
+            else:
+                # Início do intervalo: o mesmo nome de arquivo em todos os processos
+                instante = datetime.fromtimestamp(time.time() // self.intervalo * self.intervalo, timezone.utc)
+            self._gravar(instante)
+    
+    def _gravar(self, instante):
+        """Grava um snapshot (instante None = agora) e atualiza os contadores"""
+        with self._lock:
+            self.em_andamento = True
+            self._pedido = False
+        try:
+            resultado = self.db.snapshot(instante, progresso=self._progresso)
+            with self._lock:
+                if resultado is None:
+                    self.ignorados += 1
+                else:
+                    self.concluidos += 1
+                    self.ultimo = resultado
+        except Exception as e:
+            with self._lock:
+                self.falhas += 1
+            print(f"Error writing snapshot: {e}")
+        finally:
+            with self._lock:
+                self.em_andamento = False
+                self.restantes = self.total = 0
+    
+    def _progresso(self, restantes: int, total: int):
+        """Chamado entre os passos da cópia; no desligamento interrompe o snapshot"""
+        self.restantes, self.total = restantes, total
+        if self._parar.is_set():
+            raise InterruptedError('Snapshot interrupted by shutdown')
+    
+    def parar(self):
+        """Para a thread; um snapshot em andamento é interrompido e o arquivo temporário removido"""
+        self._parar.set()
+        self._acordar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+    
+    def estatisticas(self) -> Dict:
+        """Contadores do agendador"""
+        with self._lock:
+            return {
+                'intervalo_s': self.intervalo,
+                'em_andamento': int(self.em_andamento),
+                'paginas_restantes': self.restantes,
+                'paginas_total': self.total,
+                'concluidos': self.concluidos,
+                'ignorados': self.ignorados,
+                'falhas': self.falhas,
+                'ultimo': self.ultimo
+            }
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Arquivamento em arquivos mensais (Database.arquivar): leituras transparentes e banco menor
+1) Em um banco gerado, compara antes e depois do arquivamento: histórico página a página
+   (cursor), busca por termo, IPs, exportações, detalhe de uma busca arquivada, contadores
+   (por tabela e por usuário) e reconstruir_contadores. Repete a comparação com um lote
+   interrompido entre a cópia para o arquivo e a remoção do banco principal, e depois de
+   a próxima execução terminar a movimentação.
+2) Mede o banco principal (bytes em uso, após checkpoint) e a mediana das leituras antes
+   e depois: primeira página, página nos meses arquivados, detalhe arquivado e exportação.
+
+Uso: python bench/bench_arquivo.py [--banco arquivo.db | --linhas 100000] [--dias 180]
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from gerar_dados import copiar_banco, gerar_dados
+from bench_rotas import bytes_em_uso
+
+
+def paginas(iterar, coluna_data: str, limite: int = 200):
+    """Todas as linhas de um iterar_* percorrido página a página pelo cursor (data, id)"""
+    linhas, apos = [], None
+    while True:
+        pagina = list(iterar(apos=apos, limite=limite))
+        linhas += pagina
+        if len(pagina) < limite:
+            return linhas
+        apos = (pagina[-1][coluna_data], pagina[-1]['id'])
+
+
+def estado(db):
+    """Tudo o que o arquivamento não pode mudar"""
+    with db.conexao() as conn:
+        por_usuario = conn.execute('SELECT usuario_id, tipo_busca, total FROM contadores_usuario '
+                                   'ORDER BY usuario_id, tipo_busca').fetchall()
+    return {
+        'historico': paginas(db.iterar_historico, 'data_busca'),
+        'historico_termo': list(db.iterar_historico_termo('nome', 'Pessoa 1', limite=None)),
+        'ips': paginas(db.iterar_ips, 'data_acesso', limite=1000),
+        'exportar_ips': [linha for bloco in db.iterar_exportacao('ips', segmento=7000) for linha in bloco],
+        'exportar_historico': [linha for bloco in db.iterar_exportacao('historico', desde='2000-01-01',
+                                                                        ate='2100-01-01') for linha in bloco],
+        'detalhe': [db.obter_resultado_historico(historico_id) for historico_id in (1, 2, 500)],
+        'contadores': db.obter_contadores(),
+        'por_usuario': por_usuario,
+    }
+
+
+def comparar(esperado: dict, atual: dict, etapa: str):
+    for chave, valor in esperado.items():
+        assert atual[chave] == valor, f'{etapa}: {chave} mudou'
+
+
+def interromper(db, dias: int):
+    """Arquiva mais um dia com a remoção do banco principal falhando logo após a cópia"""
+    with db.conexao() as conn:
+        conn.execute('''CREATE TEMP TRIGGER interromper BEFORE DELETE ON main.historico_buscas
+                        BEGIN SELECT RAISE(ABORT, 'interrompido'); END''')
+    try:
+        db.arquivar(dias)
+        raise AssertionError('o arquivamento deveria ter sido interrompido')
+    except sqlite3.IntegrityError:
+        pass
+    finally:
+        with db.conexao() as conn:
+            conn.execute('DROP TRIGGER temp.interromper')
+    with db.conexao() as conn:
+        duplicadas = 0
+        for mes, *_ in db._arquivos(conn, 'historico_buscas'):
+            esquema = db._anexar(mes)
+            duplicadas += conn.execute(f'SELECT COUNT(*) FROM historico_buscas WHERE id IN '
+                                       f'(SELECT id FROM {esquema}.historico_buscas)').fetchone()[0]
+            db._liberar(esquema)
+    assert duplicadas, 'nenhuma linha ficou nos dois lados'
+    return duplicadas
+
+
+def mediana_ms(funcao, repeticoes: int = 20) -> float:
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos)
+
+
+def medir(db) -> dict:
+    antigo = ((datetime.now(timezone.utc) - timedelta(days=300)).strftime('%Y-%m-%d %H:%M:%S'), 0)
+    return {
+        'banco principal MB': bytes_em_uso(db.caminho) / 1e6,
+        'telemetria MB': bytes_em_uso(db.caminho_telemetria) / 1e6,
+        'histórico 1ª página ms': mediana_ms(lambda: list(db.iterar_historico(limite=50))),
+        'histórico página antiga ms': mediana_ms(lambda: list(db.iterar_historico(apos=antigo, limite=50))),
+        'IPs 1ª página ms': mediana_ms(lambda: list(db.iterar_ips(limite=100))),
+        'detalhe antigo ms': mediana_ms(lambda: db.obter_resultado_historico(1)),
+        'exportar histórico ms': mediana_ms(lambda: [b for b in db.iterar_exportacao('historico')], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--banco', help='banco de partida (é copiado)')
+    parser.add_argument('--linhas', type=int, default=100000, help='ip_logs/histórico gerados sem --banco')
+    parser.add_argument('--dias', type=int, default=180, help='idade mínima das linhas arquivadas')
+    args = parser.parse_args()
+    
+    from database import Database
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, 'osint_database.db')
+        if args.banco:
+            copiar_banco(args.banco, caminho)
+        db = Database(caminho)
+        if not args.banco:
+            print(f'gerando {args.linhas:,} linhas...')
+            gerar_dados(db, args.linhas // 5, ip_logs=args.linhas, historico=args.linhas)
+        
+        esperado = estado(db)
+        antes = medir(db)
+        inicio = time.perf_counter()
+        movidas = db.arquivar(args.dias)
+        print(f'arquivar({args.dias}): {sum(movidas.values()):,} linhas em {time.perf_counter() - inicio:.2f} s '
+              f'({len(db.listar_arquivos())} arquivos mensais)')
+        for tabela, total in movidas.items():
+            print(f'  {tabela:<18}{total:>10,}')
+        comparar(esperado, estado(db), 'após arquivar')
+        assert db.reconstruir_contadores()['diferencas'] == {}, 'contadores divergem das tabelas + arquivos'
+        print('[ok] leituras e contadores iguais após arquivar')
+        
+        duplicadas = interromper(db, args.dias - 1)
+        comparar(esperado, estado(db), 'lote interrompido')
+        print(f'[ok] lote interrompido: {duplicadas} linhas nos dois lados, entregues uma vez')
+        db.arquivar(args.dias - 1)
+        comparar(esperado, estado(db), 'após retomar')
+        assert db.reconstruir_contadores()['diferencas'] == {}
+        print('[ok] próxima execução termina a movimentação\n')
+        
+        depois = medir(db)
+        print(f"{'':<30}{'antes':>10}{'depois':>10}")
+        for chave, valor in antes.items():
+            print(f'{chave:<30}{valor:>10.2f}{depois[chave]:>10.2f}')
+        db.fechar_conexoes()
+
+
+if __name__ == '__main__':
+    main()
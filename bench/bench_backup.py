@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Latência das requisições durante um backup online (Database.backup) de um banco grande
+Gera um banco com dados sintéticos e completa o tamanho pedido com uma tabela de lastro;
+sobe o gunicorn (gunicorn.conf.py) nesse diretório e mede a latência de clientes
+concorrentes (leituras, busca e log de acesso, que escrevem no banco) sem backup e
+durante um snapshot pedido por POST /api/admin/backups, em dois perfis:
+  passos   - BACKUP_PAGINAS/BACKUP_PAUSA_MS padrão (cópia em passos com pausa)
+  inteiro  - BACKUP_PAGINAS=-1 (uma chamada copia o banco todo)
+No fim confere o snapshot (quick_check e contadores iguais aos do banco copiado).
+
+Uso: python bench/bench_backup.py [--mb 2048] [--linhas 200000] [--clientes 8] [--segundos 10]
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from gerar_dados import gerar_dados
+from bench_servidor import ROTAS, percentil, porta_livre, requisitar, aguardar
+
+PERFIS = (
+    ('passos', {}),
+    ('inteiro', {'BACKUP_PAGINAS': '-1', 'BACKUP_PAUSA_MS': '0'}),
+)
+
+
+def gerar_banco(pasta: str, linhas: int, mb: int) -> str:
+    """Banco com `linhas` linhas sintéticas e lastro até ~`mb` MB; retorna o caminho"""
+    from database import Database
+    caminho = os.path.join(pasta, 'osint_database.db')
+    db = Database(caminho)
+    gerar_dados(db, linhas)
+    db.fechar_conexoes()
+    with sqlite3.connect(caminho) as conn:
+        conn.execute('CREATE TABLE IF NOT EXISTS lastro (id INTEGER PRIMARY KEY, dados BLOB)')
+        while os.path.getsize(caminho) < mb * 1024 * 1024:
+            conn.execute('''
+                WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 25000)
+                INSERT INTO lastro (dados) SELECT randomblob(4000) FROM n
+            ''')
+            conn.commit()
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    return caminho
+
+
+def carga(porta: int, cookie: str, clientes: int, parar: threading.Event):
+    """Clientes concorrentes até `parar`; retorna [(instante, ms, status)]"""
+    amostras = []
+    lock = threading.Lock()
+    
+    def cliente(deslocamento: int):
+        locais, i = [], deslocamento
+        while not parar.is_set():
+            metodo, caminho, corpo = ROTAS[i % len(ROTAS)]
+            i += 1
+            inicio = time.perf_counter()
+            try:
+                status, _ = requisitar(porta, metodo, caminho, corpo, cookie)
+            except OSError:
+                status = 0
+            locais.append((inicio, (time.perf_counter() - inicio) * 1000, status))
+        with lock:
+            amostras.extend(locais)
+    
+    threads = [threading.Thread(target=cliente, args=(n,)) for n in range(clientes)]
+    for t in threads:
+        t.start()
+    return threads, amostras
+
+
+def resumo(amostras) -> str:
+    latencias = [ms for _, ms, _ in amostras]
+    erros = sum(1 for _, _, status in amostras if status != 200)
+    if not latencias:
+        return 'sem amostras'
+    return (f'{len(latencias):>7}{percentil(latencias, 50):>9.1f}{percentil(latencias, 95):>9.1f}'
+            f'{percentil(latencias, 99):>10.1f}{max(latencias):>10.1f}{erros:>7}')
+
+
+def rodar_perfil(pasta: str, ambiente_extra: dict, args):
+    gunicorn = shutil.which('gunicorn')
+    porta = porta_livre()
+    backups = os.path.join(pasta, 'backups')
+    # Sem reciclagem de workers: a saída do worker interromperia o snapshot em andamento
+    ambiente = dict(os.environ, PORT=str(porta), RATE_LIMIT_ATIVO='0', SECRET_KEY='bench', PYTHONPATH=RAIZ,
+                    BACKUP_DIR=backups, GUNICORN_MAX_REQUESTS='0', **ambiente_extra)
+    processo = subprocess.Popen([gunicorn, '--bind', f'127.0.0.1:{porta}', '--log-level', 'warning',
+                                 '--access-logfile', '/dev/null', '-c', os.path.join(RAIZ, 'gunicorn.conf.py'),
+                                 'app:create_app()'], cwd=pasta, env=ambiente)
+    try:
+        aguardar(porta, processo, prazo=120)
+        status, cabecalhos = requisitar(porta, 'POST', '/api/auth/login',
+                                        {'email': 'finmogg@gmail.com', 'senha': 'MOGG1212'})
+        assert status == 200, status
+        cookie = next(valor.split(';')[0] for nome, valor in cabecalhos if nome.lower() == 'set-cookie')
+        
+        parar = threading.Event()
+        threads, amostras = carga(porta, cookie, args.clientes, parar)
+        time.sleep(args.segundos)
+        inicio_backup = time.perf_counter()
+        status, _ = requisitar(porta, 'POST', '/api/admin/backups', {}, cookie)
+        assert status == 202, status
+        prazo = time.monotonic() + args.prazo
+        while not (os.path.isdir(backups) and any(nome.endswith('.db') for nome in os.listdir(backups))):
+            if time.monotonic() > prazo or processo.poll() is not None:
+                parar.set()
+                raise RuntimeError('o snapshot não terminou')
+            time.sleep(0.2)
+        fim_backup = time.perf_counter()
+        time.sleep(1)
+        parar.set()
+        for t in threads:
+            t.join()
+    finally:
+        processo.terminate()
+        processo.wait(timeout=60)
+    
+    sem = [a for a in amostras if a[0] < inicio_backup]
+    durante = [a for a in amostras if inicio_backup <= a[0] < fim_backup]
+    snapshot = os.path.join(backups, next(nome for nome in os.listdir(backups) if nome.endswith('.db')))
+    return sem, durante, fim_backup - inicio_backup, snapshot
+
+
+def conferir(snapshot: str):
+    """quick_check e contadores do snapshot batem com as linhas copiadas"""
+    with sqlite3.connect(snapshot) as conn:
+        assert conn.execute('PRAGMA quick_check').fetchone()[0] == 'ok'
+        for tabela, total in conn.execute('SELECT tabela, total FROM contadores').fetchall():
+            contagem = conn.execute(f'SELECT COUNT(*) FROM {tabela}').fetchone()[0]
+            assert contagem == total, (tabela, contagem, total)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mb', type=int, default=2048)
+    parser.add_argument('--linhas', type=int, default=200000)
+    parser.add_argument('--clientes', type=int, default=8)
+    parser.add_argument('--segundos', type=float, default=10, help='duração da carga sem backup')
+    parser.add_argument('--prazo', type=float, default=900, help='tempo máximo de espera pelo snapshot')
+    args = parser.parse_args()
+    
+    if not shutil.which('gunicorn'):
+        sys.exit('gunicorn não encontrado (pip install -r requirements.txt)')
+    
+    with tempfile.TemporaryDirectory() as pasta:
+        inicio = time.perf_counter()
+        caminho = gerar_banco(pasta, args.linhas, args.mb)
+        print(f'banco: {os.path.getsize(caminho) / (1024 * 1024):.0f} MB em {time.perf_counter() - inicio:.0f} s\n')
+        
+        print(f"{'perfil':<18}{'req':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>10}{'max ms':>10}{'erros':>7}")
+        for nome, ambiente_extra in PERFIS:
+            sem, durante, duracao, snapshot = rodar_perfil(pasta, ambiente_extra, args)
+            conferir(snapshot)
+            print(f"{nome + ' sem backup':<18}{resumo(sem)}")
+            print(f"{nome + ' com backup':<18}{resumo(durante)}   backup: {duracao:.1f} s, "
+                  f"{os.path.getsize(snapshot) / (1024 * 1024):.0f} MB")
+            shutil.rmtree(os.path.join(pasta, 'backups'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Relatório de redução de tamanho com blobs comprimidos endereçados por hash
+Gera um histórico sintético com o JSON em texto (formato antigo), mede o banco,
+converte com Database.compactar_resultados() e mede de novo (ambos após VACUUM).
+
+Uso: python bench/bench_blobs.py [--linhas 1000000] [--distintos 50000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from database import Database
+from osint_tools import OSINTTools
+
+
+def tamanho_mb(db) -> float:
+    with db.conexao() as conn:
+        conn.execute('PRAGMA main.wal_checkpoint(TRUNCATE)')
+    conn = db.get_connection()
+    conn.execute('VACUUM')
+    conn.close()
+    return os.path.getsize(db.caminho) / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--linhas', type=int, default=1000000)
+    parser.add_argument('--distintos', type=int, default=50000,
+                        help='quantidade de resultados JSON diferentes (termos buscados)')
+    args = parser.parse_args()
+    
+    aleatorio = random.Random(42)
+    osint = OSINTTools()
+    payloads = []
+    for i in range(args.distintos):
+        tipo = ('nome', 'processo', 'foto')[i % 3]
+        if tipo == 'nome':
+            resultado = osint.buscar_nome(f'Pessoa Sintética {i}')
+        elif tipo == 'processo':
+            resultado = osint.buscar_processo(f'{i:07d}-00.2024.8.26.0100')
+        else:
+            resultado = osint.buscar_foto(f'termo {i}')
+        payloads.append((tipo, f'termo {i}', json.dumps(resultado, ensure_ascii=False)))
+    
+    def linhas():
+        for _ in range(args.linhas):
+            # Metade uniforme, metade com cauda longa (poucos termos muito repetidos)
+            if aleatorio.random() < 0.5:
+                indice = aleatorio.randrange(args.distintos)
+            else:
+                indice = min(int(aleatorio.paretovariate(1.2)) - 1, args.distintos - 1)
+            yield payloads[(indice * 7919) % args.distintos]
+    
+    with tempfile.TemporaryDirectory() as pasta:
+        db = Database(os.path.join(pasta, 'historico.db'))
+        with db.transacao() as conn:
+            conn.executemany('INSERT INTO historico_buscas (tipo_busca, termo_busca, resultado) VALUES (?, ?, ?)',
+                             linhas())
+        antes = tamanho_mb(db)
+        
+        inicio = time.perf_counter()
+        resultado = db.compactar_resultados()
+        duracao = time.perf_counter() - inicio
+        depois = tamanho_mb(db)
+        
+        with db.conexao() as conn:
+            blobs = conn.execute('SELECT COUNT(*) FROM blobs').fetchone()[0]
+        db.fechar_conexoes()
+    
+    print(f"linhas de histórico:      {args.linhas}")
+    print(f"blobs distintos:          {blobs}")
+    print(f"JSON em texto:            {antes:10.1f} MB")
+    print(f"blobs comprimidos:        {depois:10.1f} MB")
+    print(f"redução:                  {(1 - depois / antes) * 100:10.1f} %")
+    print(f"conversão:                {duracao:10.1f} s ({resultado['convertidas']['historico_buscas']} linhas)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark da persistência de uma busca: latência e crescimento do banco
+Compara o padrão antigo (salvar_busca_* + salvar_historico por fonte, um commit
+cada) com Database.salvar_busca_completa (uma transação, uma linha de histórico),
+e mede a latência ponta a ponta de POST /api/buscar/nome.
+
+Uso: python bench/bench_busca.py [--buscas 200]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+# Todas as requisições saem do mesmo IP/sessão; o limitador de taxa distorceria a medição
+os.environ.setdefault('RATE_LIMIT_ATIVO', '0')
+
+
+def tamanho_banco(db) -> int:
+    """Tamanho do arquivo após checkpoint do WAL, em bytes"""
+    with db.conexao() as conn:
+        conn.execute('PRAGMA main.wal_checkpoint(TRUNCATE)')
+    return os.path.getsize(db.caminho)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--buscas', type=int, default=200)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as pasta:
+        os.chdir(pasta)
+        from osint_tools import OSINTTools
+        import app as modulo_app
+        app = modulo_app.create_app()
+        db = modulo_app.db
+        resultado = OSINTTools().buscar_nome('Fulano de Tal')
+        resultado_json = json.dumps(resultado, ensure_ascii=False)
+        fontes = resultado['fontes']
+        
+        def antigo(nome):
+            for fonte in fontes:
+                db.salvar_busca_nome(nome=nome, resultado=fonte.get('resultado', ''),
+                                     fonte=fonte.get('nome', ''), tipo_busca='nome')
+                db.salvar_historico(tipo_busca='nome', termo_busca=nome, resultado=resultado_json)
+        
+        def novo(nome):
+            db.salvar_busca_completa(
+                tipo_busca='nome', termo_busca=nome,
+                linhas=[{'nome': nome, 'resultado': f.get('resultado', ''), 'fonte': f.get('nome', ''),
+                         'tipo_busca': 'nome'} for f in fontes],
+                resultado=resultado_json)
+        
+        print(f"{len(fontes)} fontes por busca, {args.buscas} buscas")
+        print(f"{'modo':<22}{'ms/busca':>10}{'KB/busca':>10}")
+        for nome, funcao in (('por fonte (antigo)', antigo), ('unidade de trabalho', novo)):
+            antes = tamanho_banco(db)
+            inicio = time.perf_counter()
+            for i in range(args.buscas):
+                funcao(f'Fulano {i}')
+            ms = (time.perf_counter() - inicio) * 1000 / args.buscas
+            kb = (tamanho_banco(db) - antes) / 1024 / args.buscas
+            print(f"{nome:<22}{ms:>10.2f}{kb:>10.2f}")
+        
+        cliente = app.test_client()
+        inicio = time.perf_counter()
+        for i in range(args.buscas):
+            cliente.post('/api/buscar/nome', json={'nome': f'Ciclano {i}'})
+        ms = (time.perf_counter() - inicio) * 1000 / args.buscas
+        print(f"{'POST /api/buscar/nome':<22}{ms:>10.2f}")
+        
+        import auth_system
+        import middleware
+        auth_system.buffer_ultimo_acesso.parar()
+        middleware.gravador_acessos.parar()
+        db.fechar_conexoes()
+        os.chdir(RAIZ)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Mede o cold start de um worker: tempo de "import app" em um processo novo
+A primeira execução cria o banco (migrações completas); as seguintes
+encontram o schema atualizado e devem pular todo o bootstrap.
+
+Uso: python bench/bench_cold_start.py [--execucoes 5] [--limite-ms 1500]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CODIGO = (
+    "import time; t = time.perf_counter(); import app; "
+    "print((time.perf_counter() - t) * 1000)"
+)
+
+
+def medir_import(pasta: str) -> float:
+    """Executa 'import app' em um processo novo e retorna o tempo em ms"""
+    env = dict(os.environ, PYTHONPATH=RAIZ)
+    saida = subprocess.run(
+        [sys.executable, '-c', CODIGO],
+        cwd=pasta, env=env, capture_output=True, text=True, check=True
+    )
+    return float(saida.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--execucoes', type=int, default=5)
+    parser.add_argument('--limite-ms', type=float, default=None,
+                        help='falha (exit 1) se a mediana a quente passar deste valor')
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as pasta:
+        primeiro = medir_import(pasta)
+        quentes = sorted(medir_import(pasta) for _ in range(args.execucoes))
+        mediana = quentes[len(quentes) // 2]
+    
+    print(f"primeiro boot (banco novo): {primeiro:8.1f} ms")
+    print(f"boot com schema atualizado: {mediana:8.1f} ms (mediana de {args.execucoes})")
+    
+    if args.limite_ms is not None and mediana > args.limite_ms:
+        print(f"FALHA: cold start acima do limite de {args.limite_ms} ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de latência por chamada do Database
+Compara o padrão antigo (uma conexão nova por chamada) com a conexão
+reutilizável por thread de Database.conexao()
+
+Uso: python bench/bench_conexoes.py [--chamadas 2000]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+
+def medir(funcao, chamadas: int) -> float:
+    """Retorna a latência média por chamada em microssegundos"""
+    inicio = time.perf_counter()
+    for i in range(chamadas):
+        funcao(i)
+    return (time.perf_counter() - inicio) / chamadas * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--chamadas', type=int, default=2000)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as pasta:
+        db = Database(os.path.join(pasta, 'bench.db'))
+        
+        def insert_antes(i):
+            conn = sqlite3.connect(db.caminho_telemetria)
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO ip_logs (ip_address, user_agent, path, method, user_id, session_id, country, city)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', ('10.0.0.1', 'bench', '/', 'GET', None, 'sessao', None, None))
+            conn.commit()
+            conn.close()
+        
+        def insert_depois(i):
+            db.registrar_ip('10.0.0.1', 'bench', '/', 'GET', None, 'sessao')
+        
+        def select_antes(i):
+            conn = sqlite3.connect(db.db_name)
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, email, permissao FROM usuarios WHERE email = ?', ('admin@seita.com',))
+            cursor.fetchone()
+            conn.close()
+        
+        def select_depois(i):
+            db.obter_usuario_por_email('admin@seita.com')
+        
+        print(f"{'operação':<28}{'antes (µs)':>14}{'depois (µs)':>14}{'ganho':>10}")
+        for nome, antes, depois in (
+            ('INSERT ip_logs + commit', insert_antes, insert_depois),
+            ('SELECT usuário por email', select_antes, select_depois),
+        ):
+            t_antes = medir(antes, args.chamadas)
+            t_depois = medir(depois, args.chamadas)
+            print(f"{nome:<28}{t_antes:>14.1f}{t_depois:>14.1f}{t_antes / t_depois:>9.1f}x")
+        
+        db.fechar_conexoes()
+
+
+if __name__ == '__main__':
+    main()
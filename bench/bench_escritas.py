@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Escritas concorrentes de vários processos no mesmo banco SQLite: nenhuma perdida e espera limitada
+Sobe --processos processos, como os workers do gunicorn, que fazem --escritas escritas cada um
+pelo Database, alternando entre:
+  acesso     - registrar_ips_lote com 5 acessos (banco de telemetria)
+  busca      - salvar_busca_completa com 2 linhas por fonte e o histórico
+  historico  - salvar_historico
+  login      - atualizar_ultimos_acessos
+  conta      - criar_usuario
+  permissao  - atualizar_permissao
+Cada processo mede a latência de cada escrita, conta as que falharam e devolve as métricas de
+lock do processo (histograma da espera pelo BEGIN IMMEDIATE, retentativas, desistências). No
+perfil de produção nenhuma escrita pode falhar, o banco tem de ter exatamente as linhas esperadas
+(contagens, rollup total de IPs igual a ip_logs, contadores iguais à contagem real) e o p99 da
+espera pelo lock tem de ficar abaixo de --p99-max-ms (limite superior do bucket do histograma,
+como o histogram_quantile do Prometheus). Perfis:
+  padrao           - configuração de produção (busy_timeout 5 s e ESCRITA_TENTATIVAS)
+  sem_espera       - busy_timeout 0 e uma tentativa: escritas travadas falham na hora (só medido)
+  timeout_curto    - busy_timeout de 100 ms: as retentativas com espera sorteada absorvem o que ele
+                     não cobre (só medido: com muitos processos as tentativas podem se esgotar)
+
+Uso: python bench/bench_escritas.py [--processos 8] [--escritas 300] [--p99-max-ms 1000]
+"""
+
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from bench_servidor import percentil
+
+OPERACOES = ('acesso', 'busca', 'historico', 'login', 'conta', 'permissao')
+ACESSOS_POR_LOTE = 5
+LINHAS_POR_BUSCA = 2
+# (nome, busy_timeout em ms ou None para o dos PRAGMAS, ESCRITA_TENTATIVAS ou None para o padrão, confere)
+PERFIS = (
+    ('padrao', None, None, True),
+    ('sem_espera', 0, 1, False),
+    ('timeout_curto', 100, None, False),
+)
+BUCKET = re.compile(r'^osint_sql_espera_lock_segundos_bucket\{banco="(\w+)",le="([^"]+)"\} (\d+)$')
+
+
+def escrever(db, operacao: str, processo: int, i: int) -> bool:
+    """Uma escrita; retorna se o Database a confirmou"""
+    marca = f'stress-{processo}-{i}'
+    agora = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+    if operacao == 'acesso':
+        registros = [(f'10.0.{processo}.{n}', 'bench', '/', 'GET', None, marca, None, None, agora)
+                     for n in range(ACESSOS_POR_LOTE)]
+        return db.registrar_ips_lote(registros) == ACESSOS_POR_LOTE
+    if operacao == 'busca':
+        linhas = [{'nome': marca, 'resultado': '{}', 'fonte': f'fonte {n}', 'tipo_busca': 'nome'}
+                  for n in range(LINHAS_POR_BUSCA)]
+        db.salvar_busca_completa('nome', marca, linhas, '{"stress": true}')
+    elif operacao == 'historico':
+        db.salvar_historico('nome', marca, '{"stress": true}')
+    elif operacao == 'login':
+        db.atualizar_ultimos_acessos([(f'base-{processo}@stress', agora)])
+    elif operacao == 'conta':
+        return db.criar_usuario(f'{marca}@stress', marca)['sucesso']
+    elif operacao == 'permissao':
+        return db.atualizar_permissao(f'base-{processo}@stress', 'user', 'bench')['sucesso']
+    return True
+
+
+def trabalhar(caminho: str, processo: int, escritas: int, busy_timeout, inicio, resultados):
+    """Processo escritor: espera o sinal de início, escreve e devolve latências, falhas e métricas"""
+    from database import Database
+    from metricas import metricas
+    db = Database(caminho)
+    if busy_timeout is not None:
+        for banco in db.BANCOS:
+            with db.conexao(banco) as conn:
+                conn.execute(f'PRAGMA busy_timeout = {busy_timeout}')
+    
+    inicio.wait()
+    latencias, falhas = [], Counter()
+    for i in range(escritas):
+        operacao = OPERACOES[(i + processo) % len(OPERACOES)]
+        comeco = time.perf_counter()
+        try:
+            confirmada = escrever(db, operacao, processo, i)
+        except Exception:
+            confirmada = False
+        latencias.append((time.perf_counter() - comeco) * 1000)
+        if not confirmada:
+            falhas[operacao] += 1
+    
+    buckets = Counter()
+    for linha in metricas.texto_prometheus().splitlines():
+        encontrado = BUCKET.match(linha)
+        if encontrado:
+            buckets[encontrado.group(2)] += int(encontrado.group(3))
+    db.fechar_conexoes()
+    resultados.put({'latencias': latencias, 'falhas': falhas, 'buckets': buckets,
+                    'retentativas': metricas.retentativas, 'desistencias': metricas.desistencias})
+
+
+def p99_espera_ms(buckets: Counter) -> float:
+    """Limite superior (ms) do bucket com o 99º percentil da espera pelo lock (contagens acumuladas por le)"""
+    limites = sorted((float(le), total) for le, total in buckets.items())
+    alvo = limites[-1][1] * 0.99
+    return next(le for le, total in limites if total >= alvo) * 1000
+
+
+def esperado(processos: int, escritas: int) -> Counter:
+    """Operações de cada tipo que os processos fazem"""
+    return Counter(OPERACOES[(i + processo) % len(OPERACOES)] for processo in range(processos) for i in range(escritas))
+
+
+def conferir(db, operacoes: Counter, processos: int) -> dict:
+    """Linhas que faltam (ou sobram) em cada tabela em relação às escritas feitas"""
+    resultado = db.reconstruir_contadores()
+    assert resultado['sucesso'] and not resultado['diferencas'], resultado
+    with db.conexao() as conn:
+        def contar(sql):
+            return conn.execute(sql).fetchone()[0]
+        
+        ip_logs = contar("SELECT COUNT(*) FROM ip_logs WHERE session_id LIKE 'stress-%'")
+        rollup = contar('SELECT COALESCE(SUM(total), 0) FROM (SELECT total FROM ip_rollup_total '
+                        'UNION ALL SELECT total FROM ip_rollup_hora) r')
+        assert ip_logs == rollup, 'rollups (total mais horas não consolidadas) diferentes de ip_logs'
+        reais = {
+            'ip_logs': ip_logs,
+            'nome_buscas': contar("SELECT COUNT(*) FROM nome_buscas WHERE nome LIKE 'stress-%'"),
+            'historico_buscas': contar("SELECT COUNT(*) FROM historico_buscas WHERE termo_busca LIKE 'stress-%'"),
+            'usuarios': contar("SELECT COUNT(*) FROM usuarios WHERE email LIKE 'stress-%'"),
+            'permissoes': contar("SELECT COUNT(*) FROM permissoes WHERE atribuido_por = 'bench'"),
+            'ultimo_acesso': contar("SELECT COUNT(*) FROM usuarios WHERE email LIKE 'base-%' AND ultimo_acesso IS NOT NULL"),
+        }
+    esperados = {
+        'ip_logs': operacoes['acesso'] * ACESSOS_POR_LOTE,
+        'nome_buscas': operacoes['busca'] * LINHAS_POR_BUSCA,
+        'historico_buscas': operacoes['busca'] + operacoes['historico'],
+        'usuarios': operacoes['conta'],
+        'permissoes': operacoes['permissao'],
+        'ultimo_acesso': processos,
+    }
+    return {tabela: esperados[tabela] - reais[tabela] for tabela in esperados if esperados[tabela] != reais[tabela]}
+
+
+def rodar_perfil(pasta: str, perfil: tuple, args) -> dict:
+    from database import Database
+    nome, busy_timeout, tentativas, _ = perfil
+    caminho = os.path.join(pasta, f'{nome}.db')
+    db = Database(caminho)
+    for processo in range(args.processos):
+        db.criar_usuario(f'base-{processo}@stress', f'base {processo}')
+    db.fechar_conexoes()
+    
+    # Os processos herdam o ambiente do pai no spawn
+    anterior = os.environ.pop('ESCRITA_TENTATIVAS', None)
+    if tentativas is not None:
+        os.environ['ESCRITA_TENTATIVAS'] = str(tentativas)
+    contexto = multiprocessing.get_context('spawn')
+    inicio, resultados = contexto.Event(), contexto.Queue()
+    processos = [contexto.Process(target=trabalhar, args=(caminho, n, args.escritas, busy_timeout, inicio, resultados))
+                 for n in range(args.processos)]
+    try:
+        for processo in processos:
+            processo.start()
+        # Todos abertos (e com as conexões prontas) antes de a carga começar
+        time.sleep(2)
+        comeco = time.perf_counter()
+        inicio.set()
+        parciais = [resultados.get(timeout=600) for _ in processos]
+        duracao = time.perf_counter() - comeco
+        for processo in processos:
+            processo.join()
+    finally:
+        os.environ.pop('ESCRITA_TENTATIVAS', None)
+        if anterior is not None:
+            os.environ['ESCRITA_TENTATIVAS'] = anterior
+    
+    total = {'latencias': [], 'falhas': Counter(), 'buckets': Counter(), 'retentativas': 0, 'desistencias': 0}
+    for parcial in parciais:
+        total['latencias'] += parcial['latencias']
+        for chave in ('falhas', 'buckets'):
+            total[chave].update(parcial[chave])
+        total['retentativas'] += parcial['retentativas']
+        total['desistencias'] += parcial['desistencias']
+    
+    db = Database(caminho)
+    total['faltando'] = conferir(db, esperado(args.processos, args.escritas), args.processos)
+    db.fechar_conexoes()
+    total['duracao'] = duracao
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processos', type=int, default=8)
+    parser.add_argument('--escritas', type=int, default=300, help='escritas por processo')
+    parser.add_argument('--p99-max-ms', type=float, default=1000, help='limite do p99 da espera pelo lock')
+    args = parser.parse_args()
+    
+    print(f"{'perfil':<17}{'escritas/s':>11}{'p50 ms':>8}{'p99 ms':>8}{'max ms':>9}{'p99 lock':>10}"
+          f"{'retent.':>9}{'desist.':>9}{'falhas':>8}{'perdidas':>10}")
+    problemas = []
+    with tempfile.TemporaryDirectory() as pasta:
+        for perfil in PERFIS:
+            nome, _, _, confere = perfil
+            r = rodar_perfil(pasta, perfil, args)
+            lat = r['latencias']
+            falhas = sum(r['falhas'].values())
+            perdidas = sum(r['faltando'].values())
+            p99_lock = p99_espera_ms(r['buckets'])
+            print(f"{nome:<17}{len(lat) / r['duracao']:>11.0f}{percentil(lat, 50):>8.1f}{percentil(lat, 99):>8.1f}"
+                  f"{max(lat):>9.1f}{'<= ' + format(p99_lock, 'g'):>10}{r['retentativas']:>9}{r['desistencias']:>9}"
+                  f"{falhas:>8}{perdidas:>10}")
+            if not confere:
+                continue
+            if falhas or r['faltando']:
+                problemas.append(f'{nome}: falhas {dict(r["falhas"])}, linhas faltando {r["faltando"]}')
+            if p99_lock > args.p99_max_ms:
+                problemas.append(f'{nome}: p99 da espera pelo lock {p99_lock:g} ms > {args.p99_max_ms:g} ms')
+    
+    for problema in problemas:
+        print(f'[FALHA] {problema}')
+    sys.exit(1 if problemas else 0)
+
+
+if __name__ == '__main__':
+    main()
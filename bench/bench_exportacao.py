@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exportação NDJSON/CSV transmitida x materializar a lista inteira
+1) Verifica iterar_exportacao: segmentos por keyset sem perder nem repetir linhas quando
+   muitas linhas têm a mesma data, e os filtros desde (inclusive) / ate (exclusive).
+2) Pelo test client: tempo até o primeiro byte, duração, MB/s e pico de memória
+   (tracemalloc) de /api/admin/export/* sobre o banco inteiro, comparados com um
+   fetchall + json.dumps das mesmas linhas (o que a rota de listagem fazia antes).
+
+Uso: python bench/bench_exportacao.py [--banco arquivo.db | --linhas 300000]
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.environ.setdefault('RATE_LIMIT_ATIVO', '0')
+
+from gerar_dados import copiar_banco, gerar_dados
+
+
+def verificar_segmentos():
+    from database import Database
+    with tempfile.TemporaryDirectory() as pasta:
+        db = Database(os.path.join(pasta, 'segmentos.db'))
+        # 50 linhas por segundo: os segmentos (7 linhas) terminam no meio de datas repetidas
+        with db.transacao('telemetria') as conn:
+            conn.executemany('INSERT INTO ip_logs (ip_address, path, method, data_acesso) VALUES (?, ?, ?, ?)',
+                             ((f'10.0.0.{i % 200}', '/', 'GET', f'2025-01-01 00:00:{i // 50:02d}') for i in range(1000)))
+        with db.conexao() as conn:
+            esperadas = conn.execute('SELECT id FROM ip_logs ORDER BY data_acesso, id').fetchall()
+            no_intervalo = conn.execute("SELECT id FROM ip_logs WHERE data_acesso >= '2025-01-01 00:00:03' "
+                                        "AND data_acesso < '2025-01-01 00:00:11' ORDER BY data_acesso, id").fetchall()
+        
+        def ids(**filtros):
+            return [(linha[0],) for bloco in db.iterar_exportacao('ips', lote=3, segmento=7, **filtros) for linha in bloco]
+        
+        assert ids() == esperadas, 'exportação completa difere da consulta direta'
+        assert ids(desde='2025-01-01 00:00:03', ate='2025-01-01 00:00:11') == no_intervalo
+        assert ids(desde='2030-01-01 00:00:00') == []
+        db.fechar_conexoes()
+
+
+def consumir(requisitar):
+    """Faz a requisição e lê o corpo transmitido; retorna (s até o primeiro byte, bytes, linhas)"""
+    # O test client já puxa o primeiro pedaço dentro do get(): o relógio começa antes dele
+    inicio = time.perf_counter()
+    resposta = requisitar()
+    primeiro, total, linhas = None, 0, 0
+    for pedaco in resposta.response:
+        if primeiro is None:
+            primeiro = time.perf_counter() - inicio
+        pedaco = pedaco if isinstance(pedaco, bytes) else pedaco.encode()
+        total += len(pedaco)
+        linhas += pedaco.count(b'\n')
+    resposta.close()
+    return primeiro, total, linhas
+
+
+def medir(funcao):
+    """(resultado, segundos, pico MB) — a duração vem de uma execução sem tracemalloc"""
+    inicio = time.perf_counter()
+    resultado = funcao()
+    duracao = time.perf_counter() - inicio
+    tracemalloc.start()
+    funcao()
+    pico = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return resultado, duracao, pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--banco', help='banco de partida (é copiado)')
+    parser.add_argument('--linhas', type=int, default=300000, help='ip_logs/histórico gerados sem --banco')
+    args = parser.parse_args()
+    
+    verificar_segmentos()
+    print('[ok] segmentos e filtros de iterar_exportacao\n')
+    
+    with tempfile.TemporaryDirectory() as pasta:
+        os.chdir(pasta)
+        if args.banco:
+            copiar_banco(args.banco, 'osint_database.db')
+        import app as modulo_app
+        import middleware
+        app = modulo_app.create_app({'SECRET_KEY': 'bench'})
+        db = modulo_app.db
+        if not args.banco:
+            print(f'gerando {args.linhas:,} linhas...')
+            gerar_dados(db, 10000, ip_logs=args.linhas, historico=args.linhas)
+        cliente = app.test_client()
+        cliente.post('/api/auth/login', json={'email': 'finmogg@gmail.com', 'senha': 'MOGG1212'})
+        
+        print(f"{'exportação':<28}{'linhas':>11}{'1º byte ms':>12}{'total s':>9}{'MB/s':>8}{'pico MB':>9}")
+        for nome, formato in (('ips', 'ndjson'), ('ips', 'csv'), ('historico', 'ndjson')):
+            caminho = f'/api/admin/export/{nome}?formato={formato}'
+            (primeiro, total, linhas), duracao, pico = medir(lambda: consumir(lambda: cliente.get(caminho)))
+            with db.conexao() as conn:
+                tabela = db.EXPORTACOES[nome][0]
+                esperadas = conn.execute(f'SELECT COUNT(*) FROM {tabela}').fetchone()[0]
+            assert linhas - (formato == 'csv') == esperadas, (caminho, linhas, esperadas)
+            print(f"{nome + ' ' + formato:<28}{esperadas:>11,}{primeiro * 1000:>12.1f}{duracao:>9.2f}"
+                  f"{total / 1e6 / duracao:>8.1f}{pico:>9.1f}")
+        
+        # O primeiro pedaço do CSV é só o cabeçalho, enviado antes da primeira consulta
+        resposta = cliente.get('/api/admin/export/ips?formato=csv')
+        primeiro = next(iter(resposta.response))
+        resposta.close()
+        cabecalho = next(csv.reader(io.StringIO(primeiro if isinstance(primeiro, str) else primeiro.decode())))
+        assert tuple(cabecalho) == db.EXPORTACOES['ips'][1], cabecalho
+        
+        def materializar():
+            tabela, colunas, coluna_data = db.EXPORTACOES['ips']
+            with db.conexao() as conn:
+                linhas = conn.execute(f"SELECT {', '.join(colunas)} FROM {tabela} ORDER BY {coluna_data}, id").fetchall()
+            return len(json.dumps([dict(zip(colunas, linha)) for linha in linhas], default=str))
+        _, duracao, pico = medir(materializar)
+        print(f"{'ips fetchall + json.dumps':<28}{'':>11}{duracao * 1000:>12.1f}{duracao:>9.2f}{'':>8}{pico:>9.1f}")
+        
+        middleware.gravador_acessos.parar()
+        modulo_app.parar_worker()
+        os.chdir(RAIZ)
+
+
+if __name__ == '__main__':
+    main()
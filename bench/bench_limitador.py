@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark do custo do limitador de taxa por requisição
+1) LimitadorTaxa.admitir isolado, com muitos IPs/sessões distintos (µs por chamada)
+2) GET / pelo test client com o limitador desligado x ligado (limites altos, sem recusas)
+
+Uso: python bench/bench_limitador.py [--chamadas 200000] [--requisicoes 3000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def percentil(valores, p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+def medir_admitir(chamadas: int):
+    """Tempo médio de admitir() em µs, girando por 10 mil IPs e sessões"""
+    from limitador import LimitadorTaxa
+    limitador = LimitadorTaxa(ativo=True, capacidade_ip=1e9, capacidade_sessao=1e9)
+    chaves = [(f'10.{i // 256 % 256}.{i % 256}.1', f'sessao{i}') for i in range(10000)]
+    inicio = time.perf_counter()
+    for i in range(chamadas):
+        ip, sessao = chaves[i % len(chaves)]
+        limitador.admitir('/api/buscar/nome', ip, sessao)
+    return (time.perf_counter() - inicio) * 1e6 / chamadas
+
+
+def medir_rota(cliente, requisicoes: int):
+    """Latências em ms de GET /"""
+    latencias = []
+    for _ in range(requisicoes):
+        inicio = time.perf_counter()
+        cliente.get('/')
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    return latencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--chamadas', type=int, default=200000)
+    parser.add_argument('--requisicoes', type=int, default=3000)
+    args = parser.parse_args()
+    
+    print(f'admitir(): {medir_admitir(args.chamadas):.2f} µs/chamada')
+    
+    with tempfile.TemporaryDirectory() as pasta:
+        os.chdir(pasta)
+        import middleware
+        from limitador import LimitadorTaxa
+        from app import create_app
+        app = create_app()
+        
+        cliente = app.test_client()
+        medir_rota(cliente, 200)  # aquecimento
+        print(f"{'limitador':<11}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        # Alterna as rodadas para diluir ruído de aquecimento e do gravador de acessos
+        resultados = {'desligado': [], 'ligado': []}
+        for _ in range(3):
+            for nome, ativo in (('desligado', False), ('ligado', True)):
+                middleware.limitador = LimitadorTaxa(ativo=ativo, capacidade_ip=1e9, capacidade_sessao=1e9)
+                resultados[nome] += medir_rota(cliente, args.requisicoes // 3)
+        for nome, latencias in resultados.items():
+            print(f"{nome:<11}{percentil(latencias, 50):>9.3f}{percentil(latencias, 95):>9.3f}"
+                  f"{percentil(latencias, 99):>9.3f}")
+        
+        middleware.gravador_acessos.parar()
+        middleware.db.fechar_conexoes()
+        os.chdir(RAIZ)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Limpeza das tabelas de busca (Database.limpar_banco): escritas concorrentes e espaço devolvido
+Em cópias do mesmo banco gerado, apaga as quatro tabelas de busca de duas formas enquanto
+uma thread grava no histórico a cada poucos milissegundos (como os workers):
+  unico  - o comportamento anterior: um DELETE por tabela, todos em uma transação
+  lotes  - limpar_banco: faixas de ids com commit e pausa entre elas e vacuum_incremental
+Mede a duração da limpeza, a latência das gravações durante ela (e as que falharam por
+"database is locked") e o tamanho do arquivo antes e depois. Confere que os contadores
+continuam iguais à contagem real.
+
+Uso: python bench/bench_limpeza.py [--linhas 200000] [--intervalo-ms 5]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from gerar_dados import copiar_banco, gerar_dados
+from bench_servidor import percentil
+
+TABELAS = ('nome_buscas', 'processo_buscas', 'foto_buscas', 'historico_buscas')
+
+
+def limpar_unico(db):
+    """O limpar_banco anterior: DELETE de cada tabela em uma única transação"""
+    with db.conexao() as conn:
+        for tabela in TABELAS:
+            conn.execute(f'DELETE FROM {tabela}')
+
+
+def tamanho_mb(caminho: str) -> float:
+    with sqlite3.connect(caminho) as conn:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    return os.path.getsize(caminho) / (1024 * 1024)
+
+
+def medir(caminho: str, limpar, intervalo: float) -> dict:
+    from database import Database
+    db = Database(caminho)
+    antes = tamanho_mb(caminho)
+    parar = threading.Event()
+    latencias, erros = [], [0]
+    
+    def gravar():
+        # Conexão própria (outra thread), como a de um worker atendendo buscas
+        while not parar.is_set():
+            inicio = time.perf_counter()
+            try:
+                db.salvar_historico('nome', 'Durante a limpeza', '{}', usuario_id=None)
+            except sqlite3.OperationalError:
+                erros[0] += 1
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            time.sleep(intervalo)
+    
+    escritor = threading.Thread(target=gravar)
+    escritor.start()
+    time.sleep(0.5)
+    inicio = time.perf_counter()
+    limpar(db)
+    duracao = time.perf_counter() - inicio
+    parar.set()
+    escritor.join()
+    
+    with db.conexao() as conn:
+        for tabela in TABELAS:
+            real = conn.execute(f'SELECT COUNT(*) FROM {tabela}').fetchone()[0]
+            assert db.obter_contadores()[tabela] == real, tabela
+    db.fechar_conexoes()
+    return {'duracao': duracao, 'latencias': latencias, 'erros': erros[0], 'antes': antes, 'depois': tamanho_mb(caminho)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--linhas', type=int, default=200000)
+    parser.add_argument('--intervalo-ms', type=float, default=5)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as pasta:
+        from database import Database
+        base = os.path.join(pasta, 'base.db')
+        db = Database(base)
+        gerar_dados(db, args.linhas)
+        db.fechar_conexoes()
+        
+        print(f"{'modo':<8}{'limpeza s':>10}{'gravações':>10}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>10}"
+              f"{'falhas':>8}{'MB antes':>10}{'MB depois':>10}")
+        for nome, limpar in (('unico', limpar_unico), ('lotes', lambda db: db.limpar_banco())):
+            caminho = os.path.join(pasta, f'{nome}.db')
+            copiar_banco(base, caminho)
+            r = medir(caminho, limpar, args.intervalo_ms / 1000)
+            lat = r['latencias']
+            print(f"{nome:<8}{r['duracao']:>10.2f}{len(lat):>10}{percentil(lat, 50):>9.1f}{percentil(lat, 99):>9.1f}"
+                  f"{max(lat):>10.1f}{r['erros']:>8}{r['antes']:>10.1f}{r['depois']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de latência das requisições com log de acesso síncrono x assíncrono
+Vários clientes concorrentes (threads) fazem GET / pelo test client do Flask;
+cada requisição passa por middleware.log_request.
+
+Uso: python bench/bench_log_request.py [--clientes 8] [--requisicoes 300]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+# Todas as requisições saem do mesmo IP/sessão; o limitador de taxa distorceria a medição
+os.environ.setdefault('RATE_LIMIT_ATIVO', '0')
+
+
+def percentil(valores, p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+def rodar(app, clientes: int, requisicoes: int):
+    """Dispara as requisições em paralelo e retorna (latências em ms, duração total)"""
+    latencias = []
+    lock = threading.Lock()
+    
+    def cliente():
+        c = app.test_client()
+        locais = []
+        for _ in range(requisicoes):
+            inicio = time.perf_counter()
+            c.get('/')
+            locais.append((time.perf_counter() - inicio) * 1000)
+        with lock:
+            latencias.extend(locais)
+    
+    threads = [threading.Thread(target=cliente) for _ in range(clientes)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencias, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clientes', type=int, default=8)
+    parser.add_argument('--requisicoes', type=int, default=300)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as pasta:
+        os.chdir(pasta)
+        import middleware
+        from access_log import GravadorAcessos
+        from app import create_app
+        app = create_app()
+        
+        print(f"{'modo':<8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'gravados':>10}{'descart.':>10}")
+        for modo in ('sync', 'async'):
+            gravador = GravadorAcessos(middleware.db, modo=modo)
+            middleware.gravador_acessos = gravador
+            latencias, duracao = rodar(app, args.clientes, args.requisicoes)
+            gravador.parar()
+            stats = gravador.estatisticas()
+            print(f"{modo:<8}{percentil(latencias, 50):>10.2f}{percentil(latencias, 95):>10.2f}"
+                  f"{percentil(latencias, 99):>10.2f}{len(latencias) / duracao:>10.0f}"
+                  f"{stats['gravados']:>10}{stats['descartados']:>10}")
+        
+        middleware.db.fechar_conexoes()
+        os.chdir(RAIZ)
+
+
+if __name__ == '__main__':
+    main()
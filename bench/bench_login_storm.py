@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste de carga: latência de uma rota sem autenticação durante uma rajada de logins
+Threads "leitoras" fazem GET /api/estatisticas enquanto threads "atacantes" fazem
+POST /api/auth/login sem parar. Como em um worker gthread, todas as requisições são
+atendidas por --threads threads (padrão: GUNICORN_THREADS, o mesmo do gunicorn.conf.py),
+e a latência inclui a espera por uma delas. Compara três cenários:
+  base       - só as leitoras, sem rajada
+  ilimitado  - rajada com um pool do tamanho da rajada (equivale ao hash inline)
+  limitado   - rajada com o pool padrão (HASH_WORKERS / HASH_FILA_MAX)
+O esperado é o p99 das leitoras no cenário limitado ficar próximo do base,
+com o excedente de logins recebendo 503 + Retry-After.
+
+Uso: python bench/bench_login_storm.py [--leitoras 4] [--atacantes 32] [--segundos 5] [--threads 4]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+# Todas as requisições saem do mesmo IP/sessão; o limitador de taxa distorceria a medição
+os.environ.setdefault('RATE_LIMIT_ATIVO', '0')
+
+
+def percentil(valores, p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+def rodar(app, leitoras: int, atacantes: int, segundos: float, threads: int):
+    """Retorna (latências das leitoras em ms, contagem de status dos logins)"""
+    fim = time.monotonic() + segundos
+    latencias = []
+    status = Counter()
+    lock = threading.Lock()
+    # As threads de requisição do worker: os clientes só esperam a resposta
+    worker = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='worker')
+    
+    def leitora():
+        c = app.test_client()
+        locais = []
+        while time.monotonic() < fim:
+            inicio = time.perf_counter()
+            worker.submit(c.get, '/api/estatisticas').result()
+            locais.append((time.perf_counter() - inicio) * 1000)
+        with lock:
+            latencias.extend(locais)
+    
+    def atacante():
+        c = app.test_client()
+        locais = Counter()
+        while time.monotonic() < fim:
+            resposta = worker.submit(c.post, '/api/auth/login',
+                                     json={'email': 'finmogg@gmail.com', 'senha': 'MOGG1212'}).result()
+            locais[resposta.status_code] += 1
+            if resposta.status_code == 503:
+                # Cliente bem-comportado: espera o Retry-After (limitado ao fim do teste)
+                espera = int(resposta.headers.get('Retry-After', 1))
+                time.sleep(max(0, min(espera, fim - time.monotonic())))
+        with lock:
+            status.update(locais)
+    
+    clientes = [threading.Thread(target=leitora) for _ in range(leitoras)]
+    clientes += [threading.Thread(target=atacante) for _ in range(atacantes)]
+    for t in clientes:
+        t.start()
+    for t in clientes:
+        t.join()
+    worker.shutdown()
+    return latencias, status
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--leitoras', type=int, default=4)
+    parser.add_argument('--atacantes', type=int, default=32)
+    parser.add_argument('--segundos', type=float, default=5)
+    parser.add_argument('--threads', type=int, default=int(os.getenv('GUNICORN_THREADS', 4)),
+                        help='threads de requisição do worker (GUNICORN_THREADS)')
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as pasta:
+        os.chdir(pasta)
+        import middleware
+        import auth_system
+        import hash_senhas
+        from app import create_app
+        app = create_app()
+        
+        cenarios = (
+            ('base', 0, hash_senhas.pool_hash),
+            ('ilimitado', args.atacantes, hash_senhas.PoolHash(workers=args.atacantes, fila_max=args.atacantes)),
+            ('limitado', args.atacantes, hash_senhas.PoolHash()),
+        )
+        print(f"{'cenário':<11}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'leituras':>10}{'login 200':>11}{'login 503':>11}")
+        for nome, atacantes, pool in cenarios:
+            hash_senhas.pool_hash = pool
+            latencias, status = rodar(app, args.leitoras, atacantes, args.segundos, args.threads)
+            print(f"{nome:<11}{percentil(latencias, 50):>9.2f}{percentil(latencias, 95):>9.2f}"
+                  f"{percentil(latencias, 99):>9.2f}{len(latencias):>10}{status[200]:>11}{status[503]:>11}")
+        print(f"pool limitado: {hash_senhas.pool_hash.estatisticas()}")
+        print(f"ultimo_acesso: {auth_system.buffer_ultimo_acesso.estatisticas()}")
+        
+        auth_system.buffer_ultimo_acesso.parar()
+        middleware.gravador_acessos.parar()
+        middleware.db.fechar_conexoes()
+        os.chdir(RAIZ)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vazão com vários nós do app: SQLite local x PostgreSQL compartilhado
+  sqlite        - um nó (gunicorn com gunicorn.conf.py) sobre o arquivo local
+  postgres xN   - N nós independentes (um gunicorn cada, em portas diferentes) sobre o mesmo
+                  banco PostgreSQL, como N máquinas atrás de um balanceador
+Cada perfil começa de um banco novo com --linhas linhas sintéticas (gerar_dados). Os clientes
+são distribuídos entre os nós e repetem a mistura de rotas do bench_servidor (leituras, busca
+por nome e o log de acesso de cada requisição, que escrevem no banco). No fim confere cada
+banco: contadores iguais à contagem real e rollup total de IPs igual às linhas de ip_logs.
+
+O PostgreSQL vem de --url (padrão: DATABASE_URL); cada perfil cria um banco temporário nesse
+servidor e o apaga no fim (o usuário precisa de permissão de CREATE DATABASE).
+
+Uso: python bench/bench_nos.py [--url postgresql://...] [--nos 1,2] [--workers 2] [--clientes 16]
+                               [--segundos 10] [--linhas 20000]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from gerar_dados import gerar_dados
+from bench_servidor import ROTAS, aguardar, percentil, porta_livre, requisitar
+
+
+def criar_banco_postgres(url: str, nome: str) -> str:
+    """Cria (ou recria) o banco `nome` no servidor de `url` e retorna a URL dele"""
+    import psycopg
+    with psycopg.connect(url, autocommit=True) as conn:
+        conn.execute(f'DROP DATABASE IF EXISTS {nome} WITH (FORCE)')
+        conn.execute(f'CREATE DATABASE {nome}')
+    return urlunsplit(urlsplit(url)._replace(path='/' + nome))
+
+
+def apagar_banco_postgres(url: str, nome: str):
+    import psycopg
+    with psycopg.connect(url, autocommit=True) as conn:
+        conn.execute(f'DROP DATABASE IF EXISTS {nome} WITH (FORCE)')
+
+
+def abrir_banco(pasta: str, url: str):
+    """Database do perfil: o PostgreSQL de `url` ou o arquivo SQLite em `pasta`"""
+    if url:
+        from database_postgres import DatabasePostgres
+        return DatabasePostgres(url)
+    from database import Database
+    return Database(os.path.join(pasta, 'osint_database.db'))
+
+
+def conferir(db):
+    """Contadores sem diferenças e rollups de IPs (total mais horas não consolidadas) iguais à contagem de ip_logs"""
+    resultado = db.reconstruir_contadores()
+    assert resultado['sucesso'] and not resultado['diferencas'] and not resultado['usuarios_corrigidos'], resultado
+    with db.conexao() as conn:
+        linhas = conn.execute('SELECT COUNT(*) FROM ip_logs').fetchone()[0]
+        rollup = conn.execute('SELECT COALESCE(SUM(total), 0) FROM (SELECT total FROM ip_rollup_total '
+                              'UNION ALL SELECT total FROM ip_rollup_hora) r').fetchone()[0]
+    assert linhas == rollup, (linhas, rollup)
+
+
+def subir_nos(quantidade: int, pasta: str, url: str, workers: int):
+    """Sobe `quantidade` gunicorns independentes; retorna [(porta, processo)]"""
+    gunicorn = shutil.which('gunicorn')
+    nos = []
+    for _ in range(quantidade):
+        porta = porta_livre()
+        # O limitador de taxa recusaria a carga, que sai toda de um único IP
+        ambiente = dict(os.environ, PORT=str(porta), RATE_LIMIT_ATIVO='0', SECRET_KEY='bench', PYTHONPATH=RAIZ,
+                        WEB_CONCURRENCY=str(workers))
+        ambiente.pop('DATABASE_URL', None)
+        if url:
+            ambiente['DATABASE_URL'] = url
+        processo = subprocess.Popen([gunicorn, '--bind', f'127.0.0.1:{porta}', '--log-level', 'warning',
+                                     '--access-logfile', '/dev/null', '-c', os.path.join(RAIZ, 'gunicorn.conf.py'),
+                                     'app:create_app()'], cwd=pasta, env=ambiente)
+        nos.append((porta, processo))
+    for porta, processo in nos:
+        aguardar(porta, processo, prazo=60)
+    return nos
+
+
+def rodar_carga(portas, clientes: int, segundos: float):
+    """Clientes repartidos entre as portas; retorna (latências em ms, erros, duração)"""
+    cookies = {}
+    for porta in portas:
+        status, cabecalhos = requisitar(porta, 'POST', '/api/auth/login',
+                                        {'email': 'finmogg@gmail.com', 'senha': 'MOGG1212'})
+        assert status == 200, status
+        cookies[porta] = next(valor.split(';')[0] for nome, valor in cabecalhos if nome.lower() == 'set-cookie')
+    
+    fim = time.monotonic() + segundos
+    latencias = []
+    erros = [0]
+    lock = threading.Lock()
+    
+    def cliente(numero: int):
+        porta = portas[numero % len(portas)]
+        locais, falhas, i = [], 0, numero
+        while time.monotonic() < fim:
+            metodo, caminho, corpo = ROTAS[i % len(ROTAS)]
+            i += 1
+            inicio = time.perf_counter()
+            try:
+                status, _ = requisitar(porta, metodo, caminho, corpo, cookies[porta])
+                if status != 200:
+                    falhas += 1
+            except OSError:
+                falhas += 1
+            locais.append((time.perf_counter() - inicio) * 1000)
+        with lock:
+            latencias.extend(locais)
+            erros[0] += falhas
+    
+    threads = [threading.Thread(target=cliente, args=(n,)) for n in range(clientes)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencias, erros[0], time.perf_counter() - inicio
+
+
+def rodar_perfil(nos: int, url: str, args):
+    with tempfile.TemporaryDirectory() as pasta:
+        db = abrir_banco(pasta, url)
+        gerar_dados(db, args.linhas)
+        db.fechar_conexoes()
+        
+        processos = subir_nos(nos, pasta, url, args.workers)
+        try:
+            resultado = rodar_carga([porta for porta, _ in processos], args.clientes, args.segundos)
+        finally:
+            # worker_exit grava os logs de acesso pendentes antes de o worker sair
+            for _, processo in processos:
+                processo.terminate()
+            for _, processo in processos:
+                processo.wait(timeout=60)
+        
+        db = abrir_banco(pasta, url)
+        conferir(db)
+        db.fechar_conexoes()
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=os.getenv('DATABASE_URL'), help='servidor PostgreSQL (postgresql://...)')
+    parser.add_argument('--nos', default='1,2', help='quantidades de nós nos perfis PostgreSQL')
+    parser.add_argument('--workers', type=int, default=2, help='workers do gunicorn por nó')
+    parser.add_argument('--clientes', type=int, default=16)
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--linhas', type=int, default=20000)
+    args = parser.parse_args()
+    
+    if not shutil.which('gunicorn'):
+        sys.exit('gunicorn não encontrado (pip install -r requirements.txt)')
+    perfis = [('sqlite', 1, None)]
+    if args.url:
+        perfis += [(f'postgres x{n}', int(n), args.url) for n in args.nos.split(',')]
+    else:
+        print('sem --url nem DATABASE_URL: só o perfil sqlite\n')
+    
+    print(f"{'perfil':<14}{'nós':>4}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>10}{'erros':>7}")
+    for nome, nos, url in perfis:
+        banco = f'bench_nos_{os.getpid()}'
+        if url:
+            url = criar_banco_postgres(args.url, banco)
+        try:
+            latencias, erros, duracao = rodar_perfil(nos, url, args)
+        finally:
+            if url:
+                apagar_banco_postgres(args.url, banco)
+        print(f"{nome:<14}{nos:>4}{len(latencias) / duracao:>9.0f}{percentil(latencias, 50):>9.1f}"
+              f"{percentil(latencias, 95):>9.1f}{percentil(latencias, 99):>10.1f}{erros:>7}")
+
+
+if __name__ == '__main__':
+    main()
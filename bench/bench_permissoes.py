@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de latência de uma rota admin com e sem o cache de permissões
+Faz login como admin e chama GET /api/admin/ips/stats repetidamente pelo test client,
+contando (via trace callback) quantas consultas a usuarios cada requisição dispara.
+Com o cache, o caminho de acerto não deve consultar usuarios.
+
+Uso: python bench/bench_permissoes.py [--requisicoes 2000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+# Todas as requisições saem do mesmo IP/sessão; o limitador de taxa distorceria a medição
+os.environ.setdefault('RATE_LIMIT_ATIVO', '0')
+
+
+def percentil(valores, p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+def rodar(cliente, conn, requisicoes: int):
+    """Retorna (latências em ms, consultas a usuarios por requisição)"""
+    consultas = []
+    conn.set_trace_callback(lambda sql: consultas.append(sql) if 'FROM usuarios' in sql else None)
+    latencias = []
+    try:
+        for _ in range(requisicoes):
+            inicio = time.perf_counter()
+            resposta = cliente.get('/api/admin/ips/stats')
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            assert resposta.status_code == 200, resposta.status_code
+    finally:
+        conn.set_trace_callback(None)
+    return latencias, len(consultas) / requisicoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requisicoes', type=int, default=2000)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as pasta:
+        os.chdir(pasta)
+        import auth_system
+        import middleware
+        from cache_permissoes import CachePermissoes
+        import app as modulo_app
+        
+        cliente = modulo_app.create_app().test_client()
+        resposta = cliente.post('/api/auth/login', json={'email': 'finmogg@gmail.com', 'senha': 'MOGG1212'})
+        assert resposta.status_code == 200, resposta.get_json()
+        conn = middleware.db._conexao_da_thread()
+        
+        print(f"{'cache':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'usuarios/req':>14}")
+        # ttl_s=0: toda verificação vai ao banco, como antes do cache
+        for nome, cache in (('desligado', CachePermissoes(middleware.db, ttl_s=0)),
+                            ('ligado', CachePermissoes(middleware.db))):
+            middleware.cache_permissoes = cache
+            modulo_app.cache_permissoes = cache
+            rodar(cliente, conn, 50)  # aquecimento
+            latencias, por_requisicao = rodar(cliente, conn, args.requisicoes)
+            print(f"{nome:<10}{percentil(latencias, 50):>10.3f}{percentil(latencias, 95):>10.3f}"
+                  f"{percentil(latencias, 99):>10.3f}{por_requisicao:>14.3f}")
+        print(cache.estatisticas())
+        
+        auth_system.buffer_ultimo_acesso.parar()
+        middleware.gravador_acessos.parar()
+        middleware.db.fechar_conexoes()
+        os.chdir(RAIZ)
+
+
+if __name__ == '__main__':
+    main()
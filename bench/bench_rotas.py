@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark offline de todas as rotas do app.py, com resultados em JSON para comparar commits
+
+Clientes concorrentes (cada um com sua sessão de admin) repetem a lista OPERACOES, que
+cobre todas as rotas, pelo test client do Flask (--modo cliente) ou contra um gunicorn
+local com o gunicorn.conf.py (--modo gunicorn). Por operação: req/s, p50/p95/p99 e os
+status recebidos. Em seguida, uma fase sequencial repete cada operação e mede quanto o
+banco cresce por chamada (páginas em uso após o checkpoint do WAL), incluindo o log de
+acesso gravado pelo middleware.
+
+Com --banco, o arquivo (ex.: gerado por bench/gerar_dados.py) é copiado e usado no lugar
+de um banco vazio. Com DATABASE_URL apontando para um PostgreSQL, o app (e o gunicorn) usa esse
+servidor; o crescimento por chamada só é medido no SQLite. A busca por CPF usa um CPF inválido: com um válido a rota consulta APIs
+externas, que não fazem parte de um benchmark offline.
+
+Uso: python bench/bench_rotas.py [--modo cliente|gunicorn] [--clientes 4] [--segundos 10]
+                                 [--banco arquivo.db] [--saida resultado.json] [--comparar anterior.json]
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+# A carga sai toda de um único IP; o limitador de taxa recusaria a maior parte
+os.environ['RATE_LIMIT_ATIVO'] = '0'
+
+from bench_servidor import aguardar, percentil, porta_livre
+from database import caminho_telemetria
+from gerar_dados import copiar_banco
+
+# O app usa o PostgreSQL de DATABASE_URL em vez do arquivo no diretório temporário
+POSTGRES = os.getenv('DATABASE_URL', '').startswith(('postgres://', 'postgresql://'))
+
+ADMIN = {'email': 'finmogg@gmail.com', 'senha': 'MOGG1212'}
+ALVO_PERMISSAO = 'bench-alvo@exemplo.invalid'
+_sequencia = itertools.count()
+
+def ultima_hora() -> str:
+    return (datetime.now(timezone.utc) - timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+# (nome, método, caminho, corpo, status esperado); caminho e corpo podem ser funções do
+# contexto (ids e cursores obtidos na preparação). '/' e '/admin' renderizam templates
+# que não fazem parte da árvore e respondem 500; '/login' com sessão ativa redireciona.
+OPERACOES = (
+    ('index', 'GET', '/', None, 500),
+    ('pagina_login', 'GET', '/login', None, 302),
+    ('pagina_admin', 'GET', '/admin', None, 500),
+    ('registro', 'POST', '/api/auth/register',
+     lambda ctx: {'email': f'bench{os.getpid()}-{next(_sequencia)}@exemplo.invalid', 'nome': 'Bench', 'senha': 'senha123'}, 200),
+    ('login', 'POST', '/api/auth/login', ADMIN, 200),
+    ('buscar_nome', 'POST', '/api/buscar/nome', {'nome': 'Fulano de Tal'}, 200),
+    ('buscar_processo', 'POST', '/api/buscar/processo', {'numero_processo': '0000001-00.2024.8.26.0100'}, 200),
+    ('buscar_foto', 'POST', '/api/buscar/foto', {'termo_busca': 'paisagem'}, 200),
+    ('buscar_cpf', 'POST', '/api/buscar/cpf', {'cpf': '111.111.111-11'}, 400),
+    ('historico', 'GET', '/api/historico?limit=50', None, 200),
+    ('historico_pagina2', 'GET', lambda ctx: f"/api/historico?limit=50&cursor={ctx['cursor_historico']}", None, 200),
+    ('historico_termo', 'GET', '/api/historico?tipo=nome&termo=Fulano&limit=50', None, 200),
+    ('historico_item', 'GET', lambda ctx: f"/api/historico/{ctx['historico_id']}", None, 200),
+    ('estatisticas', 'GET', '/api/estatisticas', None, 200),
+    ('perfil', 'GET', '/api/user/profile', None, 200),
+    ('alterar_senha', 'POST', '/api/auth/change-password',
+     {'senha_atual': ADMIN['senha'], 'nova_senha': ADMIN['senha'], 'confirmar_senha': ADMIN['senha']}, 200),
+    ('admin_ips', 'GET', '/api/admin/ips?limit=100', None, 200),
+    ('admin_ips_stats', 'GET', '/api/admin/ips/stats', None, 200),
+    ('admin_usuarios', 'GET', '/api/admin/usuarios', None, 200),
+    ('admin_permissao', 'POST', '/api/admin/usuarios/permissao', {'email': ALVO_PERMISSAO, 'permissao': 'member'}, 200),
+    # Exportações da última hora (com --banco, exportar tudo dominaria a rodada)
+    ('admin_exportar_ips', 'GET', lambda ctx: f'/api/admin/export/ips?desde={ultima_hora()}', None, 200),
+    ('admin_exportar_historico_csv', 'GET',
+     lambda ctx: f'/api/admin/export/historico?formato=csv&desde={ultima_hora()}', None, 200),
+    ('admin_metricas', 'GET', '/api/admin/metrics', None, 200),
+    ('admin_consultas_lentas', 'GET', '/api/admin/metrics/lentas', None, 200),
+    ('admin_reconstruir_contadores', 'POST', '/api/admin/contadores/reconstruir', None, 200),
+    ('admin_arquivos', 'GET', '/api/admin/arquivos', None, 200),
+    # Só linhas de mais de 10 anos: mede a varredura do arquivamento sem mover o banco de teste
+    ('admin_arquivar', 'POST', '/api/admin/arquivos', {'dias': 3650}, 200),
+    # O POST de /api/admin/backups grava um snapshot inteiro em segundo plano (ver bench_backup.py)
+    ('admin_backups', 'GET', '/api/admin/backups', None, 200),
+    # Por último: encerra a sessão, que o cliente refaz sem medir antes da próxima rodada
+    ('logout', 'POST', '/api/auth/logout', None, 200),
+)
+
+
+class ClienteTeste:
+    """Sessão no test client do Flask (mesmo processo)"""
+    def __init__(self, app):
+        self.cliente = app.test_client()
+    
+    def requisitar(self, metodo: str, caminho: str, corpo=None):
+        with self.cliente.open(caminho, method=metodo, json=corpo) as resposta:
+            return resposta.status_code, resposta.get_data()
+
+
+class ClienteHttp:
+    """Sessão HTTP contra o gunicorn: uma conexão por requisição, cookie de sessão guardado"""
+    def __init__(self, porta: int):
+        self.porta = porta
+        self.cookie = None
+    
+    def requisitar(self, metodo: str, caminho: str, corpo=None):
+        conexao = http.client.HTTPConnection('127.0.0.1', self.porta, timeout=60)
+        cabecalhos = {'Connection': 'close'}
+        if self.cookie:
+            cabecalhos['Cookie'] = self.cookie
+        dados = None
+        if corpo is not None:
+            dados = json.dumps(corpo)
+            cabecalhos['Content-Type'] = 'application/json'
+        try:
+            conexao.request(metodo, caminho, body=dados, headers=cabecalhos)
+            resposta = conexao.getresponse()
+            conteudo = resposta.read()
+            cookie = resposta.getheader('Set-Cookie')
+            if cookie:
+                self.cookie = cookie.split(';')[0]
+            return resposta.status, conteudo
+        finally:
+            conexao.close()
+
+
+def executar(cliente, operacao, contexto):
+    _, metodo, caminho, corpo, _ = operacao
+    caminho = caminho(contexto) if callable(caminho) else caminho
+    corpo = corpo(contexto) if callable(corpo) else corpo
+    return cliente.requisitar(metodo, caminho, corpo)
+
+
+def entrar(cliente):
+    status, _ = cliente.requisitar('POST', '/api/auth/login', ADMIN)
+    assert status == 200, f'login do admin falhou: {status}'
+
+
+def preparar(cliente) -> dict:
+    """Cria os dados de que as operações dependem e retorna o contexto (ids, cursores)"""
+    entrar(cliente)
+    cliente.requisitar('POST', '/api/auth/register', {'email': ALVO_PERMISSAO, 'nome': 'Alvo', 'senha': 'senha123'})
+    entrar(cliente)
+    for i in range(60):
+        cliente.requisitar('POST', '/api/buscar/nome', {'nome': f'Fulano {i}'})
+    status, corpo = cliente.requisitar('GET', '/api/historico?limit=50')
+    pagina = json.loads(corpo)
+    assert status == 200 and pagina['next_cursor'], 'histórico sem segunda página'
+    return {'historico_id': pagina['itens'][0]['id'], 'cursor_historico': pagina['next_cursor']}
+
+
+def rodar_carga(novo_cliente, contexto: dict, clientes: int, segundos: float) -> dict:
+    """Clientes concorrentes percorrem OPERACOES até o prazo; retorna {operação: [(ms, status)]}"""
+    amostras = {operacao[0]: [] for operacao in OPERACOES}
+    lock = threading.Lock()
+    fim = time.monotonic() + segundos
+    
+    def trabalhar(deslocamento: int):
+        cliente = novo_cliente()
+        entrar(cliente)
+        locais = {operacao[0]: [] for operacao in OPERACOES}
+        i = deslocamento
+        while time.monotonic() < fim:
+            operacao = OPERACOES[i % len(OPERACOES)]
+            i += 1
+            inicio = time.perf_counter()
+            try:
+                status, _ = executar(cliente, operacao, contexto)
+            except OSError:
+                status = 'erro'
+            locais[operacao[0]].append(((time.perf_counter() - inicio) * 1000, status))
+            if operacao[0] == 'logout':
+                entrar(cliente)
+        with lock:
+            for nome, valores in locais.items():
+                amostras[nome].extend(valores)
+    
+    # Deslocamentos diferentes: cada cliente começa em um ponto da lista
+    threads = [threading.Thread(target=trabalhar, args=(n * len(OPERACOES) // clientes,)) for n in range(clientes)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return amostras
+
+
+def bytes_em_uso(caminho: str) -> int:
+    """Bytes das páginas em uso no arquivo, após mover o WAL para o banco"""
+    with sqlite3.connect(caminho, timeout=30) as conn:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        paginas, livres, tamanho = (conn.execute(f'PRAGMA {pragma}').fetchone()[0]
+                                    for pragma in ('page_count', 'freelist_count', 'page_size'))
+    conn.close()
+    return (paginas - livres) * tamanho
+
+
+def medir_crescimento(cliente, contexto: dict, caminho: str, repeticoes: int, esvaziar) -> dict:
+    """Bytes acrescentados ao banco (e ao de telemetria) por chamada de cada operação, uma operação por vez (vazio sem arquivo SQLite)"""
+    crescimento = {}
+    if caminho is None:
+        return crescimento
+    for operacao in OPERACOES:
+        esvaziar()
+        antes = bytes_em_uso(caminho) + bytes_em_uso(caminho_telemetria(caminho))
+        for _ in range(repeticoes):
+            executar(cliente, operacao, contexto)
+            if operacao[0] == 'logout':
+                entrar(cliente)
+        esvaziar()
+        depois = bytes_em_uso(caminho) + bytes_em_uso(caminho_telemetria(caminho))
+        crescimento[operacao[0]] = (depois - antes) / repeticoes
+    return crescimento
+
+
+def resumir(amostras: dict, duracao: float, crescimento: dict, esperados: dict) -> dict:
+    operacoes = {}
+    for nome, valores in amostras.items():
+        latencias = [ms for ms, _ in valores]
+        status = {}
+        for _, codigo in valores:
+            status[str(codigo)] = status.get(str(codigo), 0) + 1
+        operacoes[nome] = {
+            'requisicoes': len(valores),
+            'req_s': round(len(valores) / duracao, 2),
+            'p50_ms': round(percentil(latencias, 50), 3) if latencias else None,
+            'p95_ms': round(percentil(latencias, 95), 3) if latencias else None,
+            'p99_ms': round(percentil(latencias, 99), 3) if latencias else None,
+            'status': status,
+            'inesperados': len(valores) - status.get(str(esperados[nome]), 0),
+            'bytes_por_chamada': round(crescimento.get(nome, 0), 1),
+        }
+    todas = [ms for valores in amostras.values() for ms, _ in valores]
+    total = {
+        'requisicoes': len(todas),
+        'req_s': round(len(todas) / duracao, 2),
+        'p50_ms': round(percentil(todas, 50), 3),
+        'p95_ms': round(percentil(todas, 95), 3),
+        'p99_ms': round(percentil(todas, 99), 3),
+        'inesperados': sum(o['inesperados'] for o in operacoes.values()),
+    }
+    return {'operacoes': operacoes, 'total': total}
+
+
+def verificar_cobertura(app):
+    """Falha se alguma rota do app não tiver operação no benchmark"""
+    cobertas = {caminho.split('?')[0] if isinstance(caminho, str) else None for _, _, caminho, _, _ in OPERACOES}
+    dinamicas = {'/api/historico/<int:historico_id>', '/api/admin/export/<nome>'}
+    faltando = [regra.rule for regra in app.url_map.iter_rules()
+                if regra.endpoint != 'static' and regra.rule not in cobertas | dinamicas]
+    assert not faltando, f'rotas sem operação no benchmark: {faltando}'
+
+
+def commit_atual() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconhecido'
+
+
+def rodar_cliente(pasta: str, args) -> dict:
+    os.chdir(pasta)
+    try:
+        import app as modulo_app
+        import auth_system
+        import middleware
+        
+        app = modulo_app.create_app({'SECRET_KEY': 'bench'})
+        # Sem o traceback de cada 500 por template ausente no meio da tabela
+        app.logger.disabled = True
+        verificar_cobertura(app)
+        contexto = preparar(ClienteTeste(app))
+        inicio = time.perf_counter()
+        amostras = rodar_carga(lambda: ClienteTeste(app), contexto, args.clientes, args.segundos)
+        duracao = time.perf_counter() - inicio
+        
+        def esvaziar():
+            # flush() só drena a fila: espera também o lote que a thread de gravação já retirou
+            time.sleep(middleware.gravador_acessos.intervalo * 2)
+            middleware.gravador_acessos.flush()
+            auth_system.buffer_ultimo_acesso.flush()
+        
+        sequencial = ClienteTeste(app)
+        entrar(sequencial)
+        crescimento = medir_crescimento(sequencial, contexto, modulo_app.db.caminho, args.repeticoes, esvaziar)
+        modulo_app.parar_worker()
+        return {'amostras': amostras, 'duracao': duracao, 'crescimento': crescimento}
+    finally:
+        os.chdir(RAIZ)
+
+
+def rodar_gunicorn(pasta: str, args) -> dict:
+    gunicorn = shutil.which('gunicorn')
+    if not gunicorn:
+        sys.exit('gunicorn não encontrado (pip install -r requirements.txt)')
+    porta = porta_livre()
+    ambiente = dict(os.environ, PORT=str(porta), SECRET_KEY='bench', PYTHONPATH=RAIZ)
+    processo = subprocess.Popen([gunicorn, '--bind', f'127.0.0.1:{porta}', '--log-level', 'warning',
+                                 '--access-logfile', '/dev/null', '-c', os.path.join(RAIZ, 'gunicorn.conf.py'),
+                                 'app:create_app()'], cwd=pasta, env=ambiente)
+    try:
+        aguardar(porta, processo)
+        contexto = preparar(ClienteHttp(porta))
+        inicio = time.perf_counter()
+        amostras = rodar_carga(lambda: ClienteHttp(porta), contexto, args.clientes, args.segundos)
+        duracao = time.perf_counter() - inicio
+        
+        # Os buffers ficam nos workers: espera o intervalo de gravação do log de acesso e do último acesso
+        espera = max(float(os.getenv('IP_LOG_FLUSH_MS', 200)) / 1000, float(os.getenv('ULTIMO_ACESSO_FLUSH_S', 5))) + 0.5
+        sequencial = ClienteHttp(porta)
+        entrar(sequencial)
+        caminho = None if POSTGRES else os.path.join(pasta, 'osint_database.db')
+        crescimento = medir_crescimento(sequencial, contexto, caminho, args.repeticoes, lambda: time.sleep(espera))
+        return {'amostras': amostras, 'duracao': duracao, 'crescimento': crescimento}
+    finally:
+        processo.terminate()
+        processo.wait(timeout=30)
+
+
+def imprimir(resultado: dict, anterior: dict = None):
+    def variacao(nome, campo, atual):
+        base = (anterior or {}).get('operacoes', {}).get(nome, {}).get(campo) if nome else (anterior or {}).get('total', {}).get(campo)
+        if not base or atual is None:
+            return ''
+        return f' ({(atual - base) / base * 100:+.0f}%)'
+    
+    print(f"{'operação':<30}{'req/s':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'bytes/req':>11}  status")
+    linhas = list(resultado['operacoes'].items()) + [('TOTAL', resultado['total'])]
+    for nome, dados in linhas:
+        chave = None if nome == 'TOTAL' else nome
+        status = ' '.join(f'{codigo}:{n}' for codigo, n in sorted(dados.get('status', {}).items()))
+        bytes_req = f"{dados['bytes_por_chamada']:>11.0f}" if 'bytes_por_chamada' in dados else f"{'':>11}"
+        print(f"{nome:<30}{dados['req_s']:>8.1f}{dados['p50_ms'] or 0:>10.2f}{dados['p95_ms'] or 0:>10.2f}"
+              f"{dados['p99_ms'] or 0:>10.2f}{bytes_req}  {status}")
+        if anterior:
+            print(f"{'':<30}{variacao(chave, 'req_s', dados['req_s']):>8}{variacao(chave, 'p50_ms', dados['p50_ms']):>10}"
+                  f"{variacao(chave, 'p95_ms', dados['p95_ms']):>10}{variacao(chave, 'p99_ms', dados['p99_ms']):>10}")
+    if anterior:
+        print(f"\ncomparado com {anterior.get('commit')} ({anterior.get('modo')}, {anterior.get('data')})")
+    if resultado['total']['inesperados']:
+        print(f"\n{resultado['total']['inesperados']} respostas com status inesperado")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modo', choices=('cliente', 'gunicorn'), default='cliente')
+    parser.add_argument('--clientes', type=int, default=4)
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--repeticoes', type=int, default=50,
+                        help='chamadas por operação na medição de crescimento (erro de até 4096/N bytes)')
+    parser.add_argument('--banco', help='banco de partida (é copiado; o original não é alterado)')
+    parser.add_argument('--saida', help='grava o resultado em JSON neste arquivo')
+    parser.add_argument('--comparar', help='JSON de uma execução anterior, para mostrar as variações')
+    args = parser.parse_args()
+    
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            anterior = json.load(arquivo)
+    
+    with tempfile.TemporaryDirectory() as pasta:
+        if args.banco:
+            copiar_banco(args.banco, os.path.join(pasta, 'osint_database.db'))
+        bruto = (rodar_cliente if args.modo == 'cliente' else rodar_gunicorn)(pasta, args)
+    
+    resultado = {
+        'commit': commit_atual(),
+        'data': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'modo': args.modo,
+        'clientes': args.clientes,
+        'segundos': args.segundos,
+        'banco': os.path.basename(args.banco) if args.banco else None,
+        'backend': 'postgresql' if POSTGRES else 'sqlite',
+        **resumir(bruto['amostras'], bruto['duracao'], bruto['crescimento'],
+                  {operacao[0]: operacao[4] for operacao in OPERACOES}),
+    }
+    imprimir(resultado, anterior)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+        print(f'\nresultado gravado em {args.saida}')
+
+
+if __name__ == '__main__':
+    main()
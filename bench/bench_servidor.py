@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Comparação de vazão: perfil antigo do Procfile x gunicorn.conf.py
+  antigo - gunicorn app:app (1 worker sync, sem threads)
+  novo   - gunicorn -c gunicorn.conf.py "app:create_app()" (gthread + preload)
+Cada servidor roda em um diretório temporário (banco novo). Clientes concorrentes
+fazem login e repetem uma mistura de rotas (estatísticas, histórico, perfil e busca
+por nome), uma conexão HTTP por requisição. Com --lentos N, N clientes a mais enviam
+o corpo das buscas aos poucos (--atraso segundos por requisição), como uma conexão
+móvel lenta ou uma chamada externa demorada: um worker sync fica preso a cada um deles.
+
+Uso: python bench/bench_servidor.py [--clientes 16] [--segundos 10] [--lentos 0] [--atraso 1]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PERFIS = (
+    ('antigo', ['app:app']),
+    ('novo', ['-c', os.path.join(RAIZ, 'gunicorn.conf.py'), 'app:create_app()']),
+)
+
+ROTAS = (
+    ('GET', '/api/estatisticas', None),
+    ('GET', '/api/historico?limit=20', None),
+    ('GET', '/api/user/profile', None),
+    ('POST', '/api/buscar/nome', {'nome': 'Fulano de Tal'}),
+)
+
+
+def percentil(valores, p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+def porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def requisitar(porta: int, metodo: str, caminho: str, corpo=None, cookie: str = None):
+    """Uma requisição em conexão nova; retorna (status, cabeçalhos)"""
+    conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+    cabecalhos = {'Connection': 'close'}
+    if cookie:
+        cabecalhos['Cookie'] = cookie
+    dados = None
+    if corpo is not None:
+        dados = json.dumps(corpo)
+        cabecalhos['Content-Type'] = 'application/json'
+    try:
+        conexao.request(metodo, caminho, body=dados, headers=cabecalhos)
+        resposta = conexao.getresponse()
+        resposta.read()
+        return resposta.status, resposta.getheaders()
+    finally:
+        conexao.close()
+
+
+def aguardar(porta: int, processo, prazo: float = 30):
+    fim = time.monotonic() + prazo
+    while time.monotonic() < fim:
+        if processo.poll() is not None:
+            raise RuntimeError('gunicorn terminou ao iniciar')
+        try:
+            requisitar(porta, 'GET', '/api/estatisticas')
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn não respondeu')
+
+
+def requisitar_lento(porta: int, atraso: float, cookie: str):
+    """POST /api/buscar/nome com o corpo enviado byte a byte ao longo de `atraso` segundos"""
+    corpo = json.dumps({'nome': 'Cliente Lento'}).encode()
+    cabecalho = (f'POST /api/buscar/nome HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n'
+                 f'Content-Type: application/json\r\nContent-Length: {len(corpo)}\r\nCookie: {cookie}\r\n\r\n')
+    with socket.create_connection(('127.0.0.1', porta), timeout=60) as s:
+        s.sendall(cabecalho.encode())
+        for i in range(len(corpo)):
+            s.sendall(corpo[i:i + 1])
+            time.sleep(atraso / len(corpo))
+        while s.recv(65536):
+            pass
+
+
+def rodar_carga(porta: int, clientes: int, segundos: float, lentos: int = 0, atraso: float = 1):
+    """Retorna (latências dos clientes normais em ms, erros, duração)"""
+    status, cabecalhos = requisitar(porta, 'POST', '/api/auth/login',
+                                    {'email': 'finmogg@gmail.com', 'senha': 'MOGG1212'})
+    assert status == 200, status
+    cookie = next(valor.split(';')[0] for nome, valor in cabecalhos if nome.lower() == 'set-cookie')
+    
+    fim = time.monotonic() + segundos
+    latencias = []
+    erros = [0]
+    lock = threading.Lock()
+    
+    def cliente(deslocamento: int):
+        locais, falhas, i = [], 0, deslocamento
+        while time.monotonic() < fim:
+            metodo, caminho, corpo = ROTAS[i % len(ROTAS)]
+            i += 1
+            inicio = time.perf_counter()
+            try:
+                status, _ = requisitar(porta, metodo, caminho, corpo, cookie)
+                if status != 200:
+                    falhas += 1
+            except OSError:
+                falhas += 1
+            locais.append((time.perf_counter() - inicio) * 1000)
+        with lock:
+            latencias.extend(locais)
+            erros[0] += falhas
+    
+    def cliente_lento():
+        while time.monotonic() < fim:
+            try:
+                requisitar_lento(porta, atraso, cookie)
+            except OSError:
+                pass
+    
+    threads = [threading.Thread(target=cliente, args=(n,)) for n in range(clientes)]
+    threads += [threading.Thread(target=cliente_lento) for _ in range(lentos)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencias, erros[0], time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clientes', type=int, default=16)
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--lentos', type=int, default=0)
+    parser.add_argument('--atraso', type=float, default=1)
+    args = parser.parse_args()
+    
+    gunicorn = shutil.which('gunicorn')
+    if not gunicorn:
+        sys.exit('gunicorn não encontrado (pip install -r requirements.txt)')
+    
+    print(f"{'perfil':<8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>10}{'erros':>7}")
+    for nome, argumentos in PERFIS:
+        with tempfile.TemporaryDirectory() as pasta:
+            porta = porta_livre()
+            # O limitador de taxa recusaria a carga, que sai toda de um único IP
+            ambiente = dict(os.environ, PORT=str(porta), RATE_LIMIT_ATIVO='0', SECRET_KEY='bench',
+                            PYTHONPATH=RAIZ)
+            processo = subprocess.Popen([gunicorn, '--bind', f'127.0.0.1:{porta}', '--log-level', 'warning',
+                                         '--access-logfile', '/dev/null', *argumentos],
+                                        cwd=pasta, env=ambiente)
+            try:
+                aguardar(porta, processo)
+                latencias, erros, duracao = rodar_carga(porta, args.clientes, args.segundos, args.lentos, args.atraso)
+            finally:
+                processo.terminate()
+                processo.wait(timeout=30)
+            print(f"{nome:<8}{len(latencias) / duracao:>9.0f}{percentil(latencias, 50):>9.1f}"
+                  f"{percentil(latencias, 95):>9.1f}{percentil(latencias, 99):>10.1f}{erros:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gerador de bancos sintéticos no formato do osint_database.db (apenas dados falsos)
+
+Cria o schema pelas migrações do Database e insere, em lotes de uma transação cada,
+milhões de linhas de ip_logs (com os rollups por hora/dia/total atualizados como na
+gravação real) e de historico_buscas (resultados em blobs, contadores por usuário),
+além de buscas por nome/processo/foto e usuários. As datas crescem com o id, como
+em produção, espalhadas pelos últimos --dias dias.
+
+Uso: python bench/gerar_dados.py --saida /tmp/grande.db [--ip-logs 5000000] [--historico 2000000]
+                                 [--linhas 100000] [--dias 365] [--semente 42]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+USER_AGENTS = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0',
+    'curl/8.4.0',
+)
+CAMINHOS = (('/', 'GET'), ('/api/historico', 'GET'), ('/api/estatisticas', 'GET'), ('/api/user/profile', 'GET'),
+            ('/api/buscar/nome', 'POST'), ('/api/buscar/processo', 'POST'), ('/api/buscar/foto', 'POST'))
+TIPOS = ('nome', 'processo', 'foto', 'cpf')
+
+
+def _datas(aleatorio: random.Random, n: int, dias: int):
+    """n datas em ordem crescente, espalhadas pelos últimos `dias` dias (formato do CURRENT_TIMESTAMP)"""
+    fim = datetime.now(timezone.utc).replace(tzinfo=None)
+    inicio = fim - timedelta(days=dias)
+    passo = (fim - inicio).total_seconds() / max(n, 1)
+    for i in range(n):
+        instante = inicio + timedelta(seconds=i * passo + aleatorio.random() * passo)
+        yield instante.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _em_lotes(linhas, lote: int):
+    bloco = []
+    for linha in linhas:
+        bloco.append(linha)
+        if len(bloco) >= lote:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+
+def gerar_ip_logs(db, n: int, aleatorio: random.Random, dias: int = 365, ips: int = 50000,
+                  lote: int = 50000, progresso=None):
+    """Insere n acessos em ip_logs e soma cada lote nos rollups, na mesma transação; no fim, consolida as horas"""
+    # Poucos IPs concentram a maior parte dos acessos, como em tráfego real
+    acumulados = list(itertools.accumulate(1 / (i + 1) for i in range(ips)))
+    enderecos = [f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}' for i in range(ips)]
+    
+    def linhas():
+        for data in _datas(aleatorio, n, dias):
+            ip = aleatorio.choices(enderecos, cum_weights=acumulados)[0]
+            caminho, metodo = aleatorio.choice(CAMINHOS)
+            yield (ip, aleatorio.choice(USER_AGENTS), caminho, metodo, None,
+                   f's{hash(ip) % 100000:05d}', None, None, data)
+    
+    feitas = 0
+    for bloco in _em_lotes(linhas(), lote):
+        with db.transacao('telemetria') as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO ip_logs (ip_address, user_agent, path, method, user_id, session_id, country, city, data_acesso)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', bloco)
+            db._atualizar_rollups_ip(cursor, ((r[0], r[8]) for r in bloco))
+        feitas += len(bloco)
+        if progresso:
+            progresso('ip_logs', feitas, n)
+    # Como em produção, só as horas da última janela ficam em ip_rollup_hora
+    db._consolidar_rollups_ip()
+
+
+def gerar_historico(db, n: int, aleatorio: random.Random, usuarios: int, dias: int = 365,
+                    resultados_distintos: int = 2000, lote: int = 50000, progresso=None):
+    """Insere n linhas em historico_buscas com o resultado em blobs (poucos conteúdos distintos)"""
+    with db.transacao() as conn:
+        cursor = conn.cursor()
+        hashes = [db._guardar_blob(cursor, json.dumps({
+            'tipo': TIPOS[i % 4],
+            'fontes': [{'nome': f'Fonte {j}', 'resultado': f'Resultado sintético {i}-{j}', 'url': f'https://exemplo.invalid/{i}/{j}'}
+                       for j in range(1 + i % 6)],
+        }, ensure_ascii=False)) for i in range(resultados_distintos)]
+        cursor.execute('SELECT id FROM usuarios')
+        ids_usuarios = [linha[0] for linha in cursor.fetchall()][:usuarios] or [None]
+    
+    def linhas():
+        for data in _datas(aleatorio, n, dias):
+            tipo = aleatorio.choice(TIPOS)
+            yield (tipo, f'termo {aleatorio.randrange(50000)}', aleatorio.choice(hashes), data,
+                   aleatorio.choice(ids_usuarios))
+    
+    feitas = 0
+    for bloco in _em_lotes(linhas(), lote):
+        with db.transacao() as conn:
+            conn.executemany('''
+                INSERT INTO historico_buscas (tipo_busca, termo_busca, resultado_hash, data_busca, usuario_id)
+                VALUES (?, ?, ?, ?, ?)
+            ''', bloco)
+        feitas += len(bloco)
+        if progresso:
+            progresso('historico_buscas', feitas, n)
+
+
+def gerar_dados(db, linhas: int, semente: int = 42, ip_logs: int = None, historico: int = None,
+                dias: int = 365, lote: int = 50000, progresso=None):
+    """
+    Preenche as tabelas principais com dados sintéticos (apenas dados falsos).
+    `linhas` vale para as tabelas de busca; ip_logs e historico usam o próprio total
+    (padrão: `linhas`). Usuários: linhas // 100 (mínimo 10).
+    """
+    aleatorio = random.Random(semente)
+    usuarios = max(linhas // 100, 10)
+    
+    with db.transacao() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            'INSERT INTO usuarios (email, nome, senha_hash, permissao, data_criacao) VALUES (?, ?, ?, ?, ?)',
+            ((f'usuario{i}@exemplo.invalid', f'Usuário {i}', 'x', 'user', d)
+             for i, d in enumerate(_datas(aleatorio, usuarios, dias))))
+    for tabela, colunas, valores in (
+        ('nome_buscas', 'nome, resultado, fonte, data_busca, tipo_busca',
+         lambda i, d: (f'Pessoa {i % 5000}', 'resultado', f'Fonte {i % 10}', d, 'nome')),
+        ('processo_buscas', 'numero_processo, resultado, fonte, data_busca, status',
+         lambda i, d: (f'{i:07d}-00.2024.8.26.0100', 'resultado', 'Sistema Judicial', d, 'pendente')),
+        ('foto_buscas', 'termo_busca, url_imagem, resultado, fonte, data_busca, hash_imagem',
+         lambda i, d: (f'termo {i % 3000}', '', 'resultado', 'Busca Reversa de Imagem', d, '')),
+    ):
+        marcadores = ', '.join('?' * (colunas.count(',') + 1))
+        for bloco in _em_lotes((valores(i, d) for i, d in enumerate(_datas(aleatorio, linhas, dias))), lote):
+            with db.transacao() as conn:
+                conn.executemany(f'INSERT INTO {tabela} ({colunas}) VALUES ({marcadores})', bloco)
+    
+    gerar_historico(db, linhas if historico is None else historico, aleatorio, usuarios, dias, lote=lote,
+                    progresso=progresso)
+    gerar_ip_logs(db, linhas if ip_logs is None else ip_logs, aleatorio, dias, lote=lote, progresso=progresso)
+    for banco in db.BANCOS:
+        with db.conexao(banco) as conn:
+            db._analisar(conn)
+
+
+def copiar_banco(origem: str, destino: str):
+    """Copia um banco gerado, com o de telemetria que o acompanha (se houver), para `destino`"""
+    from database import caminho_telemetria
+    shutil.copyfile(origem, destino)
+    if os.path.exists(caminho_telemetria(origem)):
+        shutil.copyfile(caminho_telemetria(origem), caminho_telemetria(destino))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--saida', required=True, help='arquivo a criar (não pode existir)')
+    parser.add_argument('--ip-logs', type=int, default=5000000)
+    parser.add_argument('--historico', type=int, default=2000000)
+    parser.add_argument('--linhas', type=int, default=100000, help='linhas de cada tabela de busca')
+    parser.add_argument('--dias', type=int, default=365)
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+    
+    saida = os.path.abspath(args.saida)
+    if os.path.exists(saida):
+        sys.exit(f'{saida} já existe; escolha outro caminho (o gerador nunca sobrescreve bancos)')
+    
+    from database import Database
+    db = Database(saida)
+    # Carga inicial: sem fsync por transação (um arquivo novo pode ser refeito se a carga falhar)
+    for banco in db.BANCOS:
+        with db.conexao(banco) as conn:
+            conn.execute('PRAGMA synchronous = OFF')
+    
+    inicio = time.perf_counter()
+    ultimo = [0.0]
+    
+    def progresso(tabela, feitas, total):
+        if time.perf_counter() - ultimo[0] > 5 or feitas == total:
+            ultimo[0] = time.perf_counter()
+            taxa = feitas / max(ultimo[0] - inicio, 1e-9)
+            print(f'{tabela:<18}{feitas:>12,}/{total:,}  ({taxa:,.0f} linhas/s acumuladas)', flush=True)
+    
+    gerar_dados(db, args.linhas, args.semente, ip_logs=args.ip_logs, historico=args.historico,
+                dias=args.dias, progresso=progresso)
+    for banco in db.BANCOS:
+        with db.conexao(banco) as conn:
+            # main: na conexão principal, sem esquema o PRAGMA também tentaria o anexo só de leitura
+            conn.execute('PRAGMA main.wal_checkpoint(TRUNCATE)')
+    db.fechar_conexoes()
+    
+    tamanho = os.path.getsize(saida) + os.path.getsize(db.caminho_telemetria)
+    print(f'\n{saida}: {tamanho / 1e6:,.1f} MB (com {os.path.basename(db.caminho_telemetria)}) '
+          f'em {time.perf_counter() - inicio:,.1f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Orçamento de imports do boot de um worker (python -X importtime)
+
+Roda "import app; app.create_app()" em um processo novo, com o schema já criado
+(como em todo boot depois do primeiro), e analisa a saída do -X importtime.
+Falha (exit 1) se algum módulo de integração opcional for importado no boot, se o
+tempo de import do app passar do orçamento, ou se "import app" sozinho (sem
+create_app) abrir um banco, ou se create_app ignorar o DATABASE_PATH do config.
+
+Uso: python bench/verificar_imports.py [--orcamento-ms 400] [--top 15]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CODIGO = 'import app; app.create_app()'
+# Só o import: nenhum arquivo de banco pode aparecer; depois o banco vem do config
+CODIGO_PREGUICOSO = (
+    "import os, app; assert not [a for a in os.listdir() if a.endswith('.db')], os.listdir(); "
+    "app.create_app({'DATABASE_PATH': 'config.db'}); assert sorted(a for a in os.listdir() if a.endswith('.db')) "
+    "== ['config.db', 'config_telemetria.db'], os.listdir()"
+)
+
+# Módulos que só caminhos específicos usam e devem ser importados no primeiro uso
+PROIBIDOS = {
+    'cpf_api': 'consulta de CPF (OSINTTools.cpf_api)',
+    'requests': 'APIs de CPF (cpf_api)',
+    'urllib3': 'APIs de CPF (via requests)',
+    'dotenv': '.env das APIs de CPF (cpf_api)',
+    'authlib': 'OAuth do Google (auth.init_oauth)',
+}
+
+
+def medir(pasta: str):
+    """Retorna [(módulo, tempo próprio µs, acumulado µs, nível)] na ordem do importtime"""
+    ambiente = dict(os.environ, PYTHONPATH=RAIZ)
+    saida = subprocess.run([sys.executable, '-X', 'importtime', '-c', CODIGO], cwd=pasta, env=ambiente,
+                           capture_output=True, text=True, check=True)
+    modulos = []
+    for linha in saida.stderr.splitlines():
+        if not linha.startswith('import time:') or 'self [us]' in linha:
+            continue
+        proprio, acumulado, nome = linha[len('import time:'):].split('|')
+        nivel = (len(nome) - len(nome.lstrip(' ')) - 1) // 2
+        modulos.append((nome.strip(), int(proprio), int(acumulado), nivel))
+    return modulos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orcamento-ms', type=float, default=400)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+    
+    falhas = []
+    with tempfile.TemporaryDirectory() as pasta:
+        ambiente = dict(os.environ, PYTHONPATH=RAIZ)
+        ambiente.pop('DATABASE_URL', None)
+        preguicoso = subprocess.run([sys.executable, '-c', CODIGO_PREGUICOSO], cwd=pasta, env=ambiente,
+                                    capture_output=True, text=True)
+        if preguicoso.returncode:
+            falhas.append(f'banco aberto no import ou fora do config: {preguicoso.stderr.strip().splitlines()[-1]}')
+    
+    with tempfile.TemporaryDirectory() as pasta:
+        medir(pasta)  # primeiro boot: cria o banco
+        modulos = medir(pasta)
+    
+    # O importtime lista os filhos antes do pai: a subárvore do app é o bloco que termina na
+    # linha dele (o que o site/.pth importa antes não conta)
+    fim = next(i for i, (nome, _, _, nivel) in enumerate(modulos) if nome == 'app' and nivel == 0)
+    inicio = fim
+    while inicio > 0 and modulos[inicio - 1][3] > 0:
+        inicio -= 1
+    total = modulos[fim][2] / 1000
+    modulos = modulos[inicio:fim + 1]
+    print(f'import app: {total:.1f} ms (orçamento {args.orcamento_ms:.0f} ms)\n')
+    print(f"{'módulo (direto do app)':<32}{'acumulado ms':>14}")
+    diretos = sorted((m for m in modulos if m[3] == 1), key=lambda m: -m[2])
+    for nome, _, acumulado, _ in diretos[:args.top]:
+        print(f'{nome:<32}{acumulado / 1000:>14.1f}')
+    
+    importados = {nome for nome, _, _, _ in modulos}
+    for modulo, uso in PROIBIDOS.items():
+        if modulo in importados:
+            falhas.append(f'{modulo} importado no boot (só {uso} precisa dele)')
+    if total > args.orcamento_ms:
+        falhas.append(f'import app levou {total:.1f} ms, acima do orçamento de {args.orcamento_ms:.0f} ms')
+    for falha in falhas:
+        print(f'FALHA: {falha}')
+    sys.exit(1 if falhas else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Verificação da matemática dos token buckets e das decisões do limitador
+Usa instantes explícitos (sem relógio real) para reposição, espera e recusa; depois
+confere as respostas 429/503 com Retry-After pelo test client do Flask.
+
+Uso: python bench/verificar_limitador.py
+"""
+
+import os
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from limitador import BaldeTokens, LimitadorTaxa
+
+
+def verificar_balde():
+    balde = BaldeTokens(capacidade=10, taxa=2, agora=0.0)
+    # Começa cheio: 10 tokens
+    assert balde.consumir(4, 0.0) == 0 and balde.tokens == 6
+    assert balde.consumir(6, 0.0) == 0 and balde.tokens == 0
+    # Vazio: 3 tokens a 2/s levam 1,5 s, e a recusa não debita
+    assert balde.consumir(3, 0.0) == 1.5 and balde.tokens == 0
+    # Após 1 s há 2 tokens: faltam 1 token = 0,5 s
+    assert balde.consumir(3, 1.0) == 0.5 and balde.tokens == 2
+    assert balde.consumir(3, 1.5) == 0 and balde.tokens == 0
+    # A reposição para na capacidade
+    assert balde.espera(1, 100.0) == 0 and balde.tokens == 10
+    # Custo acima da capacidade nunca é atendido
+    assert balde.consumir(11, 100.0) == float('inf') and balde.tokens == 10
+    # Relógio que volta não gera tokens
+    balde.consumir(10, 100.0)
+    assert balde.espera(1, 99.0) == 0.5 and balde.tokens == 0
+
+
+def verificar_limitador():
+    limitador = LimitadorTaxa(ativo=True, capacidade_ip=10, taxa_ip=1, capacidade_sessao=6, taxa_sessao=1)
+    assert limitador.custo('/api/buscar/nome') == 5 and limitador.custo('/') == 1
+    # Rotas isentas não consomem
+    assert all(limitador.admitir('/static/app.js', '1.1.1.1', 's') is None for _ in range(100))
+    # Sessão (6 tokens) esgota antes do IP (10): uma busca passa, a segunda recebe 429
+    assert limitador.admitir('/api/buscar/nome', '1.1.1.1', 's') is None
+    status, retry_after = limitador.admitir('/api/buscar/nome', '1.1.1.1', 's')
+    assert status == 429 and retry_after == 4, (status, retry_after)
+    # A recusa não debitou o IP: ainda restam 5 tokens para outra sessão
+    assert limitador.admitir('/api/buscar/nome', '1.1.1.1', 'outra') is None
+    assert limitador.admitir('/', '1.1.1.1', 'terceira')[0] == 429
+    # Outro IP tem o próprio balde
+    assert limitador.admitir('/api/buscar/nome', '2.2.2.2', None) is None
+    # Sobrecarga descarta só as rotas de baixa prioridade
+    limitador.em_andamento = limitador.limite_em_andamento + 1
+    assert limitador.admitir('/api/estatisticas', '3.3.3.3', None)[0] == 503
+    assert limitador.admitir('/api/buscar/nome', '3.3.3.3', None) is None
+    limitador.em_andamento = 0
+    limitador.finalizar(limitador.limite_latencia * 20)
+    assert limitador.sobrecarregado()
+    limitador._latencia_em -= 10
+    assert not limitador.sobrecarregado()
+    # Limite de baldes em memória (LRU)
+    pequeno = LimitadorTaxa(ativo=True, max_baldes=3)
+    for i in range(10):
+        pequeno.admitir('/', f'10.0.0.{i}', None)
+    assert list(pequeno._baldes) == ['ip:10.0.0.7', 'ip:10.0.0.8', 'ip:10.0.0.9']
+
+
+def verificar_rotas():
+    with tempfile.TemporaryDirectory() as pasta:
+        os.chdir(pasta)
+        import middleware
+        from app import app, create_app
+        
+        middleware.limitador = LimitadorTaxa(ativo=True, capacidade_ip=12, taxa_ip=0.5)
+        cliente = app.test_client()
+        status = [cliente.post('/api/buscar/nome', json={'nome': 'Fulano'}).status_code for _ in range(3)]
+        assert status == [200, 200, 429], status
+        resposta = cliente.post('/api/buscar/nome', json={'nome': 'Fulano'})
+        assert resposta.status_code == 429 and resposta.headers['Retry-After'] == '6', resposta.headers
+        assert middleware.limitador.em_andamento == 0
+        # X-Forwarded-For vem do cliente: trocar o valor não dá um balde novo
+        outro = app.test_client()
+        resposta = outro.post('/api/buscar/nome', json={'nome': 'Fulano'}, headers={'X-Forwarded-For': '9.9.9.9'})
+        assert resposta.status_code == 429, resposta.status_code
+        # Cliente anônimo novo já tem balde de sessão na primeira requisição
+        middleware.limitador = LimitadorTaxa(ativo=True)
+        anonimo = app.test_client()
+        anonimo.get('/')
+        with anonimo.session_transaction() as sessao:
+            assert f"sessao:{sessao['session_id']}" in middleware.limitador._baldes
+        # Atrás de um proxy confiável (PROXY_SALTOS=1) vale o IP que ele informou
+        atras_proxy = create_app({'PROXY_SALTOS': 1}).test_client()
+        atras_proxy.get('/', headers={'X-Forwarded-For': '7.7.7.7, 8.8.8.8'})
+        assert 'ip:8.8.8.8' in middleware.limitador._baldes and 'ip:7.7.7.7' not in middleware.limitador._baldes
+        
+        middleware.limitador = LimitadorTaxa(ativo=True, limite_em_andamento=1)
+        middleware.limitador.em_andamento = 5
+        resposta = cliente.get('/api/estatisticas')
+        assert resposta.status_code == 503 and 'Retry-After' in resposta.headers
+        
+        middleware.gravador_acessos.parar()
+        middleware.db.fechar_conexoes()
+        os.chdir(RAIZ)
+
+
+def main():
+    for verificacao in (verificar_balde, verificar_limitador, verificar_rotas):
+        verificacao()
+        print(f'[ok] {verificacao.__name__}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Verificação do agendador de manutenção (manutencao.AgendadorManutencao)
+1) Vários processos, como os workers do gunicorn, acordam no mesmo instante e chamam
+   executar(): só um obtém a reserva do intervalo e faz a passada; de novo no mesmo
+   intervalo, nenhum a faz. Uma reserva vencida pelo prazo volta a ficar disponível.
+2) Com um arquivamento lento em andamento, a fila do GravadorAcessos continua sendo gravada.
+
+Uso: python bench/verificar_manutencao.py [--processos 8]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def trabalhar(caminho: str, inicio, resultados):
+    """Processo worker: espera o sinal e tenta fazer a passada duas vezes no mesmo intervalo"""
+    from database import Database
+    from manutencao import AgendadorManutencao
+    agendador = AgendadorManutencao(Database(caminho), intervalo_s=3600, retencao_dias=1, arquivo_dias=1)
+    inicio.wait()
+    resultados.put((agendador.executar(), agendador.executar()))
+    agendador.db.fechar_conexoes()
+
+
+def verificar_reserva(pasta: str, processos: int):
+    from database import Database
+    caminho = os.path.join(pasta, 'reserva.db')
+    Database(caminho).fechar_conexoes()
+    
+    contexto = multiprocessing.get_context('spawn')
+    inicio, resultados = contexto.Event(), contexto.Queue()
+    filhos = [contexto.Process(target=trabalhar, args=(caminho, inicio, resultados)) for _ in range(processos)]
+    for filho in filhos:
+        filho.start()
+    time.sleep(2)
+    inicio.set()
+    passadas = [resultados.get(timeout=120) for _ in filhos]
+    for filho in filhos:
+        filho.join()
+    primeiras = [primeira for primeira, _ in passadas if primeira is not None]
+    assert len(primeiras) == 1, passadas
+    assert all(segunda is None for _, segunda in passadas), passadas
+    
+    # Reserva presa por um processo que morreu: vale até o prazo
+    db = Database(caminho)
+    proxima = datetime.now(timezone.utc) + timedelta(hours=1)
+    with db.conexao() as conn:
+        conn.execute("UPDATE tarefas SET proxima_execucao = '2000-01-01 00:00:00', em_execucao_ate = ?, dono = 'morto'",
+                     ((datetime.now(timezone.utc) + timedelta(seconds=1)).strftime('%Y-%m-%d %H:%M:%S'),))
+    assert not db.reservar_tarefa('manutencao', proxima, 60)
+    time.sleep(2.1)
+    assert db.reservar_tarefa('manutencao', proxima, 60)
+    db.concluir_tarefa('manutencao')
+    db.fechar_conexoes()
+
+
+def verificar_fila(pasta: str):
+    from database import Database
+    from access_log import GravadorAcessos
+    from manutencao import AgendadorManutencao
+    
+    class ArquivoLento(Database):
+        def arquivar(self, dias=None, lote=5000):
+            time.sleep(3)
+            return {}
+    
+    db = ArquivoLento(os.path.join(pasta, 'fila.db'))
+    agendador = AgendadorManutencao(db, intervalo_s=3600, arquivo_dias=1)
+    gravador = GravadorAcessos(db, modo='async', intervalo_ms=50)
+    passada = threading.Thread(target=agendador.executar)
+    passada.start()
+    time.sleep(0.2)
+    assert agendador.em_andamento
+    for i in range(2000):
+        gravador.registrar(f'10.1.{i // 256}.{i % 256}', 'bench', '/', 'GET')
+    prazo = time.monotonic() + 2
+    while gravador.gravados < 2000 and time.monotonic() < prazo:
+        time.sleep(0.05)
+    assert agendador.em_andamento and gravador.gravados == 2000, gravador.estatisticas()
+    passada.join()
+    gravador.parar()
+    db.fechar_conexoes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processos', type=int, default=8)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as pasta:
+        verificar_reserva(pasta, args.processos)
+        print('[ok] verificar_reserva')
+        verificar_fila(pasta)
+        print('[ok] verificar_fila')
+
+
+if __name__ == '__main__':
+    main()
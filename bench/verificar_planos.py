@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Verificação de regressão de planos de consulta (EXPLAIN QUERY PLAN)
+
+Gera um banco sintético grande, exercita todas as rotas do app e os métodos
+de leitura do Database capturando o SQL realmente executado (trace callback)
+e roda EXPLAIN QUERY PLAN em cada consulta. Falha (exit 1) se alguma consulta
+percorrer uma tabela inteira: SCAN sem índice, SCAN por índice sem LIMIT ou
+ordenação em B-tree temporária.
+
+Uso: python bench/verificar_planos.py [--linhas 200000]
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+# Todas as requisições saem do mesmo IP/sessão; o limitador de taxa recusaria parte das chamadas
+os.environ.setdefault('RATE_LIMIT_ATIVO', '0')
+
+from gerar_dados import gerar_dados
+
+# Varreduras conhecidas e ainda não resolvidas: (regex do SQL, motivo)
+# Toda entrada aqui é uma dívida; remova-a quando a consulta deixar de varrer a tabela.
+PENDENTES = [
+    (r'FROM usuarios ORDER BY data_criacao DESC$', 'listagem completa de usuários'),
+]
+
+# Tabelas de tamanho fixo e pequeno, em que uma varredura é o plano certo
+# (ip_rollup_hora guarda só a última janela de horas, ver _consolidar_rollups_ip)
+TABELAS_PEQUENAS = {'contadores', 'schema_version', 'arquivos', 'ip_rollup_hora'}
+
+IGNORADAS = re.compile(r'^\s*(PRAGMA|BEGIN|COMMIT|ROLLBACK|INSERT|CREATE|ANALYZE)|schema_version|sqlite_master', re.I)
+
+
+def problemas_do_plano(conn, sql: str):
+    """Retorna as linhas do plano que indicam varredura completa"""
+    plano = conn.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()
+    tem_limite = re.search(r'\bLIMIT\b', sql, re.I) is not None
+    problemas = []
+    for linha in plano:
+        detalhe = linha[-1]
+        if detalhe.startswith('SCAN') and detalhe.split()[1] in TABELAS_PEQUENAS:
+            continue
+        if detalhe.startswith('SCAN') and not ('USING' in detalhe and tem_limite):
+            problemas.append(detalhe)
+        elif 'USE TEMP B-TREE' in detalhe:
+            problemas.append(detalhe)
+    return problemas
+
+
+def exercitar_app(db):
+    """Chama todas as rotas de leitura do app e os métodos de leitura do Database"""
+    import app as modulo_app
+    
+    cliente = modulo_app.create_app().test_client()
+    cliente.post('/api/auth/register', json={'email': 'planos@exemplo.invalid', 'nome': 'Planos', 'senha': 'senha123'})
+    cliente.post('/api/auth/login', json={'email': 'finmogg@gmail.com', 'senha': 'MOGG1212'})
+    cliente.post('/api/buscar/nome', json={'nome': 'Pessoa 1'})
+    for rota in ('/api/historico', '/api/historico?tipo=nome&termo=Pessoa',
+                 '/api/historico?tipo=processo&termo=0000', '/api/historico?tipo=foto&termo=termo',
+                 '/api/estatisticas', '/api/user/profile', '/api/admin/ips?limit=100',
+                 '/api/admin/ips/stats', '/api/admin/usuarios', '/api/admin/arquivos'):
+        with cliente.get(rota) as resposta:
+            assert resposta.status_code == 200, (rota, resposta.status_code)
+    # Segunda página (keyset) do histórico e dos IPs
+    for rota in ('/api/historico?limit=20', '/api/historico?tipo=nome&termo=Pessoa&limit=20',
+                 '/api/admin/ips?limit=20'):
+        with cliente.get(rota) as resposta:
+            cursor = resposta.get_json()['next_cursor']
+        assert cursor, rota
+        with cliente.get(f'{rota}&cursor={cursor}') as resposta:
+            assert resposta.status_code == 200, (rota, resposta.status_code)
+            assert resposta.get_json()['itens'], rota
+    # Exportações: o banco inteiro (passa de um segmento) e um intervalo de datas
+    for rota in ('/api/admin/export/ips', '/api/admin/export/historico?formato=csv&desde=2025-03-01&ate=2025-09-01'):
+        with cliente.get(rota) as resposta:
+            assert resposta.status_code == 200, (rota, resposta.status_code)
+            resposta.get_data()
+    # Página que começa nos meses arquivados e uma busca arquivada (id 1 é a mais antiga)
+    antigo = (datetime.now(timezone.utc) - timedelta(days=200)).strftime('%Y-%m-%d %H:%M:%S')
+    with cliente.get(f'/api/historico?limit=20&cursor={modulo_app.codificar_cursor(antigo, 0)}') as resposta:
+        assert resposta.get_json()['itens'], 'página arquivada vazia'
+    assert db.obter_resultado_historico(1), 'busca arquivada não encontrada'
+    # Limpeza de um intervalo (banco principal e um mês arquivado) e retenção de ip_logs
+    db.limpar_banco('historico_buscas', desde=antigo, ate=(datetime.now(timezone.utc) - timedelta(days=170)).strftime('%Y-%m-%d'))
+    db.podar_ip_logs(300)
+    db.obter_info_banco()
+    db.obter_usuario_por_email('usuario1@exemplo.invalid')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--linhas', type=int, default=200000)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as pasta:
+        os.chdir(pasta)
+        from database import obter_database
+        db = obter_database()
+        gerar_dados(db, args.linhas)
+        
+        capturadas = []
+        # Os dois bancos: as gravações de telemetria usam a conexão própria, e cada consulta tem o
+        # plano conferido na conexão em que rodou
+        for banco in db.BANCOS:
+            with db.conexao(banco) as conn:
+                conn.set_trace_callback(lambda sql, banco=banco: capturadas.append((banco, sql)))
+        # Fora de um bloco conexao(): as limpezas em lotes fazem commit entre os lotes
+        try:
+            # Os meses mais antigos vão para os arquivos mensais; as leituras passam a anexá-los
+            db.arquivar(180)
+            exercitar_app(db)
+        finally:
+            for banco in db.BANCOS:
+                with db.conexao(banco) as conn:
+                    conn.set_trace_callback(None)
+        consultas = []
+        for banco, sql in capturadas:
+            sql = ' '.join(sql.split())
+            if not IGNORADAS.search(sql) and (banco, sql) not in consultas:
+                consultas.append((banco, sql))
+        
+        falhas = 0
+        for banco, sql in consultas:
+            with db.conexao(banco) as conn:
+                problemas = problemas_do_plano(conn, sql)
+            pendente = next((motivo for padrao, motivo in PENDENTES if re.search(padrao, sql)), None)
+            if not problemas:
+                estado = 'ok'
+            elif pendente:
+                estado = f'PENDENTE ({pendente})'
+            else:
+                estado = 'FALHA'
+                falhas += 1
+            print(f'[{estado}] {sql[:110]}')
+            for detalhe in problemas:
+                print(f'      {detalhe}')
+        import auth_system
+        import middleware
+        auth_system.buffer_ultimo_acesso.parar()
+        middleware.gravador_acessos.parar()
+        db.fechar_conexoes()
+        os.chdir(RAIZ)
+    
+    print(f'\n{len(consultas)} consultas verificadas, {falhas} regressões')
+    sys.exit(1 if falhas else 0)
+
+
+if __name__ == '__main__':
+    main()
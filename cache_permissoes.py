@@ -0,0 +1,112 @@
+"""
+Cache em memória das permissões de usuários (TTL + LRU), por id de usuário
+Evita uma consulta a usuarios em cada is_admin/has_permission. A invalidação entre
+processos usa a versão 'permissoes' da tabela versoes, incrementada por
+Database.atualizar_permissao; cada processo relê essa versão no máximo uma vez
+a cada PERMISSOES_VERSAO_INTERVALO_MS e descarta o cache quando ela muda.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+class CachePermissoes:
+    def __init__(self, db=None, ttl_s: float = None, max_itens: int = None, intervalo_versao_ms: int = None):
+        self.db = db
+        # Configuração via variáveis de ambiente, com os argumentos tendo precedência
+        self.ttl = ttl_s if ttl_s is not None else float(os.getenv('PERMISSOES_CACHE_TTL_S', 60))
+        self.max_itens = max_itens or int(os.getenv('PERMISSOES_CACHE_MAX', 10000))
+        self.intervalo_versao = (intervalo_versao_ms if intervalo_versao_ms is not None
+                                 else int(os.getenv('PERMISSOES_VERSAO_INTERVALO_MS', 1000))) / 1000
+        
+        # usuario_id -> (email, permissao, expira_em); permissao None = usuário inexistente
+        self._itens = OrderedDict()
+        self._versao = None
+        # Incrementada a cada limpeza, para não gravar um valor lido antes dela
+        self._geracao = 0
+        self._proxima_verificacao = 0.0
+        self._lock = threading.Lock()
+        
+        self.acertos = 0
+        self.falhas = 0
+        self.invalidacoes = 0
+    
+    def _verificar_versao(self, agora: float):
+        """
+        Relê a versão compartilhada (no máximo uma vez por intervalo) e limpa o cache se mudou.
+        A leitura fica fora do lock: só a thread que reservou o intervalo vai ao banco, e as
+        outras seguem com o cache atual em vez de esperarem por ela (até o busy_timeout).
+        """
+        if agora < self._proxima_verificacao:
+            return
+        with self._lock:
+            if agora < self._proxima_verificacao:
+                return
+            self._proxima_verificacao = agora + self.intervalo_versao
+        versao = self.db.obter_versao('permissoes')
+        with self._lock:
+            if versao != self._versao:
+                if self._versao is not None:
+                    self.invalidacoes += 1
+                self._itens.clear()
+                self._geracao += 1
+                self._versao = versao
+    
+    def permissao(self, usuario_id: Optional[int], email: str) -> Optional[str]:
+        """Permissão do usuário (None se não existir); consulta o banco só em falta de cache"""
+        if usuario_id is None:
+            # Sem id não há chave de cache: consulta direta
+            usuario = self.db.obter_usuario_por_email(email)
+            return usuario.get('permissao') if usuario else None
+        
+        agora = time.monotonic()
+        self._verificar_versao(agora)
+        with self._lock:
+            item = self._itens.get(usuario_id)
+            if item and item[0] == email and item[2] > agora:
+                self._itens.move_to_end(usuario_id)
+                self.acertos += 1
+                return item[1]
+            self.falhas += 1
+            geracao = self._geracao
+        
+        usuario = self.db.obter_usuario_por_email(email)
+        permissao = usuario.get('permissao') if usuario and usuario.get('id') == usuario_id else None
+        
+        with self._lock:
+            if geracao != self._geracao:
+                return permissao
+            self._itens[usuario_id] = (email, permissao, agora + self.ttl)
+            self._itens.move_to_end(usuario_id)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+        return permissao
+    
+    def reiniciar_apos_fork(self):
+        """No processo filho: lock novo e cache vazio"""
+        self._lock = threading.Lock()
+        self._itens = OrderedDict()
+        self._versao = None
+        self._proxima_verificacao = 0.0
+    
+    def invalidar(self, usuario_id: int = None):
+        """Descarta um usuário (ou todo o cache) neste processo; os demais seguem a versão do banco"""
+        with self._lock:
+            if usuario_id is None:
+                self._itens.clear()
+                self._geracao += 1
+            else:
+                self._itens.pop(usuario_id, None)
+            self.invalidacoes += 1
+    
+    def estatisticas(self) -> Dict:
+        """Contadores do cache, para diagnóstico"""
+        with self._lock:
+            return {
+                'itens': len(self._itens),
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'invalidacoes': self.invalidacoes,
+                'versao': self._versao,
+            }
@@ -0,0 +1,109 @@
+"""
+Cache de respostas das rotas de leitura consultadas em polling pelos painéis
+A chave é a rota mais os argumentos relevantes; cada entrada guarda as gerações dos
+domínios de escrita do Database (Database.geracao) no momento em que foi calculada e
+deixa de valer quando alguma delas muda ou após RESPOSTA_CACHE_TTL_S segundos (o TTL
+cobre escritas feitas por outros processos, que não alteram as gerações deste).
+As respostas levam ETag (hash do corpo, igual entre workers); If-None-Match que casa
+com uma entrada válida recebe 304 sem consultar o banco.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Optional, Sequence
+
+from flask import request, make_response, Response
+
+class CacheRespostas:
+    def __init__(self, db=None, ttl_s: float = None, max_itens: int = None):
+        self.db = db
+        # Configuração via variáveis de ambiente, com os argumentos tendo precedência;
+        # RESPOSTA_CACHE_TTL_S=0 desativa o cache (ETag e 304 continuam)
+        self.ttl = ttl_s if ttl_s is not None else float(os.getenv('RESPOSTA_CACHE_TTL_S', 5))
+        self.max_itens = max_itens or int(os.getenv('RESPOSTA_CACHE_MAX', 512))
+        
+        # chave -> (gerações, expira_em, corpo, mimetype, etag)
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self.acertos = 0
+        self.falhas = 0
+        self.nao_modificadas = 0
+    
+    def _obter(self, chave: tuple, geracoes: tuple):
+        """Entrada válida para a chave nas gerações atuais, ou None"""
+        with self._lock:
+            item = self._itens.get(chave)
+            if item and item[0] == geracoes and item[1] > time.monotonic():
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return item
+            self.falhas += 1
+            return None
+    
+    def _guardar(self, chave: tuple, item: tuple):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._itens[chave] = item
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+    
+    def em_cache(self, dominios: Sequence[str], argumentos: Sequence[str] = (),
+                 condicao: Optional[Callable[[], bool]] = None):
+        """
+        Decorator de rota: guarda respostas 200 por (rota, argumentos) enquanto as gerações
+        de `dominios` não mudarem (sem domínios, só até o TTL). `condicao`, se informada, decide
+        por requisição se o cache se aplica (ex.: só o histórico sem termo de busca).
+        Deve ficar abaixo de decorators de autenticação, que precisam rodar antes.
+        """
+        def decorador(f):
+            @wraps(f)
+            def envolvida(*args, **kwargs):
+                if condicao is not None and not condicao():
+                    return f(*args, **kwargs)
+                
+                chave = (request.path,) + tuple(request.args.get(nome, '') for nome in argumentos)
+                # Gerações lidas antes de calcular: uma escrita concorrente invalida o resultado
+                geracoes = tuple(self.db.geracao(dominio) for dominio in dominios)
+                item = self._obter(chave, geracoes)
+                if item is None:
+                    resposta = make_response(f(*args, **kwargs))
+                    if resposta.status_code != 200:
+                        return resposta
+                    corpo = resposta.get_data()
+                    etag = hashlib.sha1(corpo).hexdigest()
+                    item = (geracoes, time.monotonic() + self.ttl, corpo, resposta.mimetype, etag)
+                    self._guardar(chave, item)
+                
+                _, _, corpo, mimetype, etag = item
+                if etag in request.if_none_match:
+                    with self._lock:
+                        self.nao_modificadas += 1
+                    resposta = Response(status=304)
+                else:
+                    resposta = Response(corpo, mimetype=mimetype)
+                resposta.set_etag(etag)
+                # O navegador guarda a resposta, mas revalida (If-None-Match) a cada uso
+                resposta.headers['Cache-Control'] = 'private, no-cache'
+                return resposta
+            return envolvida
+        return decorador
+    
+    def reiniciar_apos_fork(self):
+        """No processo filho: lock novo (as entradas herdadas continuam válidas)"""
+        self._lock = threading.Lock()
+    
+    def estatisticas(self) -> dict:
+        """Contadores do cache, para diagnóstico"""
+        with self._lock:
+            return {
+                'itens': len(self._itens),
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'nao_modificadas': self.nao_modificadas,
+            }
@@ -2,20 +2,32 @@
 Módulo para integração com APIs reais de consulta de CPF
 Suporta múltiplos provedores de API
 """
-import requests
 import os
 from typing import Dict, Optional
 import json
 
-# Tentar carregar variáveis de ambiente de arquivo .env
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-except ImportError:
-    pass  # python-dotenv não instalado, usar apenas variáveis de ambiente do sistema
+# requests e o .env só são carregados no primeiro CPFAPIClient: a maioria dos workers
+# nunca consulta CPF e importar requests custa ~100 ms no boot
+requests = None
+
+def _carregar_dependencias():
+    """Importa requests e carrega o .env (uma vez, antes de ler as configurações)"""
+    global requests
+    if requests is not None:
+        return
+    # Tentar carregar variáveis de ambiente de arquivo .env
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass  # python-dotenv não instalado, usar apenas variáveis de ambiente do sistema
+    import requests as modulo_requests
+    requests = modulo_requests
 
 class CPFAPIClient:
     def __init__(self):
+        _carregar_dependencias()
+        
         # Configurações de API (definir em variáveis de ambiente)
         self.serasa_api_key = os.getenv('SERASA_API_KEY', '')
         self.serasa_api_url = os.getenv('SERASA_API_URL', 'https://api.serasa.com.br/v1/consulta-cpf')
@@ -1,22 +1,317 @@
 import sqlite3
 import os
-from datetime import datetime
-from typing import List, Dict, Optional
+import functools
+import hashlib
+import itertools
+import operator
+import random
+import re
+import socket
+import threading
+import time
+import urllib.parse
+import zlib
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from contextlib import closing, contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Dict, Iterable, Iterator, Optional, Tuple
+from hyperloglog import HyperLogLog
+from metricas import metricas, ConexaoMedida
 
-class Database:
-    def __init__(self, db_name: str = "osint_database.db"):
-        self.db_name = db_name
-        self.init_database()
+def _intercalar(fontes: List[Tuple[Optional[str], Callable[[], Iterable]]], chave: Callable,
+                decrescente: bool = False) -> Iterator:
+    """
+    Intercala sequências já ordenadas por `chave` (data, id) em uma só, na mesma ordem.
+    `fontes`: [(limite, abrir)], em que `limite` é a data da primeira linha que a fonte pode
+    entregar (None = qualquer uma) e abrir() cria o iterador. Uma fonte só é aberta quando
+    sua primeira linha pode ser a próxima da sequência, e a mesma chave vinda de duas fontes
+    (lote já copiado para o arquivo e ainda não apagado do banco principal) sai uma vez só.
+    """
+    depois = operator.lt if decrescente else operator.gt
+    melhor = max if decrescente else min
+    pendentes = [fonte for fonte in fontes if fonte[0] is None]
+    pendentes += sorted((fonte for fonte in fontes if fonte[0] is not None), key=operator.itemgetter(0),
+                        reverse=decrescente)
+    pendentes.reverse()  # a próxima fonte a abrir fica no fim
+    ativas = []  # [chave da linha atual, linha, iterador]
+    anterior = None
+    try:
+        while True:
+            atual = melhor(ativas, key=operator.itemgetter(0)) if ativas else None
+            limite = pendentes[-1][0] if pendentes else None
+            if pendentes and (atual is None or limite is None or not depois(limite, atual[0][0])):
+                iterador = iter(pendentes.pop()[1]())
+                linha = next(iterador, None)
+                if linha is not None:
+                    ativas.append([chave(linha), linha, iterador])
+                continue
+            if atual is None:
+                return
+            if atual[0] != anterior:
+                anterior = atual[0]
+                yield atual[1]
+            if len(ativas) == 1:
+                # Sozinha, a fonte segue sem comparações até a data em que a próxima pode começar
+                for linha in atual[2]:
+                    chave_linha = chave(linha)
+                    if pendentes and not depois(pendentes[-1][0], chave_linha[0]):
+                        atual[0], atual[1] = chave_linha, linha
+                        break
+                    anterior = chave_linha
+                    yield linha
+                else:
+                    ativas = []
+                continue
+            linha = next(atual[2], None)
+            if linha is None:
+                ativas = [ativa for ativa in ativas if ativa is not atual]
+            else:
+                atual[0], atual[1] = chave(linha), linha
+    finally:
+        for _, _, iterador in ativas:
+            if hasattr(iterador, 'close'):
+                iterador.close()
+
+def caminho_telemetria(caminho: str) -> str:
+    """Arquivo do banco de telemetria que acompanha o banco principal em `caminho` (<nome>_telemetria.db)"""
+    return os.path.splitext(caminho)[0] + '_telemetria.db'
+
+def repetir_se_travado(metodo):
+    """Decorador de um método de escrita do banco que é uma transação inteira (ver Armazenamento._repetir_se_travado)"""
+    @functools.wraps(metodo)
+    def envolvido(self, *args, **kwargs):
+        return self._repetir_se_travado(lambda: metodo(self, *args, **kwargs))
+    return envolvido
+
+class Armazenamento(ABC):
+    """
+    Contrato comum dos backends de armazenamento do app: o schema (migrações), as escritas, as
+    leituras paginadas e as exportações, os contadores e os usuários, em SQL que roda no SQLite
+    (Database) e no PostgreSQL (database_postgres.DatabasePostgres, escolhido por DATABASE_URL).
+    O que muda entre os dois fica nos ganchos de backend abstratos (conexões, leitura em blocos,
+    DDL de triggers e colunas, trava das migrações). Recursos de um backend só (arquivos mensais,
+    backup online, vacuum incremental) ficam na subclasse e são anunciados por ARQUIVOS e SNAPSHOTS.
+    Cada subclasse cria em __init__ o estado por thread (_local), o _lock e as _geracoes.
+    """
     
-    def get_connection(self):
-        """Cria e retorna uma conexão com o banco de dados"""
-        return sqlite3.connect(self.db_name)
+    # Domínios de escrita; cada um tem uma geração usada para invalidar caches de respostas
+    DOMINIOS = ('buscas', 'ips', 'usuarios')
+    
+    # Tabelas com total de linhas mantido na tabela contadores
+    TABELAS_CONTADAS = ('nome_buscas', 'processo_buscas', 'foto_buscas', 'cpf_buscas', 'historico_buscas')
+    
+    # Tabelas de busca -> rota cuja requisição gerou a linha (usada no backfill de usuario_id)
+    TABELAS_BUSCA = {
+        'nome_buscas': '/api/buscar/nome',
+        'processo_buscas': '/api/buscar/processo',
+        'foto_buscas': '/api/buscar/foto',
+        'cpf_buscas': '/api/buscar/cpf',
+    }
+    
+    # Tipo de busca -> (tabela, colunas gravadas por fonte; usuario_id é acrescentado por salvar_busca_completa)
+    COLUNAS_BUSCA = {
+        'nome': ('nome_buscas', ('nome', 'resultado', 'fonte', 'tipo_busca')),
+        'processo': ('processo_buscas', ('numero_processo', 'resultado', 'fonte', 'status')),
+        'foto': ('foto_buscas', ('termo_busca', 'url_imagem', 'resultado', 'fonte', 'hash_imagem')),
+        'cpf': ('cpf_buscas', ('cpf', 'cpf_formatado', 'resultado', 'fonte', 'informacoes', 'status')),
+    }
+    
+    # Colunas de JSON guardadas na tabela blobs: (tabela, coluna de texto legada, coluna com o hash)
+    COLUNAS_BLOB = (
+        ('historico_buscas', 'resultado', 'resultado_hash'),
+        ('cpf_buscas', 'informacoes', 'informacoes_hash'),
+    )
+    
+    # Migrações de schema em ordem: (versão, descrição, método)
+    # Cada uma roda uma única vez por banco e fica registrada em schema_version
+    MIGRACOES = (
+        (1, 'tabelas iniciais e usuários padrão', '_migracao_001_tabelas_iniciais'),
+        (2, 'índices das consultas de listagem e estatísticas', '_migracao_002_indices'),
+        (3, 'rollups por hora/dia de ip_logs', '_migracao_003_rollups_ip'),
+        (4, 'contadores de linhas mantidos por triggers', '_migracao_004_contadores'),
+        (5, 'usuario_id nas buscas e contadores por usuário', '_migracao_005_usuario_buscas'),
+        (6, 'JSON de resultados em blobs comprimidos endereçados por hash', '_migracao_006_blobs'),
+        (7, 'versões para invalidar caches entre processos', '_migracao_007_versoes'),
+        (8, 'registro dos arquivos mensais de linhas antigas', '_migracao_008_arquivos'),
+        (9, 'ip_logs e rollups no banco de telemetria', '_migracao_009_telemetria'),
+        (10, 'reservas das tarefas de manutenção entre processos', '_migracao_010_tarefas'),
+        (11, 'rollups de ip_logs por hora a cada lote, consolidados em dia e total', '_migracao_011_rollups_por_hora'),
+    )
+    
+    # Definidos por cada backend: esquema das tabelas do banco principal e das de telemetria nas
+    # consultas qualificadas (esquema.tabela) e o valor de LIMIT que não limita
+    ESQUEMA: str
+    ESQUEMA_TELEMETRIA: str
+    SEM_LIMITE: Optional[int]
+    # Sufixo das leituras de linhas que a mesma transação vai reescrever (trava as linhas lidas)
+    TRAVAR_LINHAS: str
+    
+    # Bancos com conexão própria (ver conexao). As TABELAS_TELEMETRIA são gravadas por
+    # conexao('telemetria'), que é o banco principal quando o backend não separa a telemetria
+    BANCOS = ('principal',)
+    TABELAS_TELEMETRIA = ('ip_logs', 'ip_rollup_hora', 'ip_rollup_dia', 'ip_rollup_total')
+    
+    # Recursos de um backend só: arquivos mensais (arquivar, listar_arquivos) e snapshots
+    # (backup, snapshot, listar_snapshots). As rotas de admin respondem 501 sem eles
+    ARQUIVOS = False
+    SNAPSHOTS = False
+    
+    def _repetir_se_travado(self, escrita: Callable):
+        """
+        Executa `escrita`, uma transação inteira, e a repete enquanto o banco responder travado
+        (ver _travado), até ESCRITA_TENTATIVAS vezes. Entre as tentativas espera um tempo sorteado
+        entre zero e ESCRITA_ESPERA_MS, que dobra a cada tentativa até 1 s: processos travados
+        juntos não voltam juntos. Esgotadas as tentativas, o erro sobe. Dentro de um bloco
+        conexao() já aberto roda uma vez só: quem repete é o dono da transação de fora.
+        """
+        if self._em_transacao():
+            return escrita()
+        tentativas = max(int(os.getenv('ESCRITA_TENTATIVAS', 5)), 1)
+        espera = float(os.getenv('ESCRITA_ESPERA_MS', 20)) / 1000
+        for tentativa in range(1, tentativas + 1):
+            try:
+                return escrita()
+            except Exception as e:
+                if not self._travado(e):
+                    raise
+                metricas.escrita_travada(desistiu=tentativa == tentativas)
+                if tentativa == tentativas:
+                    raise
+            time.sleep(random.uniform(0, min(espera * 2 ** (tentativa - 1), 1.0)))
+    
+    def registrar_escrita(self, dominio: str):
+        """
+        Marca que a transação corrente alterou `dominio` (ver DOMINIOS). A geração do
+        domínio só avança depois do commit, para um leitor não guardar em cache, sob a
+        geração nova, dados lidos antes da escrita ficar visível.
+        """
+        self._local.escritas.add(dominio)
+    
+    def _publicar_escritas(self):
+        """Avança as gerações dos domínios escritos pela transação que acabou de fazer commit"""
+        escritas = self._local.escritas
+        if escritas:
+            with self._lock:
+                for dominio in escritas:
+                    self._geracoes[dominio] = self._geracoes.get(dominio, 0) + 1
+            escritas.clear()
+    
+    def geracao(self, dominio: str) -> int:
+        """Geração de escrita do domínio neste processo (muda a cada commit que o altera)"""
+        return self._geracoes.get(dominio, 0)
     
     def init_database(self):
-        """Inicializa as tabelas do banco de dados"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        """
+        Aplica as migrações pendentes, em ordem.
+        Quando o schema já está na versão atual, custa uma única consulta.
+        """
+        versao_atual = self.MIGRACOES[-1][0]
+        if self.versao_schema() >= versao_atual:
+            return
         
+        with self.conexao() as conn:
+            self._bloquear_migracoes(conn)
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    versao INTEGER PRIMARY KEY,
+                    descricao TEXT,
+                    data_aplicacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('SELECT MAX(versao) FROM schema_version')
+            versao = cursor.fetchone()[0] or 0
+            
+            for numero, descricao, metodo in self.MIGRACOES:
+                if numero <= versao:
+                    continue
+                getattr(self, metodo)(cursor)
+                cursor.execute('INSERT INTO schema_version (versao, descricao) VALUES (?, ?)',
+                               (numero, descricao))
+    
+    # Ganchos de backend: cada subclasse os implementa com o equivalente do seu banco
+    
+    @abstractmethod
+    def conexao(self, banco: str = 'principal'):
+        """
+        Context manager com a conexão da thread atual com `banco` (ver BANCOS). Blocos aninhados
+        compartilham a transação: commit ao sair do mais externo, seguido de _publicar_escritas,
+        e rollback da transação inteira em qualquer exceção.
+        """
+    
+    @abstractmethod
+    def transacao(self, banco: str = 'principal'):
+        """Como conexao(), com o lock de escrita garantido desde o início da transação"""
+    
+    @abstractmethod
+    def reiniciar_apos_fork(self):
+        """Descarta, no processo filho, as conexões herdadas do pai (post_fork)"""
+    
+    @abstractmethod
+    def fechar_conexoes(self):
+        """Fecha as conexões abertas por este objeto; o próximo uso abre outras"""
+    
+    @abstractmethod
+    def versao_schema(self) -> int:
+        """Retorna a versão de schema registrada no banco (0 se nunca migrado)"""
+    
+    @abstractmethod
+    def _bloquear_migracoes(self, conn):
+        """Serializa as migrações de workers que sobem ao mesmo tempo (até o fim da transação de `conn`)"""
+    
+    @abstractmethod
+    def _travado(self, erro: Exception) -> bool:
+        """Erro de lock que vale repetir a transação inteira (ver _repetir_se_travado)"""
+    
+    @abstractmethod
+    def _em_transacao(self) -> bool:
+        """A thread atual está dentro de um bloco conexao()"""
+    
+    @abstractmethod
+    def _colunas(self, cursor, tabela: str) -> List[str]:
+        """Nomes das colunas de `tabela`"""
+    
+    @abstractmethod
+    def _criar_trigger(self, cursor, nome: str, evento: str, tabela: str, corpo: str, condicao: str = None):
+        """Trigger por linha `evento` (ex.: AFTER INSERT) em `tabela` que executa `corpo` (uma instrução) se `condicao`"""
+    
+    @abstractmethod
+    def _data_menos_segundos(self, expressao: str, segundos: int) -> str:
+        """Expressão SQL da data `expressao` (texto AAAA-MM-DD HH:MM:SS) menos `segundos`, no mesmo formato"""
+    
+    @abstractmethod
+    def _conexao_leitura(self):
+        """Conexão que as leituras longas (_paginar, iterar_exportacao) passam a _ler_blocos"""
+    
+    @abstractmethod
+    def _ler_blocos(self, conn, sql: str, parametros, tamanho: int, servidor: bool = False) -> Iterator[List[tuple]]:
+        """
+        Executa uma consulta só de leitura e entrega as linhas em blocos de até `tamanho`.
+        `servidor` indica um resultado grande, que não deve chegar inteiro ao processo.
+        """
+    
+    @abstractmethod
+    def _tamanho_banco(self) -> int:
+        """Tamanho do banco em bytes"""
+    
+    @abstractmethod
+    def _analisar(self, conn):
+        """ANALYZE das tabelas do banco da conexão"""
+    
+    @abstractmethod
+    def _somar_rollup(self, cursor, tabela: str, coluna: str, chave, total: int, visitantes: HyperLogLog) -> bool:
+        """
+        Soma `total` acessos e une `visitantes` na linha `chave` de um rollup de ip_logs, criando-a
+        se faltar, na transação de `cursor`. Retorna True se a linha foi criada.
+        """
+    
+    @abstractmethod
+    def _devolver_espaco(self) -> int:
+        """Devolve ao sistema o espaço das linhas apagadas (limpar_banco, podar_ip_logs); retorna as páginas liberadas"""
+    
+    def _migracao_001_tabelas_iniciais(self, cursor: sqlite3.Cursor):
+        """Cria as tabelas e os usuários padrão"""
         # Tabela para buscas por nome
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS nome_buscas (
@@ -126,11 +421,9 @@ class Database:
         
         # Verificar e adicionar coluna senha_hash se não existir
         try:
-            cursor.execute('PRAGMA table_info(usuarios)')
-            columns = [column[1] for column in cursor.fetchall()]
+            columns = self._colunas(cursor, 'usuarios')
             if 'senha_hash' not in columns:
                 cursor.execute('ALTER TABLE usuarios ADD COLUMN senha_hash TEXT')
-                conn.commit()
         except Exception as e:
             print(f"Note: Could not add senha_hash column (may already exist): {e}")
         
@@ -159,213 +452,692 @@ class Database:
                 INSERT INTO usuarios (email, nome, senha_hash, permissao)
                 VALUES (?, ?, ?, ?)
             ''', ('admin@seita.com', 'Administrator', senha_hash, 'admin'))
+    
+    def _migracao_002_indices(self, cursor: sqlite3.Cursor):
+        """Cria os índices secundários usados pelas consultas de listagem e estatísticas"""
+        indices = [
+            ('idx_nome_buscas_data', 'nome_buscas (data_busca)'),
+            ('idx_processo_buscas_data', 'processo_buscas (data_busca)'),
+            ('idx_foto_buscas_data', 'foto_buscas (data_busca)'),
+            ('idx_cpf_buscas_data', 'cpf_buscas (data_busca)'),
+            ('idx_historico_buscas_data', 'historico_buscas (data_busca)'),
+            ('idx_ip_logs_data', 'ip_logs (data_acesso)'),
+            ('idx_ip_logs_ip', 'ip_logs (ip_address)'),
+            ('idx_usuarios_permissao', 'usuarios (permissao)'),
+            ('idx_usuarios_data_criacao', 'usuarios (data_criacao)'),
+        ]
+        for nome, definicao in indices:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {nome} ON {definicao}')
+        self._analisar(cursor)
+    
+    def _migracao_003_rollups_ip(self, cursor: sqlite3.Cursor):
+        """Cria os rollups de ip_logs e os preenche a partir das linhas existentes"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ip_rollup_hora (
+                hora TEXT PRIMARY KEY,
+                total INTEGER NOT NULL DEFAULT 0,
+                visitantes BLOB
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ip_rollup_dia (
+                dia TEXT PRIMARY KEY,
+                total INTEGER NOT NULL DEFAULT 0,
+                visitantes BLOB
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ip_rollup_total (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                total INTEGER NOT NULL DEFAULT 0,
+                visitantes BLOB
+            )
+        ''')
         
-        conn.commit()
-        conn.close()
+        def linhas_existentes():
+            leitura = cursor.connection.execute('SELECT ip_address, data_acesso FROM ip_logs WHERE data_acesso IS NOT NULL')
+            while True:
+                bloco = leitura.fetchmany(10000)
+                if not bloco:
+                    return
+                yield from bloco
+        
+        self._atualizar_rollups_ip(cursor, linhas_existentes())
     
-    def salvar_busca_nome(self, nome: str, resultado: str, fonte: str, tipo_busca: str = "nome"):
-        """Salva resultado de busca por nome"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def _migracao_004_contadores(self, cursor: sqlite3.Cursor):
+        """Cria a tabela contadores, os triggers que a mantêm e a contagem inicial"""
         cursor.execute('''
-            INSERT INTO nome_buscas (nome, resultado, fonte, tipo_busca)
-            VALUES (?, ?, ?, ?)
-        ''', (nome, resultado, fonte, tipo_busca))
-        conn.commit()
-        conn.close()
+            CREATE TABLE IF NOT EXISTS contadores (
+                tabela TEXT PRIMARY KEY,
+                total INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        for tabela in self.TABELAS_CONTADAS:
+            self._criar_trigger(cursor, f'trg_{tabela}_contador_insert', 'AFTER INSERT', tabela,
+                                f"UPDATE contadores SET total = total + 1 WHERE tabela = '{tabela}'")
+            self._criar_trigger(cursor, f'trg_{tabela}_contador_delete', 'AFTER DELETE', tabela,
+                                f"UPDATE contadores SET total = total - 1 WHERE tabela = '{tabela}'")
+        self._recontar(cursor)
     
-    def salvar_busca_processo(self, numero_processo: str, resultado: str, fonte: str, status: str = "pendente"):
-        """Salva resultado de busca por processo"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def _recontar(self, cursor: sqlite3.Cursor) -> Dict[str, int]:
+        """Recalcula contadores com COUNT(*) e retorna {tabela: diferença corrigida}"""
+        diferencas = {}
+        for tabela in self.TABELAS_CONTADAS:
+            cursor.execute(f'SELECT COUNT(*) FROM {tabela}')
+            real = cursor.fetchone()[0]
+            # Linhas arquivadas continuam contando (os contadores são do histórico inteiro)
+            for esquema in self._percorrer_arquivos(cursor, tabela):
+                cursor.execute(f'SELECT COUNT(*) FROM {esquema}.{tabela}')
+                real += cursor.fetchone()[0]
+            cursor.execute('SELECT total FROM contadores WHERE tabela = ?', (tabela,))
+            atual = cursor.fetchone()
+            if atual is None or atual[0] != real:
+                diferencas[tabela] = real - (atual[0] if atual else 0)
+                cursor.execute('''
+                    INSERT INTO contadores (tabela, total) VALUES (?, ?)
+                    ON CONFLICT (tabela) DO UPDATE SET total = excluded.total
+                ''', (tabela, real))
+        return diferencas
+    
+    def _migracao_005_usuario_buscas(self, cursor: sqlite3.Cursor):
+        """
+        Adiciona usuario_id (indexado) às tabelas de busca e ao histórico, cria
+        contadores_usuario e atribui as linhas existentes quando possível.
+        """
+        # Expressão SQL da rota de busca de cada tabela
+        rotas = {tabela: f"'{rota}'" for tabela, rota in self.TABELAS_BUSCA.items()}
+        rotas['historico_buscas'] = "'/api/buscar/' || historico_buscas.tipo_busca"
+        
+        for tabela, rota in rotas.items():
+            if 'usuario_id' not in self._colunas(cursor, tabela):
+                cursor.execute(f'ALTER TABLE {tabela} ADD COLUMN usuario_id INTEGER')
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{tabela}_usuario ON {tabela} (usuario_id)')
+            
+            # Backfill: o acesso registrado em ip_logs para a rota de busca, no máximo
+            # 5 s antes da linha, identifica o usuário quando só um usuário logado bate
+            cursor.execute(f'''
+                UPDATE {tabela} SET usuario_id = (
+                    SELECT CASE WHEN COUNT(DISTINCT l.user_id) = 1 THEN CAST(MIN(l.user_id) AS INTEGER) END
+                    FROM ip_logs l
+                    WHERE l.data_acesso BETWEEN {self._data_menos_segundos(f'{tabela}.data_busca', 5)} AND {tabela}.data_busca
+                      AND l.path = {rota}
+                      AND l.user_id IS NOT NULL
+                )
+                WHERE usuario_id IS NULL
+            ''')
+        
         cursor.execute('''
-            INSERT INTO processo_buscas (numero_processo, resultado, fonte, status)
-            VALUES (?, ?, ?, ?)
-        ''', (numero_processo, resultado, fonte, status))
-        conn.commit()
-        conn.close()
+            CREATE TABLE IF NOT EXISTS contadores_usuario (
+                usuario_id INTEGER NOT NULL,
+                tipo_busca TEXT NOT NULL,
+                total INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (usuario_id, tipo_busca)
+            )
+        ''')
+        self._criar_trigger(cursor, 'trg_historico_buscas_usuario_insert', 'AFTER INSERT', 'historico_buscas', '''
+            INSERT INTO contadores_usuario (usuario_id, tipo_busca, total) VALUES (NEW.usuario_id, NEW.tipo_busca, 1)
+            ON CONFLICT (usuario_id, tipo_busca) DO UPDATE SET total = contadores_usuario.total + 1
+        ''', 'NEW.usuario_id IS NOT NULL')
+        self._criar_trigger(cursor, 'trg_historico_buscas_usuario_delete', 'AFTER DELETE', 'historico_buscas', '''
+            UPDATE contadores_usuario SET total = total - 1
+            WHERE usuario_id = OLD.usuario_id AND tipo_busca = OLD.tipo_busca
+        ''', 'OLD.usuario_id IS NOT NULL')
+        self._recontar_usuarios(cursor)
     
-    def salvar_busca_foto(self, termo_busca: str, url_imagem: str, resultado: str, fonte: str, hash_imagem: str = ""):
-        """Salva resultado de busca por foto"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def _recontar_usuarios(self, cursor: sqlite3.Cursor) -> int:
+        """Recalcula contadores_usuario a partir do histórico; retorna quantos contadores mudaram"""
+        reais = {}
+        for esquema in itertools.chain([self.ESQUEMA], self._percorrer_arquivos(cursor, 'historico_buscas')):
+            cursor.execute(f'''
+                SELECT usuario_id, tipo_busca, COUNT(*) FROM {esquema}.historico_buscas
+                WHERE usuario_id IS NOT NULL GROUP BY usuario_id, tipo_busca
+            ''')
+            for usuario_id, tipo, total in cursor.fetchall():
+                reais[(usuario_id, tipo)] = reais.get((usuario_id, tipo), 0) + total
+        cursor.execute('SELECT usuario_id, tipo_busca, total FROM contadores_usuario')
+        atuais = {(usuario_id, tipo): total for usuario_id, tipo, total in cursor.fetchall()}
+        
+        alterados = [chave for chave in reais.keys() | atuais.keys() if reais.get(chave, 0) != atuais.get(chave, 0)]
+        cursor.executemany('''
+            INSERT INTO contadores_usuario (usuario_id, tipo_busca, total) VALUES (?, ?, ?)
+            ON CONFLICT (usuario_id, tipo_busca) DO UPDATE SET total = excluded.total
+        ''', [(usuario_id, tipo, reais.get((usuario_id, tipo), 0)) for usuario_id, tipo in alterados])
+        return len(alterados)
+    
+    def _migracao_006_blobs(self, cursor: sqlite3.Cursor):
+        """Cria a tabela blobs e move para ela o JSON já gravado em historico_buscas e cpf_buscas"""
         cursor.execute('''
-            INSERT INTO foto_buscas (termo_busca, url_imagem, resultado, fonte, hash_imagem)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (termo_busca, url_imagem, resultado, fonte, hash_imagem))
-        conn.commit()
-        conn.close()
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                dados BLOB NOT NULL,
+                tamanho INTEGER NOT NULL
+            )
+        ''')
+        for tabela, _, coluna_hash in self.COLUNAS_BLOB:
+            if coluna_hash not in self._colunas(cursor, tabela):
+                cursor.execute(f'ALTER TABLE {tabela} ADD COLUMN {coluna_hash} TEXT')
+        self._compactar(cursor)
     
-    def salvar_busca_cpf(self, cpf: str, cpf_formatado: str, resultado: str, fonte: str, informacoes: str, status: str = "encontrado"):
-        """Salva resultado de busca por CPF"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def _guardar_blob(self, cursor: sqlite3.Cursor, texto: str) -> str:
+        """Guarda o texto comprimido em blobs (uma vez por conteúdo) e retorna seu hash"""
+        dados = texto.encode('utf-8')
+        chave = hashlib.sha256(dados).hexdigest()
+        cursor.execute('INSERT INTO blobs (hash, dados, tamanho) VALUES (?, ?, ?) ON CONFLICT (hash) DO NOTHING',
+                       (chave, zlib.compress(dados, 6), len(dados)))
+        return chave
+    
+    def _ler_blob(self, cursor: sqlite3.Cursor, chave: str, esquema: str = None) -> Optional[str]:
+        """Lê e descomprime um blob pelo hash (`esquema`: banco principal ou arquivo mensal anexado)"""
+        cursor.execute(f'SELECT dados FROM {esquema or self.ESQUEMA}.blobs WHERE hash = ?', (chave,))
+        linha = cursor.fetchone()
+        return zlib.decompress(linha[0]).decode('utf-8') if linha else None
+    
+    def _compactar(self, cursor: sqlite3.Cursor, lote: int = 1000) -> Dict[str, int]:
+        """Move o JSON em texto das COLUNAS_BLOB para blobs, em lotes por id; retorna linhas convertidas por tabela"""
+        convertidas = {}
+        for tabela, coluna, coluna_hash in self.COLUNAS_BLOB:
+            convertidas[tabela] = 0
+            ultimo_id = 0
+            while True:
+                cursor.execute(f'''
+                    SELECT id, {coluna} FROM {tabela}
+                    WHERE id > ? AND {coluna} IS NOT NULL AND {coluna_hash} IS NULL
+                    ORDER BY id LIMIT ?
+                ''', (ultimo_id, lote))
+                linhas = cursor.fetchall()
+                if not linhas:
+                    break
+                hashes = {}
+                for _, texto in linhas:
+                    if texto not in hashes:
+                        hashes[texto] = self._guardar_blob(cursor, texto)
+                cursor.executemany(f'UPDATE {tabela} SET {coluna_hash} = ?, {coluna} = NULL WHERE id = ?',
+                                   [(hashes[texto], id_linha) for id_linha, texto in linhas])
+                convertidas[tabela] += len(linhas)
+                ultimo_id = linhas[-1][0]
+        return convertidas
+    
+    def _migracao_007_versoes(self, cursor: sqlite3.Cursor):
+        """Cria a tabela versoes, lida pelos caches em memória para saber quando descartar entradas"""
         cursor.execute('''
-            INSERT INTO cpf_buscas (cpf, cpf_formatado, resultado, fonte, informacoes, status)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (cpf, cpf_formatado, resultado, fonte, informacoes, status))
-        conn.commit()
-        conn.close()
+            CREATE TABLE IF NOT EXISTS versoes (
+                chave TEXT PRIMARY KEY,
+                versao INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute("INSERT INTO versoes (chave, versao) VALUES ('permissoes', 0) ON CONFLICT (chave) DO NOTHING")
     
-    def salvar_historico(self, tipo_busca: str, termo_busca: str, resultado: str):
-        """Salva no histórico geral"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def _migracao_008_arquivos(self, cursor: sqlite3.Cursor):
+        """
+        Cria o registro dos meses arquivados de cada tabela (ver arquivar) e indexa os hashes
+        de blobs, usados para apagar do banco principal os blobs que só linhas arquivadas usam.
+        """
         cursor.execute('''
-            INSERT INTO historico_buscas (tipo_busca, termo_busca, resultado)
-            VALUES (?, ?, ?)
-        ''', (tipo_busca, termo_busca, resultado))
-        conn.commit()
-        conn.close()
+            CREATE TABLE IF NOT EXISTS arquivos (
+                tabela TEXT NOT NULL,
+                mes TEXT NOT NULL,
+                linhas INTEGER NOT NULL DEFAULT 0,
+                data_min TEXT,
+                data_max TEXT,
+                id_min INTEGER,
+                id_max INTEGER,
+                PRIMARY KEY (tabela, mes)
+            )
+        ''')
+        for tabela, _, coluna_hash in self.COLUNAS_BLOB:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{tabela}_{coluna_hash} ON {tabela} ({coluna_hash})')
     
-    def buscar_historico_nome(self, nome: str) -> List[Dict]:
-        """Busca histórico de buscas por nome"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def _migracao_009_telemetria(self, cursor):
+        """Sem banco de telemetria separado, ip_logs e os rollups ficam no banco principal (ver Database)"""
+    
+    def _migracao_010_tarefas(self, cursor: sqlite3.Cursor):
+        """Cria a tabela tarefas: uma linha por tarefa periódica, reservada por um processo de cada vez"""
         cursor.execute('''
-            SELECT * FROM nome_buscas WHERE nome LIKE ? ORDER BY data_busca DESC
-        ''', (f'%{nome}%',))
-        results = cursor.fetchall()
-        conn.close()
-        
-        return [{
-            'id': r[0],
-            'nome': r[1],
-            'resultado': r[2],
-            'fonte': r[3],
-            'data_busca': r[4],
-            'tipo_busca': r[5]
-        } for r in results]
-    
-    def buscar_historico_processo(self, numero_processo: str) -> List[Dict]:
-        """Busca histórico de buscas por processo"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+            CREATE TABLE IF NOT EXISTS tarefas (
+                nome TEXT PRIMARY KEY,
+                proxima_execucao TEXT NOT NULL,
+                em_execucao_ate TEXT,
+                dono TEXT
+            )
+        ''')
+    
+    def _migracao_011_rollups_por_hora(self, cursor):
+        """
+        Até aqui cada lote somava os acessos nos três rollups; agora ip_rollup_dia e ip_rollup_total
+        guardam só as horas já consolidadas (ver _consolidar_rollups_ip). Tira deles os acessos das
+        horas ainda em ip_rollup_hora, para não contá-los duas vezes. Os HyperLogLogs ficam como
+        estão: a união com os das mesmas horas não muda nada. Sem linha em ip_rollup_total
+        (nenhum acesso, ou rollups recém-criados pela migração 3), já está no formato novo.
+        """
+        cursor.execute('SELECT 1 FROM ip_rollup_total WHERE id = 1')
+        if cursor.fetchone() is None:
+            return
+        cursor.execute('UPDATE ip_rollup_total SET total = total - (SELECT COALESCE(SUM(total), 0) FROM ip_rollup_hora) WHERE id = 1')
         cursor.execute('''
-            SELECT * FROM processo_buscas WHERE numero_processo LIKE ? ORDER BY data_busca DESC
-        ''', (f'%{numero_processo}%',))
-        results = cursor.fetchall()
-        conn.close()
-        
-        return [{
-            'id': r[0],
-            'numero_processo': r[1],
-            'resultado': r[2],
-            'fonte': r[3],
-            'data_busca': r[4],
-            'status': r[5]
-        } for r in results]
-    
-    def buscar_historico_foto(self, termo_busca: str) -> List[Dict]:
-        """Busca histórico de buscas por foto"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+            UPDATE ip_rollup_dia SET total = total - (
+                SELECT COALESCE(SUM(total), 0) FROM ip_rollup_hora WHERE substr(hora, 1, 10) = ip_rollup_dia.dia
+            )
+        ''')
+    
+    def _incrementar_versao(self, cursor: sqlite3.Cursor, chave: str):
+        """Incrementa a versão de `chave` na transação corrente"""
         cursor.execute('''
-            SELECT * FROM foto_buscas WHERE termo_busca LIKE ? ORDER BY data_busca DESC
-        ''', (f'%{termo_busca}%',))
-        results = cursor.fetchall()
-        conn.close()
+            INSERT INTO versoes (chave, versao) VALUES (?, 1)
+            ON CONFLICT(chave) DO UPDATE SET versao = versoes.versao + 1
+        ''', (chave,))
+    
+    def obter_versao(self, chave: str) -> int:
+        """Versão atual de `chave` (uma leitura pela chave primária)"""
+        with self.conexao() as conn:
+            linha = conn.execute('SELECT versao FROM versoes WHERE chave = ?', (chave,)).fetchone()
+        return linha[0] if linha else 0
+    
+    @repetir_se_travado
+    def reservar_tarefa(self, nome: str, proxima: datetime, prazo_s: float) -> bool:
+        """
+        Reserva a tarefa periódica `nome` para este processo, se ela estiver vencida e livre.
+        A próxima execução passa a ser `proxima` e a reserva vale até concluir_tarefa ou por
+        `prazo_s` segundos (um processo que morra no meio não a prende para sempre).
+        Retorna se a reserva foi obtida; os outros processos recebem False até a próxima vez.
+        """
+        agora = datetime.now(timezone.utc)
+        with self.transacao() as conn:
+            conn.execute('''
+                INSERT INTO tarefas (nome, proxima_execucao) VALUES (?, ?) ON CONFLICT (nome) DO NOTHING
+            ''', (nome, '0000-00-00 00:00:00'))
+            cursor = conn.execute('''
+                UPDATE tarefas SET proxima_execucao = ?, em_execucao_ate = ?, dono = ?
+                WHERE nome = ? AND proxima_execucao <= ? AND (em_execucao_ate IS NULL OR em_execucao_ate < ?)
+            ''', (proxima.strftime('%Y-%m-%d %H:%M:%S'),
+                  (agora + timedelta(seconds=prazo_s)).strftime('%Y-%m-%d %H:%M:%S'),
+                  f'{socket.gethostname()}:{os.getpid()}', nome,
+                  agora.strftime('%Y-%m-%d %H:%M:%S'), agora.strftime('%Y-%m-%d %H:%M:%S')))
+            return cursor.rowcount == 1
+    
+    @repetir_se_travado
+    def concluir_tarefa(self, nome: str):
+        """Libera a reserva de `nome` obtida por este processo em reservar_tarefa"""
+        with self.transacao() as conn:
+            conn.execute('''
+                UPDATE tarefas SET em_execucao_ate = NULL WHERE nome = ? AND dono = ?
+            ''', (nome, f'{socket.gethostname()}:{os.getpid()}'))
+    
+    def compactar_resultados(self) -> Dict:
+        """Converte para blobs qualquer JSON ainda guardado em texto (ex.: bancos antigos ou importados)"""
+        try:
+            with self.transacao() as conn:
+                convertidas = self._compactar(conn.cursor())
+            return {'sucesso': True, 'convertidas': convertidas}
+        except Exception as e:
+            return {'sucesso': False, 'erro': str(e)}
+    
+    @repetir_se_travado
+    def salvar_busca_nome(self, nome: str, resultado: str, fonte: str, tipo_busca: str = "nome", usuario_id: int = None):
+        """Salva resultado de busca por nome"""
+        with self.transacao() as conn:
+            self.registrar_escrita('buscas')
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO nome_buscas (nome, resultado, fonte, tipo_busca, usuario_id)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (nome, resultado, fonte, tipo_busca, usuario_id))
+    
+    @repetir_se_travado
+    def salvar_busca_processo(self, numero_processo: str, resultado: str, fonte: str, status: str = "pendente", usuario_id: int = None):
+        """Salva resultado de busca por processo"""
+        with self.transacao() as conn:
+            self.registrar_escrita('buscas')
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO processo_buscas (numero_processo, resultado, fonte, status, usuario_id)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (numero_processo, resultado, fonte, status, usuario_id))
+    
+    @repetir_se_travado
+    def salvar_busca_foto(self, termo_busca: str, url_imagem: str, resultado: str, fonte: str, hash_imagem: str = "", usuario_id: int = None):
+        """Salva resultado de busca por foto"""
+        with self.transacao() as conn:
+            self.registrar_escrita('buscas')
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO foto_buscas (termo_busca, url_imagem, resultado, fonte, hash_imagem, usuario_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (termo_busca, url_imagem, resultado, fonte, hash_imagem, usuario_id))
+    
+    @repetir_se_travado
+    def salvar_busca_cpf(self, cpf: str, cpf_formatado: str, resultado: str, fonte: str, informacoes: str, status: str = "encontrado", usuario_id: int = None):
+        """Salva resultado de busca por CPF"""
+        with self.transacao() as conn:
+            self.registrar_escrita('buscas')
+            cursor = conn.cursor()
+            informacoes_hash = self._guardar_blob(cursor, informacoes)
+            cursor.execute('''
+                INSERT INTO cpf_buscas (cpf, cpf_formatado, resultado, fonte, informacoes_hash, status, usuario_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (cpf, cpf_formatado, resultado, fonte, informacoes_hash, status, usuario_id))
+    
+    @repetir_se_travado
+    def salvar_historico(self, tipo_busca: str, termo_busca: str, resultado: str, usuario_id: int = None):
+        """Salva no histórico geral"""
+        with self.transacao() as conn:
+            self.registrar_escrita('buscas')
+            cursor = conn.cursor()
+            resultado_hash = self._guardar_blob(cursor, resultado)
+            cursor.execute('''
+                INSERT INTO historico_buscas (tipo_busca, termo_busca, resultado_hash, usuario_id)
+                VALUES (?, ?, ?, ?)
+            ''', (tipo_busca, termo_busca, resultado_hash, usuario_id))
+    
+    @repetir_se_travado
+    def salvar_busca_completa(self, tipo_busca: str, termo_busca: str, linhas: List[Dict], resultado: str, usuario_id: int = None):
+        """
+        Salva uma busca inteira em uma transação: as linhas por fonte (executemany na
+        tabela do tipo) e exatamente uma linha no histórico geral.
+        Cada item de `linhas` é um dict com as colunas de COLUNAS_BUSCA[tipo_busca].
+        """
+        if not linhas:
+            return
+        tabela, colunas = self.COLUNAS_BUSCA[tipo_busca]
+        marcadores = ', '.join('?' * (len(colunas) + 1))
+        # Colunas de JSON desta tabela que vão para blobs (gravadas como <coluna>_hash)
+        colunas_blob = {coluna: coluna_hash for t, coluna, coluna_hash in self.COLUNAS_BLOB if t == tabela}
+        colunas_sql = [colunas_blob.get(coluna, coluna) for coluna in colunas]
         
-        return [{
-            'id': r[0],
-            'termo_busca': r[1],
-            'url_imagem': r[2],
-            'resultado': r[3],
-            'fonte': r[4],
-            'data_busca': r[5],
-            'hash_imagem': r[6]
-        } for r in results]
+        with self.transacao() as conn:
+            self.registrar_escrita('buscas')
+            cursor = conn.cursor()
+            hashes = {}
+            
+            def valor(linha, coluna):
+                if coluna not in colunas_blob:
+                    return linha.get(coluna)
+                texto = linha.get(coluna) or ''
+                if texto not in hashes:
+                    hashes[texto] = self._guardar_blob(cursor, texto)
+                return hashes[texto]
+            
+            cursor.executemany(
+                f'INSERT INTO {tabela} ({", ".join(colunas_sql)}, usuario_id) VALUES ({marcadores})',
+                [tuple(valor(linha, coluna) for coluna in colunas) + (usuario_id,) for linha in linhas]
+            )
+            cursor.execute('''
+                INSERT INTO historico_buscas (tipo_busca, termo_busca, resultado_hash, usuario_id)
+                VALUES (?, ?, ?, ?)
+            ''', (tipo_busca, termo_busca, self._guardar_blob(cursor, resultado), usuario_id))
     
-    def obter_todas_buscas(self, limite: int = 50) -> List[Dict]:
-        """Obtém todas as buscas recentes"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT tipo_busca, termo_busca, resultado, data_busca 
-            FROM historico_buscas 
-            ORDER BY data_busca DESC 
-            LIMIT ?
-        ''', (limite,))
-        results = cursor.fetchall()
-        conn.close()
+    # Tipo -> (tabela, coluna pesquisada com LIKE, colunas retornadas) para o histórico por termo
+    HISTORICO_POR_TIPO = {
+        'nome': ('nome_buscas', 'nome', ('id', 'nome', 'resultado', 'fonte', 'data_busca', 'tipo_busca')),
+        'processo': ('processo_buscas', 'numero_processo', ('id', 'numero_processo', 'resultado', 'fonte', 'data_busca', 'status')),
+        'foto': ('foto_buscas', 'termo_busca', ('id', 'termo_busca', 'url_imagem', 'resultado', 'fonte', 'data_busca', 'hash_imagem')),
+    }
+    
+    COLUNAS_IP_LOGS = ('id', 'ip_address', 'user_agent', 'path', 'method', 'user_id', 'session_id', 'data_acesso', 'country', 'city')
+    
+    def _paginar(self, tabela: str, colunas: Tuple[str, ...], coluna_data: str, filtro: str = '', parametros: tuple = (),
+                 apos: Optional[Tuple[str, int]] = None, limite: Optional[int] = None) -> Iterator[Dict]:
+        """
+        Paginação por keyset em (coluna_data, id), do mais recente para o mais antigo.
+        `apos` é o par (data, id) da última linha da página anterior. As linhas são lidas
+        em blocos com fetchmany e entregues uma a uma, sem materializar a página inteira.
+        Linhas já arquivadas (ver arquivar) vêm dos arquivos mensais, na mesma ordem.
+        """
+        # Só leitura: usa a conexão da thread sem abrir um bloco conexao(), que adiaria
+        # commits de outras escritas da thread enquanto a resposta é transmitida
+        conn = self._conexao_leitura()
+        principal = self._consultar_pagina(conn, tabela, colunas, coluna_data, filtro, parametros, apos, limite)
+        # O registro de arquivos é lido depois de a consulta no banco principal começar: um lote
+        # arquivado nesse meio tempo aparece nos dois lados (e sai uma vez), nunca em nenhum
+        primeira = next(principal, None)
+        principal = itertools.chain([primeira] if primeira else [], principal)
+        arquivos = [(mes, data_max) for mes, data_min, data_max, _, _ in self._arquivos(conn, tabela)
+                    if apos is None or data_min <= apos[0]]
+        if not arquivos:
+            return principal
+        
+        def ler_mes(mes):
+            return self._ler_arquivo(mes, lambda esquema: self._consultar_pagina(
+                conn, f'{esquema}.{tabela}', colunas, coluna_data, filtro, parametros, apos, limite))
         
-        return [{
-            'tipo_busca': r[0],
-            'termo_busca': r[1],
-            'resultado': r[2],
-            'data_busca': r[3]
-        } for r in results]
+        fontes = [(None, lambda: principal)]
+        fontes += [(data_max, lambda mes=mes: ler_mes(mes)) for mes, data_max in arquivos]
+        linhas = _intercalar(fontes, lambda linha: (linha[coluna_data] or '', linha['id']), decrescente=True)
+        return itertools.islice(linhas, limite) if limite is not None else linhas
     
-    def criar_banco_personalizado(self, nome_banco: str) -> Dict:
-        """Cria um novo banco de dados personalizado"""
+    def _consultar_pagina(self, conn: sqlite3.Connection, origem: str, colunas: Tuple[str, ...], coluna_data: str,
+                          filtro: str, parametros: tuple, apos: Optional[Tuple[str, int]],
+                          limite: Optional[int]) -> Iterator[Dict]:
+        """Uma consulta de _paginar em `origem` (tabela do banco principal ou esquema.tabela de um arquivo)"""
+        condicoes = [filtro] if filtro else []
+        if apos:
+            condicoes.append(f'({coluna_data}, id) < (?, ?)')
+            parametros = tuple(parametros) + tuple(apos)
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ''
+        
+        blocos = self._ler_blocos(conn, f'''
+            SELECT {', '.join(colunas)} FROM {origem} {where}
+            ORDER BY {coluna_data} DESC, id DESC
+            LIMIT ?
+        ''', tuple(parametros) + (limite if limite is not None else self.SEM_LIMITE,), 500, servidor=limite is None)
         try:
-            if not nome_banco.endswith('.db'):
-                nome_banco += '.db'
-            
-            # Criar novo banco
-            temp_db = Database(nome_banco)
-            return {
-                'sucesso': True,
-                'mensagem': f'Banco de dados "{nome_banco}" criado com sucesso!',
-                'nome': nome_banco
-            }
-        except Exception as e:
-            return {
-                'sucesso': False,
-                'mensagem': f'Erro ao criar banco: {str(e)}',
-                'nome': nome_banco
-            }
+            for bloco in blocos:
+                for linha in bloco:
+                    yield dict(zip(colunas, linha))
+        finally:
+            blocos.close()
     
-    def listar_bancos_disponiveis(self) -> List[str]:
-        """Lista todos os arquivos .db no diretório"""
-        import glob
-        bancos = glob.glob("*.db")
-        return bancos
+    def iterar_historico(self, apos: Optional[Tuple[str, int]] = None, limite: Optional[int] = 50) -> Iterator[Dict]:
+        """Itera o histórico geral do mais recente para o mais antigo (sem o JSON do resultado)"""
+        return self._paginar('historico_buscas', ('id', 'tipo_busca', 'termo_busca', 'data_busca'), 'data_busca',
+                             apos=apos, limite=limite)
     
-    def deletar_banco(self, nome_banco: str) -> Dict:
-        """Deleta um banco de dados"""
+    def iterar_historico_termo(self, tipo: str, termo: str, apos: Optional[Tuple[str, int]] = None,
+                               limite: Optional[int] = 50) -> Iterator[Dict]:
+        """Itera as buscas de um tipo cujo termo contém `termo`, do mais recente para o mais antigo"""
+        tabela, coluna, colunas = self.HISTORICO_POR_TIPO[tipo]
+        return self._paginar(tabela, colunas, 'data_busca', f'{coluna} LIKE ?', (f'%{termo}%',),
+                             apos=apos, limite=limite)
+    
+    def iterar_ips(self, apos: Optional[Tuple[str, int]] = None, limite: Optional[int] = 100) -> Iterator[Dict]:
+        """Itera ip_logs do acesso mais recente para o mais antigo"""
+        return self._paginar('ip_logs', self.COLUNAS_IP_LOGS, 'data_acesso', apos=apos, limite=limite)
+    
+    # Exportações administrativas: nome -> (tabela, colunas, coluna de data)
+    EXPORTACOES = {
+        'ips': ('ip_logs', COLUNAS_IP_LOGS, 'data_acesso'),
+        'historico': ('historico_buscas', ('id', 'tipo_busca', 'termo_busca', 'data_busca', 'usuario_id'), 'data_busca'),
+    }
+    
+    def iterar_exportacao(self, nome: str, desde: Optional[str] = None, ate: Optional[str] = None,
+                          lote: int = 1000, segmento: int = 20000) -> Iterator[List[tuple]]:
+        """
+        Blocos de até `lote` linhas (tuplas nas colunas de EXPORTACOES[nome]) em ordem
+        cronológica, com `desde` <= data < `ate`. Sem `ate`, o limite é o instante da
+        chamada, para a exportação terminar mesmo com escritas chegando.
+        As linhas vêm de consultas por keyset de até `segmento` linhas, cada uma lida com
+        fetchmany: a memória fica constante e nenhuma leitura segura um snapshot do WAL
+        (que impede o checkpoint) durante a exportação inteira. Os meses arquivados do
+        intervalo são lidos dos arquivos mensais.
+        """
+        tabela, colunas, coluna_data = self.EXPORTACOES[nome]
+        if ate is None:
+            ate = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            condicao_ate = f'{coluna_data} <= ?'
+        else:
+            condicao_ate = f'{coluna_data} < ?'
+        
+        conn = self._conexao_leitura()
+        
+        def segmentos(origem):
+            return self._exportar_segmentos(conn, origem, colunas, coluna_data, condicao_ate, desde, ate, lote, segmento)
+        
+        arquivos = [(mes, data_min) for mes, data_min, data_max, _, _ in self._arquivos(conn, tabela)
+                    if (desde is None or data_max >= desde) and data_min <= ate]
+        if not arquivos:
+            yield from segmentos(tabela)
+            return
+        
+        # Em ordem crescente o banco principal entra na sua data mais antiga, como um arquivo a mais
+        inicio = conn.execute(f'SELECT MIN({coluna_data}) FROM {tabela}').fetchone()[0]
+        fontes = [(inicio, lambda: itertools.chain.from_iterable(segmentos(tabela)))]
+        fontes += [(data_min, lambda mes=mes: self._ler_arquivo(
+                       mes, lambda esquema: itertools.chain.from_iterable(segmentos(f'{esquema}.{tabela}'))))
+                   for mes, data_min in arquivos]
+        indice_data = colunas.index(coluna_data)
+        linhas = _intercalar(fontes, lambda linha: (linha[indice_data] or '', linha[0]))
+        while True:
+            bloco = list(itertools.islice(linhas, lote))
+            if not bloco:
+                return
+            yield bloco
+    
+    def _exportar_segmentos(self, conn: sqlite3.Connection, origem: str, colunas: Tuple[str, ...], coluna_data: str,
+                            condicao_ate: str, desde: Optional[str], ate: str, lote: int,
+                            segmento: int) -> Iterator[List[tuple]]:
+        """Os blocos de iterar_exportacao lidos de `origem` (tabela do banco principal ou esquema.tabela)"""
+        indice_data = colunas.index(coluna_data)
+        ultimo = None
+        while True:
+            condicoes, parametros = [condicao_ate], [ate]
+            if ultimo is not None:
+                condicoes.append(f'({coluna_data}, id) > (?, ?)')
+                parametros += ultimo
+            elif desde is not None:
+                condicoes.append(f'{coluna_data} >= ?')
+                parametros.append(desde)
+            # Só leitura, fora de um bloco conexao() (ver _paginar)
+            blocos = self._ler_blocos(conn, f'''
+                SELECT {', '.join(colunas)} FROM {origem}
+                WHERE {' AND '.join(condicoes)}
+                ORDER BY {coluna_data}, id
+                LIMIT ?
+            ''', parametros + [segmento], lote, servidor=True)
+            lidas = 0
+            try:
+                for bloco in blocos:
+                    lidas += len(bloco)
+                    ultimo = [bloco[-1][indice_data], bloco[-1][0]]
+                    yield bloco
+            finally:
+                blocos.close()
+            if lidas < segmento:
+                return
+    
+    def buscar_historico_nome(self, nome: str, limite: Optional[int] = None) -> List[Dict]:
+        """Busca histórico de buscas por nome"""
+        return list(self.iterar_historico_termo('nome', nome, limite=limite))
+    
+    def buscar_historico_processo(self, numero_processo: str, limite: Optional[int] = None) -> List[Dict]:
+        """Busca histórico de buscas por processo"""
+        return list(self.iterar_historico_termo('processo', numero_processo, limite=limite))
+    
+    def buscar_historico_foto(self, termo_busca: str, limite: Optional[int] = None) -> List[Dict]:
+        """Busca histórico de buscas por foto"""
+        return list(self.iterar_historico_termo('foto', termo_busca, limite=limite))
+    
+    def obter_todas_buscas(self, limite: int = 50) -> List[Dict]:
+        """Obtém todas as buscas recentes (sem o JSON do resultado; ver obter_resultado_historico)"""
+        return list(self.iterar_historico(limite=limite))
+    
+    def obter_resultado_historico(self, historico_id: int) -> Optional[Dict]:
+        """Obtém uma busca do histórico com o JSON do resultado (descomprimido só aqui)"""
+        with self.conexao() as conn:
+            cursor = conn.cursor()
+            r = self._ler_historico(cursor, self.ESQUEMA, historico_id)
+            if r is None:
+                # Busca arquivada: o registro diz em que meses o id pode estar
+                for mes, _, _, id_min, id_max in self._arquivos(cursor, 'historico_buscas'):
+                    esquema = self._anexar(mes) if id_min <= historico_id <= id_max else None
+                    if esquema is None:
+                        continue
+                    try:
+                        r = self._ler_historico(cursor, esquema, historico_id)
+                    finally:
+                        self._liberar(esquema)
+                    if r is not None:
+                        break
+            if r is None:
+                return None
+        
+        return {
+            'id': r[0],
+            'tipo_busca': r[1],
+            'termo_busca': r[2],
+            'data_busca': r[3],
+            'resultado': r[4]
+        }
+    
+    def _ler_historico(self, cursor: sqlite3.Cursor, esquema: str, historico_id: int) -> Optional[tuple]:
+        """(id, tipo_busca, termo_busca, data_busca, resultado) de uma linha do histórico em `esquema`"""
+        cursor.execute(f'''
+            SELECT id, tipo_busca, termo_busca, data_busca, resultado, resultado_hash
+            FROM {esquema}.historico_buscas WHERE id = ?
+        ''', (historico_id,))
+        r = cursor.fetchone()
+        if not r:
+            return None
+        # Linhas ainda não compactadas guardam o texto diretamente
+        resultado = self._ler_blob(cursor, r[5], esquema) if r[5] else r[4]
+        return r[:4] + (resultado,)
+    
+    def _banco(self, tabela: str) -> str:
+        """Banco (ver BANCOS) em que `tabela` é gravada"""
+        return 'telemetria' if tabela in self.TABELAS_TELEMETRIA else 'principal'
+    
+    def _esquema(self, tabela: str) -> str:
+        """Esquema de `tabela` nas consultas qualificadas feitas pela conexão do banco principal"""
+        return self.ESQUEMA_TELEMETRIA if self._banco(tabela) == 'telemetria' else self.ESQUEMA
+    
+    # Meses arquivados fora das tabelas (ver Database.arquivar): as leituras, os contadores e a
+    # limpeza também os percorrem. Por padrão o backend não tem nenhum
+    
+    def _arquivos(self, conn, tabela: str) -> List[tuple]:
+        """(mes, data_min, data_max, id_min, id_max) de cada mês arquivado de `tabela`"""
+        return []
+    
+    def _anexar(self, mes: str) -> Optional[str]:
+        """Esquema em que a conexão da thread lê as linhas arquivadas de `mes` (None se não houver); pede um _liberar"""
+        return None
+    
+    def _liberar(self, esquema: str):
+        """Encerra um uso do esquema obtido em _anexar"""
+    
+    def _ler_arquivo(self, mes: str, consulta: Callable[[str], Iterable]) -> Iterator:
+        """Itera consulta(esquema) com o arquivo mensal de `mes` anexado; libera o anexo ao terminar"""
+        esquema = self._anexar(mes)
+        if esquema is None:
+            return
         try:
-            if os.path.exists(nome_banco):
-                os.remove(nome_banco)
-                return {
-                    'sucesso': True,
-                    'mensagem': f'Banco de dados "{nome_banco}" deletado com sucesso!'
-                }
-            else:
-                return {
-                    'sucesso': False,
-                    'mensagem': f'Banco de dados "{nome_banco}" não encontrado!'
-                }
-        except Exception as e:
-            return {
-                'sucesso': False,
-                'mensagem': f'Erro ao deletar banco: {str(e)}'
-            }
+            yield from consulta(esquema)
+        finally:
+            self._liberar(esquema)
+    
+    def _percorrer_arquivos(self, cursor: sqlite3.Cursor, tabela: str) -> Iterator[str]:
+        """Anexa, um de cada vez, os arquivos mensais de `tabela` e entrega o esquema de cada um"""
+        try:
+            meses = [mes for mes, _, _, _, _ in self._arquivos(cursor, tabela)]
+        except sqlite3.OperationalError:
+            return  # antes da migração 8 (ex.: _recontar da migração 4) não há arquivos
+        for mes in meses:
+            esquema = self._anexar(mes)
+            if esquema is None:
+                continue
+            try:
+                yield esquema
+            finally:
+                self._liberar(esquema)
     
     def obter_info_banco(self) -> Dict:
         """Obtém informações sobre o banco de dados atual"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # Contar registros em cada tabela
-            cursor.execute('SELECT COUNT(*) FROM nome_buscas')
-            total_nomes = cursor.fetchone()[0]
+            # Contagens mantidas por triggers (tempo constante)
+            contadores = self.obter_contadores()
+            total_nomes = contadores['nome_buscas']
+            total_processos = contadores['processo_buscas']
+            total_fotos = contadores['foto_buscas']
+            total_historico = contadores['historico_buscas']
             
-            cursor.execute('SELECT COUNT(*) FROM processo_buscas')
-            total_processos = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM foto_buscas')
-            total_fotos = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM historico_buscas')
-            total_historico = cursor.fetchone()[0]
-            
-            # Tamanho do arquivo
-            tamanho = os.path.getsize(self.db_name) if os.path.exists(self.db_name) else 0
-            tamanho_mb = tamanho / (1024 * 1024)
-            
-            conn.close()
+            tamanho_mb = self._tamanho_banco() / (1024 * 1024)
             
             return {
                 'nome': self.db_name,
@@ -381,104 +1153,306 @@ class Database:
                 'erro': str(e)
             }
     
-    def limpar_banco(self, tabela: str = None) -> Dict:
-        """Limpa dados do banco de dados"""
-        try:
-            conn = self.get_connection()
+    def obter_contadores(self) -> Dict[str, int]:
+        """Retorna o total de linhas de cada tabela contada, sem varrer as tabelas"""
+        with self.conexao() as conn:
             cursor = conn.cursor()
-            
+            cursor.execute('SELECT tabela, total FROM contadores')
+            contadores = dict(cursor.fetchall())
+        return {tabela: contadores.get(tabela, 0) for tabela in self.TABELAS_CONTADAS}
+    
+    def obter_contadores_usuario(self, usuario_id: int) -> Dict[str, int]:
+        """Retorna {tipo_busca: total} das buscas feitas pelo usuário (uma consulta pela chave primária)"""
+        with self.conexao() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT tipo_busca, total FROM contadores_usuario WHERE usuario_id = ?', (usuario_id,))
+            return dict(cursor.fetchall())
+    
+    def reconstruir_contadores(self) -> Dict:
+        """
+        Verificação de consistência: recalcula os contadores (por tabela e por usuário) a partir das tabelas.
+        Retorna as diferenças encontradas (e corrigidas) por tabela; vazio se estava tudo certo.
+        A recontagem roda com o lock de escrita (transacao): nenhum INSERT concorrente, com os
+        triggers dos contadores, entra entre a contagem e a gravação.
+        """
+        def gravar():
+            with self.transacao() as conn:
+                self.registrar_escrita('buscas')
+                return self._recontar(conn.cursor()), self._recontar_usuarios(conn.cursor())
+        
+        try:
+            diferencas, usuarios_corrigidos = self._repetir_se_travado(gravar)
+            return {'sucesso': True, 'diferencas': diferencas, 'usuarios_corrigidos': usuarios_corrigidos}
+        except Exception as e:
+            return {'sucesso': False, 'erro': str(e)}
+    
+    def limpar_banco(self, tabela: str = None, desde: str = None, ate: str = None, lote: int = None,
+                     pausa_ms: float = None, progresso: Callable[[str, int, float], None] = None) -> Dict:
+        """
+        Apaga as buscas de uma tabela (ou das quatro), só as de data_busca em [desde, ate) quando informados,
+        no banco principal e nos arquivos mensais. A remoção é feita em faixas de `lote` ids com commit e uma
+        pausa entre elas (LIMPEZA_LOTE / LIMPEZA_PAUSA_MS), para as gravações dos workers seguirem durante a
+        limpeza; no fim, as páginas livres voltam ao sistema (_devolver_espaco).
+        progresso(tabela, linhas apagadas, fração da faixa de ids percorrida) é chamado após cada faixa.
+        """
+        try:
             # Tabelas permitidas (prevenção de SQL injection)
             tabelas_permitidas = ['nome_buscas', 'processo_buscas', 'foto_buscas', 'historico_buscas']
             
-            if tabela:
-                if tabela not in tabelas_permitidas:
-                    return {
-                        'sucesso': False,
-                        'mensagem': f'Tabela "{tabela}" não é permitida!'
-                    }
-                cursor.execute(f'DELETE FROM {tabela}')
-                conn.commit()
-                conn.close()
-                return {
-                    'sucesso': True,
-                    'mensagem': f'Tabela "{tabela}" limpa com sucesso!'
-                }
-            else:
-                # Limpar todas as tabelas
-                cursor.execute('DELETE FROM nome_buscas')
-                cursor.execute('DELETE FROM processo_buscas')
-                cursor.execute('DELETE FROM foto_buscas')
-                cursor.execute('DELETE FROM historico_buscas')
-                conn.commit()
-                conn.close()
+            if tabela and tabela not in tabelas_permitidas:
                 return {
-                    'sucesso': True,
-                    'mensagem': 'Todos os dados foram limpos com sucesso!'
+                    'sucesso': False,
+                    'mensagem': f'Tabela "{tabela}" não é permitida!'
                 }
+            
+            apagadas = {}
+            for nome in [tabela] if tabela else tabelas_permitidas:
+                apagadas[nome] = self._apagar_em_lotes(nome, 'data_busca', desde, ate, lote, pausa_ms, progresso)
+            liberadas = self._devolver_espaco()
+            return {
+                'sucesso': True,
+                'mensagem': f'Tabela "{tabela}" limpa com sucesso!' if tabela else 'Todos os dados foram limpos com sucesso!',
+                'apagadas': apagadas,
+                'paginas_liberadas': liberadas
+            }
         except Exception as e:
             return {
                 'sucesso': False,
                 'mensagem': f'Erro ao limpar banco: {str(e)}'
             }
     
+    def _apagar_em_lotes(self, tabela: str, coluna_data: str, desde: Optional[str], ate: Optional[str],
+                         lote: int = None, pausa_ms: float = None, progresso: Callable = None) -> int:
+        """
+        Apaga de `tabela` (banco principal e meses arquivados que cruzam o intervalo) as linhas com
+        coluna_data em [desde, ate) (None = sem limite), uma faixa de `lote` ids por transação.
+        No banco principal os triggers descontam os contadores; nos arquivos o desconto é feito aqui.
+        Sem `progresso`, registra o andamento no log a cada 5 s. Retorna as linhas apagadas.
+        """
+        lote = lote or int(os.getenv('LIMPEZA_LOTE', 2000))
+        pausa = (pausa_ms if pausa_ms is not None else float(os.getenv('LIMPEZA_PAUSA_MS', 20))) / 1000
+        dominio = 'ips' if tabela == 'ip_logs' else 'buscas'
+        filtro, parametros = '', []
+        if desde:
+            filtro += f' AND {coluna_data} >= ?'
+            parametros.append(desde)
+        if ate:
+            filtro += f' AND {coluna_data} < ?'
+            parametros.append(ate)
+        hashes = [coluna_hash for outra, _, coluna_hash in self.COLUNAS_BLOB if outra == tabela]
+        
+        with self.conexao() as conn:
+            meses = [None] + [mes for mes, data_min, data_max, _, _ in self._arquivos(conn, tabela)
+                              if (not ate or data_min < ate) and (not desde or data_max >= desde)]
+        
+        apagadas = 0
+        proximo_log = time.monotonic() + 5
+        for mes in meses:
+            # Meses arquivados pela conexão do banco principal, em que estão anexados; o resto no banco da tabela
+            banco = 'principal' if mes else self._banco(tabela)
+            esquema = self._anexar(mes) if mes else self.ESQUEMA
+            if esquema is None:
+                continue
+            try:
+                # Faixa de ids das linhas a apagar; com intervalo de datas, vem do índice da data
+                with self.conexao(banco) as conn:
+                    id_min = conn.execute(f'SELECT MIN(id) FROM {esquema}.{tabela} WHERE 1 = 1 {filtro}', parametros).fetchone()[0]
+                    id_max = conn.execute(f'SELECT MAX(id) FROM {esquema}.{tabela} WHERE 1 = 1 {filtro}', parametros).fetchone()[0]
+                inicio = id_min
+                while id_min is not None and inicio <= id_max:
+                    faixa = [inicio, inicio + lote] + parametros
+                    with self.transacao(banco) as conn:
+                        self.registrar_escrita(dominio)
+                        usados = set()
+                        for coluna_hash in hashes:
+                            usados.update(h for (h,) in conn.execute(f'''
+                                SELECT {coluna_hash} FROM {esquema}.{tabela}
+                                WHERE id >= ? AND id < ? {filtro} AND {coluna_hash} IS NOT NULL
+                            ''', faixa))
+                        por_usuario = Counter()
+                        if mes and tabela == 'historico_buscas':
+                            por_usuario.update(conn.execute(f'''
+                                SELECT usuario_id, tipo_busca FROM {esquema}.historico_buscas
+                                WHERE id >= ? AND id < ? {filtro} AND usuario_id IS NOT NULL
+                            ''', faixa))
+                        removidas = conn.execute(f'''
+                            DELETE FROM {esquema}.{tabela} WHERE id >= ? AND id < ? {filtro}
+                        ''', faixa).rowcount
+                        if mes and removidas:
+                            # Linhas arquivadas continuavam nos contadores e no registro do mês
+                            if tabela in self.TABELAS_CONTADAS:
+                                conn.execute('UPDATE contadores SET total = total - ? WHERE tabela = ?', (removidas, tabela))
+                            conn.executemany('''
+                                UPDATE contadores_usuario SET total = total - ? WHERE usuario_id = ? AND tipo_busca = ?
+                            ''', [(total, usuario_id, tipo) for (usuario_id, tipo), total in por_usuario.items()])
+                            conn.execute('UPDATE arquivos SET linhas = linhas - ? WHERE tabela = ? AND mes = ?',
+                                         (removidas, tabela, mes))
+                        if hashes:
+                            self._apagar_blobs_sem_uso(conn, esquema, usados)
+                    apagadas += removidas
+                    inicio += lote
+                    fracao = min(1.0, (inicio - id_min) / (id_max - id_min + 1))
+                    if progresso:
+                        progresso(tabela, apagadas, fracao)
+                    elif time.monotonic() >= proximo_log:
+                        print(f"Purging {tabela}{f' ({mes})' if mes else ''}: {apagadas} rows deleted, {fracao:.0%}")
+                        proximo_log = time.monotonic() + 5
+                    # A pausa deixa as escritas que esperam o lock entrarem entre duas faixas
+                    if inicio <= id_max and pausa > 0:
+                        time.sleep(pausa)
+            finally:
+                if mes:
+                    self._liberar(esquema)
+        if len(meses) > 1:
+            with self.conexao() as conn:
+                conn.execute('DELETE FROM arquivos WHERE tabela = ? AND linhas <= 0', (tabela,))
+        return apagadas
+    
+    def _apagar_blobs_sem_uso(self, conn: sqlite3.Connection, esquema: str, hashes: Iterable[str]):
+        """Apaga de esquema.blobs os `hashes` que nenhuma linha do mesmo banco usa mais"""
+        sem_uso = ' '.join(f'AND NOT EXISTS (SELECT 1 FROM {esquema}.{tabela} WHERE {coluna_hash} = blobs.hash)'
+                           for tabela, _, coluna_hash in self.COLUNAS_BLOB)
+        conn.executemany(f'DELETE FROM {esquema}.blobs WHERE hash = ? {sem_uso}', [(h,) for h in hashes])
+    
     def registrar_ip(self, ip_address: str, user_agent: str = '', path: str = '', method: str = '', user_id: str = None, session_id: str = None, country: str = None, city: str = None):
         """Registra acesso de um IP"""
+        # Mesmo formato de CURRENT_TIMESTAMP (UTC)
+        data_acesso = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        self.registrar_ips_lote([(ip_address, user_agent, path, method, user_id, session_id, country, city, data_acesso)])
+    
+    def registrar_ips_lote(self, registros: List[tuple]) -> int:
+        """
+        Registra vários acessos em uma única transação, que só grava no banco de telemetria
+        (não espera o lock de escrita do banco principal) e é repetida se ele estiver travado.
+        Esgotadas as tentativas (ver _repetir_se_travado), registra o erro no log.
+        Cada registro: (ip_address, user_agent, path, method, user_id, session_id, country, city, data_acesso)
+        Retorna o número de registros gravados.
+        """
+        # Sem registrar_escrita('ips'): um lote chega a cada poucas requisições e a geração nunca
+        # ficaria parada; as estatísticas de IPs ficam em cache só pelo TTL (ver admin_ip_stats)
+        def gravar():
+            with self.transacao('telemetria') as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    INSERT INTO ip_logs (ip_address, user_agent, path, method, user_id, session_id, country, city, data_acesso)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', registros)
+                return self._atualizar_rollups_ip(cursor, ((r[0], r[8]) for r in registros))
+        
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO ip_logs (ip_address, user_agent, path, method, user_id, session_id, country, city)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (ip_address, user_agent, path, method, user_id, session_id, country, city))
-            conn.commit()
-            conn.close()
+            hora_nova = self._repetir_se_travado(gravar)
         except Exception as e:
-            print(f"Error logging IP: {e}")
+            print(f"Error logging IPs: {e}")
+            return 0
+        if hora_nova:
+            # Uma vez por hora: o lote que abriu a hora consolida as que saíram da janela
+            try:
+                self._consolidar_rollups_ip()
+            except Exception as e:
+                print(f"Error consolidating IP rollups: {e}")
+        return len(registros)
+    
+    # Horas mantidas em ip_rollup_hora antes de irem para ip_rollup_dia e ip_rollup_total:
+    # a janela de acessos_24h (obter_estatisticas_ips)
+    JANELA_ROLLUP_HORAS = 24
+    
+    def _atualizar_rollups_ip(self, cursor, acessos: Iterable[Tuple[str, str]]) -> bool:
+        """
+        Soma acessos (ip_address, data_acesso) no rollup por hora, na transação de `cursor`; dia e
+        total vêm dele quando as horas são consolidadas. Retorna True se alguma hora foi criada.
+        """
+        horas = {}
+        for ip_address, data_acesso in acessos:
+            hora = horas.setdefault(data_acesso[:13], [0, HyperLogLog()])
+            hora[0] += 1
+            hora[1].adicionar(ip_address or '')
+        # Sempre na mesma ordem: transações concorrentes travam as linhas sem esperar uma pela outra
+        criadas = [self._somar_rollup(cursor, 'ip_rollup_hora', 'hora', chave, *horas[chave]) for chave in sorted(horas)]
+        return any(criadas)
+    
+    @repetir_se_travado
+    def _consolidar_rollups_ip(self) -> int:
+        """
+        Move as horas anteriores à janela de JANELA_ROLLUP_HORAS de ip_rollup_hora para ip_rollup_dia e
+        ip_rollup_total, em uma transação. Uma hora que volte a receber acessos atrasados é recriada
+        e consolidada na próxima vez: o total é sempre ip_rollup_total mais as horas restantes.
+        Retorna as horas consolidadas.
+        """
+        corte = (datetime.now(timezone.utc) - timedelta(hours=self.JANELA_ROLLUP_HORAS)).strftime('%Y-%m-%d %H')
+        with self.transacao('telemetria') as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT hora, total, visitantes FROM ip_rollup_hora WHERE hora < ? ORDER BY hora{self.TRAVAR_LINHAS}',
+                           (corte,))
+            antigas = cursor.fetchall()
+            if not antigas:
+                return 0
+            dias = {}
+            total, visitantes = 0, HyperLogLog()
+            for hora, acessos, sketch in antigas:
+                sketch = HyperLogLog.de_bytes(sketch)
+                dia = dias.setdefault(hora[:10], [0, HyperLogLog()])
+                dia[0] += acessos
+                dia[1].unir(sketch)
+                total += acessos
+                visitantes.unir(sketch)
+            for chave in sorted(dias):
+                self._somar_rollup(cursor, 'ip_rollup_dia', 'dia', chave, *dias[chave])
+            self._somar_rollup(cursor, 'ip_rollup_total', 'id', 1, total, visitantes)
+            cursor.execute('DELETE FROM ip_rollup_hora WHERE hora < ?', (corte,))
+        return len(antigas)
+    
+    def podar_ip_logs(self, dias: int = None, lote: int = 5000) -> int:
+        """
+        Remove as linhas de ip_logs mais antigas que `dias`, no banco de telemetria e nos arquivos mensais,
+        em faixas de ids com commit entre elas (ver _apagar_em_lotes), e devolve o espaço com
+        _devolver_espaco. As linhas já estão contabilizadas nos rollups desde a inserção, então as
+        estatísticas não mudam. Sem `dias`, usa IP_LOGS_RETENCAO_DIAS (0 ou ausente = manter tudo).
+        Retorna as linhas removidas.
+        """
+        if dias is None:
+            dias = int(os.getenv('IP_LOGS_RETENCAO_DIAS', 0))
+        if dias <= 0:
+            return 0
+        
+        corte = (datetime.now(timezone.utc) - timedelta(days=dias)).strftime('%Y-%m-%d %H:%M:%S')
+        removidas = self._apagar_em_lotes('ip_logs', 'data_acesso', None, corte, lote)
+        
+        # Horas que nenhum lote novo consolidou (ex.: sem acessos desde então)
+        self._consolidar_rollups_ip()
+        if removidas:
+            self._devolver_espaco()
+        return removidas
     
     def obter_ips_recentes(self, limite: int = 100) -> List[Dict]:
         """Obtém IPs recentes"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM ip_logs 
-                ORDER BY data_acesso DESC 
-                LIMIT ?
-            ''', (limite,))
-            results = cursor.fetchall()
-            conn.close()
-            
-            return [{
-                'id': r[0],
-                'ip_address': r[1],
-                'user_agent': r[2],
-                'path': r[3],
-                'method': r[4],
-                'user_id': r[5],
-                'session_id': r[6],
-                'data_acesso': r[7],
-                'country': r[8],
-                'city': r[9]
-            } for r in results]
+            return list(self.iterar_ips(limite=limite))
         except Exception as e:
             return []
     
     def obter_estatisticas_ips(self) -> Dict:
         """Obtém estatísticas de IPs"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT COUNT(DISTINCT ip_address) FROM ip_logs')
-            ips_unicos = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM ip_logs')
-            total_acessos = cursor.fetchone()[0]
+            # Lê apenas os rollups: custo constante, independente do tamanho de ip_logs. As horas
+            # ainda não consolidadas (uma janela, ver _consolidar_rollups_ip) somam-se ao total, na
+            # mesma consulta para uma consolidação concorrente não ser contada duas vezes
+            with self.conexao() as conn:
+                linhas = conn.execute('''
+                    SELECT NULL, total, visitantes FROM ip_rollup_total WHERE id = 1
+                    UNION ALL
+                    SELECT hora, total, visitantes FROM ip_rollup_hora
+                ''').fetchall()
             
-            cursor.execute('SELECT COUNT(*) FROM ip_logs WHERE data_acesso > datetime("now", "-24 hours")')
-            acessos_24h = cursor.fetchone()[0]
-            
-            conn.close()
+            # Janela por hora cheia: inclui a hora corrente e a de 24h atrás
+            janela = (datetime.now(timezone.utc) - timedelta(hours=self.JANELA_ROLLUP_HORAS)).strftime('%Y-%m-%d %H')
+            total_acessos, acessos_24h, visitantes = 0, 0, HyperLogLog()
+            for hora, total, sketch in linhas:
+                total_acessos += total
+                if hora is not None and hora >= janela:
+                    acessos_24h += total
+                if sketch:
+                    visitantes.unir(HyperLogLog.de_bytes(sketch))
+            ips_unicos = visitantes.estimativa() if linhas else 0
             
             return {
                 'ips_unicos': ips_unicos,
@@ -490,32 +1464,32 @@ class Database:
     
     def criar_usuario(self, email: str, nome: str = '', senha_hash: str = None, google_id: str = None, permissao: str = 'user') -> Dict:
         """Cria um novo usuário"""
+        def gravar():
+            with self.transacao() as conn:
+                self.registrar_escrita('usuarios')
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO usuarios (email, nome, senha_hash, google_id, permissao)
+                    VALUES (?, ?, ?, ?, ?) RETURNING id
+                ''', (email, nome, senha_hash, google_id, permissao))
+                return cursor.fetchone()[0]
+        
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO usuarios (email, nome, senha_hash, google_id, permissao)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (email, nome, senha_hash, google_id, permissao))
-            conn.commit()
-            user_id = cursor.lastrowid
-            conn.close()
-            return {'sucesso': True, 'id': user_id}
+            return {'sucesso': True, 'id': self._repetir_se_travado(gravar)}
         except Exception as e:
             return {'sucesso': False, 'erro': str(e)}
     
     def obter_usuario_por_email(self, email: str) -> Optional[Dict]:
         """Obtém usuário por email"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            # Usar nomes de colunas explicitamente para evitar problemas de ordem
-            cursor.execute('''
-                SELECT id, email, nome, google_id, permissao, ip_whitelist, ativo, data_criacao, ultimo_acesso, senha_hash
-                FROM usuarios WHERE email = ?
-            ''', (email,))
-            result = cursor.fetchone()
-            conn.close()
+            with self.conexao() as conn:
+                cursor = conn.cursor()
+                # Usar nomes de colunas explicitamente para evitar problemas de ordem
+                cursor.execute('''
+                    SELECT id, email, nome, google_id, permissao, ip_whitelist, ativo, data_criacao, ultimo_acesso, senha_hash
+                    FROM usuarios WHERE email = ?
+                ''', (email,))
+                result = cursor.fetchone()
             
             if result:
                 return {
@@ -535,23 +1509,46 @@ class Database:
             print(f"Error getting user: {e}")
             return None
     
+    def atualizar_ultimos_acessos(self, acessos: Iterable[Tuple[str, str]]):
+        """Grava ultimo_acesso de vários usuários em uma transação; cada item: (email, data_acesso)"""
+        valores = [(data_acesso, email) for email, data_acesso in acessos]
+        
+        def gravar():
+            with self.transacao() as conn:
+                self.registrar_escrita('usuarios')
+                conn.executemany('UPDATE usuarios SET ultimo_acesso = ? WHERE email = ?', valores)
+        
+        self._repetir_se_travado(gravar)
+    
+    @repetir_se_travado
+    def atualizar_senha(self, email: str, senha_hash: str) -> bool:
+        """Grava o novo hash de senha do usuário; retorna False se o email não existe"""
+        with self.transacao() as conn:
+            self.registrar_escrita('usuarios')
+            cursor = conn.execute('UPDATE usuarios SET senha_hash = ? WHERE email = ?', (senha_hash, email))
+            return cursor.rowcount == 1
+    
     def atualizar_permissao(self, email: str, permissao: str, atribuido_por: str) -> Dict:
         """Atualiza permissão de um usuário"""
+        def gravar():
+            with self.transacao() as conn:
+                self.registrar_escrita('usuarios')
+                cursor = conn.cursor()
+                
+                # Atualizar permissão
+                cursor.execute('UPDATE usuarios SET permissao = ? WHERE email = ?', (permissao, email))
+                
+                # Registrar na tabela de permissões
+                cursor.execute('''
+                    INSERT INTO permissoes (email, permissao, atribuido_por)
+                    VALUES (?, ?, ?)
+                ''', (email, permissao, atribuido_por))
+                
+                # Invalida os caches de permissão de todos os processos
+                self._incrementar_versao(cursor, 'permissoes')
+        
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # Atualizar permissão
-            cursor.execute('UPDATE usuarios SET permissao = ? WHERE email = ?', (permissao, email))
-            
-            # Registrar na tabela de permissões
-            cursor.execute('''
-                INSERT INTO permissoes (email, permissao, atribuido_por)
-                VALUES (?, ?, ?)
-            ''', (email, permissao, atribuido_por))
-            
-            conn.commit()
-            conn.close()
+            self._repetir_se_travado(gravar)
             return {'sucesso': True}
         except Exception as e:
             return {'sucesso': False, 'erro': str(e)}
@@ -559,14 +1556,13 @@ class Database:
     def listar_usuarios(self) -> List[Dict]:
         """Lista todos os usuários"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, email, nome, google_id, permissao, ip_whitelist, ativo, data_criacao, ultimo_acesso, senha_hash
-                FROM usuarios ORDER BY data_criacao DESC
-            ''')
-            results = cursor.fetchall()
-            conn.close()
+            with self.conexao() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, email, nome, google_id, permissao, ip_whitelist, ativo, data_criacao, ultimo_acesso, senha_hash
+                    FROM usuarios ORDER BY data_criacao DESC
+                ''')
+                results = cursor.fetchall()
             
             return [{
                 'id': r[0],
@@ -583,3 +1579,887 @@ class Database:
         except Exception as e:
             return []
 
+class Database(Armazenamento):
+    """
+    Armazenamento do app em SQLite (um arquivo local e, ao lado dele, o banco de telemetria).
+    Além do contrato comum, tem os recursos só do SQLite: arquivos mensais (arquivar), backup
+    online e snapshots (backup, snapshot) e vacuum incremental.
+    """
+    
+    # PRAGMAs aplicados uma única vez, quando a conexão é aberta
+    PRAGMAS = (
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'FULL'),  # usuários, permissões e buscas: fsync a cada commit
+        ('busy_timeout', 5000),
+        ('cache_size', -16000),  # ~16 MB de cache de páginas
+        ('mmap_size', 134217728),  # 128 MB
+    )
+    
+    # Tabelas cujas linhas antigas vão para os arquivos mensais (ver arquivar): (tabela, coluna de data)
+    TABELAS_ARQUIVADAS = (
+        ('historico_buscas', 'data_busca'),
+        ('nome_buscas', 'data_busca'),
+        ('processo_buscas', 'data_busca'),
+        ('foto_buscas', 'data_busca'),
+        ('cpf_buscas', 'data_busca'),
+        ('ip_logs', 'data_acesso'),
+    )
+    
+    # Arquivos mensais anexados ao mesmo tempo por conexão (o SQLite aceita até 10 bancos anexados,
+    # um deles o de telemetria)
+    ARQUIVOS_ANEXADOS_MAX = 8
+    
+    # Mês de um arquivo mensal (AAAA-MM), usado no nome do arquivo e do esquema anexado
+    MES_ARQUIVO = re.compile(r'\d{4}-\d{2}')
+    
+    # Esquema das tabelas do banco principal nas consultas qualificadas (esquema.tabela)
+    ESQUEMA = 'main'
+    # Valor de LIMIT que não limita (o PostgreSQL usa NULL)
+    SEM_LIMITE = -1
+    # BEGIN IMMEDIATE já trava o banco inteiro (ver transacao)
+    TRAVAR_LINHAS = ''
+    # Arquivos mensais (ver arquivar) e snapshots pela API de backup online (ver snapshot)
+    ARQUIVOS = True
+    SNAPSHOTS = True
+    
+    # Telemetria, gravada a cada requisição: fica em um arquivo próprio (caminho_telemetria), com lock
+    # de escrita e durabilidade próprios. As escritas usam conexao('telemetria'); as conexões do banco
+    # principal o anexam só para leitura, como o ESQUEMA_TELEMETRIA abaixo, e nomes sem esquema resolvem para ele
+    BANCOS = ('principal', 'telemetria')
+    ESQUEMA_TELEMETRIA = 'telemetria'
+    
+    # PRAGMAs das conexões de escrita do banco de telemetria. Perder os últimos acessos em uma queda
+    # de energia é aceitável: synchronous vem de TELEMETRIA_SYNCHRONOUS (NORMAL, o padrão, tira o fsync
+    # do commit; OFF também o do checkpoint) e o WAL cresce mais antes de cada checkpoint
+    PRAGMAS_TELEMETRIA = (
+        ('journal_mode', 'WAL'),
+        ('busy_timeout', 5000),
+        ('wal_autocheckpoint', 4000),  # páginas: ~16 MB, contra ~4 MB do padrão
+    )
+    SYNCHRONOUS_TELEMETRIA = ('NORMAL', 'OFF')
+    
+    def __init__(self, db_name: str = "osint_database.db"):
+        self.db_name = db_name
+        # Caminho absoluto: threads em segundo plano continuam no mesmo arquivo mesmo se o cwd mudar
+        self.caminho = os.path.abspath(db_name)
+        self.caminho_telemetria = caminho_telemetria(self.caminho)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conexoes = {}  # (ident da thread, banco) -> (thread, conexão)
+        self._geracoes = {}  # domínio -> geração de escrita (ver registrar_escrita)
+        # Arquivos mensais: <pasta>/<nome do banco>_AAAA-MM.db (ver arquivar)
+        self.pasta_arquivos = os.path.abspath(os.getenv('ARQUIVO_DIR') or
+                                              os.path.join(os.path.dirname(self.caminho), 'arquivo'))
+        # Snapshots: <pasta>/<nome do banco>_AAAAMMDD-HHMMSS.db (ver snapshot)
+        self.pasta_backups = os.path.abspath(os.getenv('BACKUP_DIR') or
+                                             os.path.join(os.path.dirname(self.caminho), 'backups'))
+        self.init_database()
+    
+    def _abrir_conexao(self, banco: str = 'principal') -> sqlite3.Connection:
+        """
+        Abre uma conexão nova com `banco` (ver BANCOS), instrumentada se as métricas estiverem ativas,
+        e aplica os PRAGMAs. As do banco principal anexam o de telemetria (ver _anexar_telemetria).
+        """
+        if banco == 'principal':
+            caminho, pragmas = self.caminho, self.PRAGMAS
+        else:
+            synchronous = os.getenv('TELEMETRIA_SYNCHRONOUS', 'NORMAL').upper()
+            if synchronous not in self.SYNCHRONOUS_TELEMETRIA:
+                raise ValueError(f"TELEMETRIA_SYNCHRONOUS must be one of {', '.join(self.SYNCHRONOUS_TELEMETRIA)}")
+            caminho, pragmas = self.caminho_telemetria, self.PRAGMAS_TELEMETRIA + (('synchronous', synchronous),)
+        fabrica = ConexaoMedida if metricas.ativo else sqlite3.Connection
+        novo = not os.path.exists(caminho) or os.path.getsize(caminho) == 0
+        # uri: o ATTACH do banco de telemetria usa file:...?mode=ro
+        conn = sqlite3.connect(caminho, check_same_thread=False, cached_statements=256, factory=fabrica, uri=True)
+        if metricas.ativo:
+            conn.set_trace_callback(metricas.rastrear)
+        metricas.conexao_aberta()
+        if novo:
+            # Só vale antes do WAL e da primeira tabela (em um banco com tabelas, o PRAGMA pede o
+            # lock de escrita); bancos existentes passam a INCREMENTAL com ativar_vacuum_incremental
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        for pragma, valor in pragmas:
+            conn.execute(f'PRAGMA {pragma} = {valor}')
+        if banco == 'principal':
+            self._anexar_telemetria(conn)
+        return conn
+    
+    def _anexar_telemetria(self, conn: sqlite3.Connection):
+        """
+        Anexa o banco de telemetria, só para leitura, a uma conexão recém-aberta do banco principal
+        (ATTACH não roda dentro de uma transação). Somente leitura, ele fica fora dos locks de escrita
+        dessa conexão (um BEGIN IMMEDIATE trava todos os bancos anexados graváveis): uma rajada de logs
+        de acesso não atrasa logins e permissões, nem o contrário. É sempre o primeiro anexo, então
+        nomes sem esquema resolvem para ele antes dos arquivos mensais, anexados depois.
+        Escritas nele passam por conexao('telemetria'), e PRAGMAs que gravam em todos os bancos da
+        conexão (ex.: wal_checkpoint) precisam do esquema main aqui, ou falham no anexo.
+        """
+        if not os.path.exists(self.caminho_telemetria):
+            # Somente leitura não cria o arquivo
+            self._abrir_conexao('telemetria').close()
+        uri = 'file:' + urllib.parse.quote(self.caminho_telemetria) + '?mode=ro'
+        conn.execute(f'ATTACH DATABASE ? AS {self.ESQUEMA_TELEMETRIA}', (uri,))
+    
+    def get_connection(self):
+        """Cria e retorna uma conexão avulsa com o banco de dados (o chamador deve fechá-la)"""
+        return self._abrir_conexao()
+    
+    def _conexao_da_thread(self, banco: str = 'principal') -> sqlite3.Connection:
+        """Retorna a conexão reutilizável da thread atual com `banco`, abrindo-a se necessário"""
+        conexoes = getattr(self._local, 'conexoes', None)
+        if conexoes is None:
+            conexoes = self._local.conexoes = {}
+            self._local.profundidade = dict.fromkeys(self.BANCOS, 0)
+            self._local.escritas = set()
+            self._local.anexados = OrderedDict()  # esquema do arquivo mensal -> leituras em andamento
+        conn = conexoes.get(banco)
+        if conn is None:
+            conn = conexoes[banco] = self._abrir_conexao(banco)
+            thread = threading.current_thread()
+            with self._lock:
+                # Fechar conexões de threads que já terminaram (a thread principal aparece
+                # como encerrada durante o atexit, quando os gravadores ainda fazem flush)
+                for chave, (outra, outra_conn) in list(self._conexoes.items()):
+                    if not outra.is_alive() and outra is not threading.main_thread():
+                        outra_conn.close()
+                        del self._conexoes[chave]
+                self._conexoes[(thread.ident, banco)] = (thread, conn)
+        return conn
+    
+    @contextmanager
+    def conexao(self, banco: str = 'principal'):
+        """
+        Fornece a conexão reutilizável da thread atual com `banco`: o principal ou, para gravar nas
+        TABELAS_TELEMETRIA, 'telemetria'. Blocos aninhados do mesmo banco compartilham a mesma
+        transação: o commit acontece ao sair do bloco mais externo e qualquer exceção desfaz a
+        transação inteira. Cada banco tem a sua transação.
+        """
+        conn = self._conexao_da_thread(banco)
+        profundidade = self._local.profundidade
+        profundidade[banco] += 1
+        try:
+            yield conn
+        except BaseException:
+            profundidade[banco] -= 1
+            if profundidade[banco] == 0:
+                conn.rollback()
+                self._local.escritas.clear()
+            raise
+        profundidade[banco] -= 1
+        if profundidade[banco] == 0:
+            try:
+                conn.commit()
+            except BaseException:
+                # Um COMMIT recusado (ex.: SQLITE_BUSY) deixaria a transação aberta, e quem repete
+                # a escrita somaria as linhas desta tentativa às da próxima
+                conn.rollback()
+                self._local.escritas.clear()
+                raise
+            self._publicar_escritas()
+    
+    @contextmanager
+    def transacao(self, banco: str = 'principal'):
+        """
+        Unidade de trabalho: todas as escritas do bloco em `banco` (ver conexao) vão em uma
+        única transação, com um único commit no final (ou rollback se houver exceção).
+        BEGIN IMMEDIATE pega o lock de escrita já no início, esperando por ele até o busy_timeout:
+        uma transação que lesse antes de escrever receberia SQLITE_BUSY na hora, sem espera, se
+        outra conexão gravasse entre a leitura e a escrita. A espera vai para as métricas.
+        """
+        with self.conexao(banco) as conn:
+            if not conn.in_transaction:
+                inicio = time.perf_counter()
+                try:
+                    conn.execute('BEGIN IMMEDIATE')
+                finally:
+                    metricas.espera_lock(banco, time.perf_counter() - inicio)
+            yield conn
+    
+    def reiniciar_apos_fork(self):
+        """
+        Descarta, no processo filho, o estado de conexões herdado do pai (post_fork).
+        Conexões SQLite não podem atravessar um fork; o pai deve fechá-las antes
+        (fechar_conexoes no pre_fork) e cada thread do filho abre a sua no primeiro uso.
+        """
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conexoes = {}
+    
+    def fechar_conexoes(self):
+        """Fecha todas as conexões reutilizáveis abertas por este objeto"""
+        with self._lock:
+            for _, conn in self._conexoes.values():
+                conn.close()
+            self._conexoes.clear()
+        self._local = threading.local()
+    
+    def versao_schema(self) -> int:
+        """Retorna a versão de schema registrada no banco (0 se nunca migrado)"""
+        with self.conexao() as conn:
+            try:
+                return conn.execute('SELECT MAX(versao) FROM schema_version').fetchone()[0] or 0
+            except sqlite3.OperationalError:
+                return 0
+    
+    # Ganchos de backend
+    
+    def _bloquear_migracoes(self, conn):
+        """Serializa as migrações de workers que sobem ao mesmo tempo (BEGIN IMMEDIATE pega o lock de escrita)"""
+        conn.execute('BEGIN IMMEDIATE')
+    
+    def _travado(self, erro: Exception) -> bool:
+        """Erro que vale repetir a transação: SQLITE_BUSY/SQLITE_LOCKED (busy_timeout esgotado ou não aplicável)"""
+        return (isinstance(erro, sqlite3.OperationalError)
+                and (getattr(erro, 'sqlite_errorcode', 0) & 0xff) in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED))
+    
+    def _em_transacao(self) -> bool:
+        """A thread atual está dentro de um bloco conexao(), de qualquer banco"""
+        return any(getattr(self._local, 'profundidade', {}).values())
+    
+    def _colunas(self, cursor, tabela: str) -> List[str]:
+        """Nomes das colunas de `tabela`"""
+        cursor.execute(f'PRAGMA table_info({tabela})')
+        return [coluna[1] for coluna in cursor.fetchall()]
+    
+    def _criar_trigger(self, cursor, nome: str, evento: str, tabela: str, corpo: str, condicao: str = None):
+        """Trigger por linha `evento` (ex.: AFTER INSERT) em `tabela` que executa `corpo` (uma instrução) se `condicao`"""
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {nome} {evento} ON {tabela}
+            {f'WHEN {condicao}' if condicao else ''}
+            BEGIN
+                {corpo};
+            END
+        ''')
+    
+    def _data_menos_segundos(self, expressao: str, segundos: int) -> str:
+        """Expressão SQL da data `expressao` (texto AAAA-MM-DD HH:MM:SS) menos `segundos`, no mesmo formato"""
+        return f"datetime({expressao}, '-{segundos} seconds')"
+    
+    def _conexao_leitura(self):
+        """Conexão das leituras longas (_paginar, iterar_exportacao): a da thread, fora de um bloco conexao()"""
+        return self._conexao_da_thread()
+    
+    def _ler_blocos(self, conn, sql: str, parametros, tamanho: int, servidor: bool = False) -> Iterator[List[tuple]]:
+        """
+        Executa uma consulta só de leitura e entrega as linhas em blocos de até `tamanho` (fetchmany).
+        `servidor` indica um resultado grande, que o PostgreSQL lê por um cursor no servidor.
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, parametros)
+            while True:
+                bloco = cursor.fetchmany(tamanho)
+                if not bloco:
+                    return
+                yield bloco
+        finally:
+            cursor.close()
+    
+    def _tamanho_banco(self) -> int:
+        """Tamanho do banco em bytes (principal e telemetria)"""
+        return sum(os.path.getsize(caminho) for caminho in (self.caminho, self.caminho_telemetria)
+                   if os.path.exists(caminho))
+    
+    def _analisar(self, conn):
+        """ANALYZE das tabelas do banco da conexão (o de telemetria anexado só para leitura fica de fora)"""
+        conn.execute(f'ANALYZE {self.ESQUEMA}')
+    
+    def _somar_rollup(self, cursor: sqlite3.Cursor, tabela: str, coluna: str, chave, total: int,
+                      visitantes: HyperLogLog) -> bool:
+        """
+        Soma acessos em uma linha de rollup. Deve rodar em uma transação de escrita (a do INSERT em
+        ip_logs ou a da consolidação), que já detém o lock do banco entre a leitura e a gravação.
+        """
+        cursor.execute(f'SELECT total, visitantes FROM {tabela} WHERE {coluna} = ?', (chave,))
+        atual = cursor.fetchone()
+        if atual:
+            total += atual[0]
+            visitantes.unir(HyperLogLog.de_bytes(atual[1]))
+        cursor.execute(f'''
+            INSERT INTO {tabela} ({coluna}, total, visitantes) VALUES (?, ?, ?)
+            ON CONFLICT ({coluna}) DO UPDATE SET total = excluded.total, visitantes = excluded.visitantes
+        ''', (chave, total, visitantes.para_bytes()))
+        return atual is None
+    
+    def _devolver_espaco(self) -> int:
+        """Páginas livres de volta ao sistema (vacuum_incremental)"""
+        return self.vacuum_incremental()['liberadas']
+    
+    # Recursos do SQLite
+    
+    def _migracao_009_telemetria(self, cursor: sqlite3.Cursor):
+        """
+        Move ip_logs e os rollups para o banco de telemetria. A cópia (schema, linhas e índices) é
+        confirmada pela conexão do banco de telemetria antes de esta transação apagar as tabelas do
+        principal: uma interrupção entre os dois commits deixa as tabelas nos dois lados e a próxima
+        execução só copia o que falta. As páginas liberadas voltam ao sistema com vacuum_incremental.
+        """
+        tabelas = self.TABELAS_TELEMETRIA
+        schema = cursor.execute(f'''
+            SELECT type, name, sql FROM main.sqlite_master
+            WHERE tbl_name IN ({', '.join('?' * len(tabelas))}) AND type IN ('table', 'index') AND sql IS NOT NULL
+        ''', tabelas).fetchall()
+        # Lidas pela conexão da migração, que já vê as tabelas criadas pelas migrações anteriores
+        # desta transação (em um banco novo, ainda sem commit), e gravadas pela da telemetria
+        with self.conexao('telemetria') as telemetria:
+            existentes = {nome for (nome,) in telemetria.execute('SELECT name FROM sqlite_master')}
+            for tipo, nome, sql in schema:
+                if tipo == 'table' and nome not in existentes:
+                    telemetria.execute(sql)
+            for tabela in tabelas:
+                colunas = [coluna[1] for coluna in cursor.execute(f'PRAGMA main.table_info({tabela})').fetchall()]
+                filtro, parametros = '', ()
+                if tabela == 'ip_logs':
+                    # Ids AUTOINCREMENT só crescem: faltam as linhas acima do maior id já copiado
+                    filtro = 'WHERE id > ?'
+                    parametros = telemetria.execute('SELECT COALESCE(MAX(id), 0) FROM ip_logs').fetchone()
+                for bloco in self._ler_blocos(cursor.connection, f'SELECT {", ".join(colunas)} FROM main.{tabela} {filtro}',
+                                              parametros, 10000):
+                    telemetria.executemany(f'''
+                        INSERT OR REPLACE INTO {tabela} ({", ".join(colunas)}) VALUES ({", ".join("?" * len(colunas))})
+                    ''', bloco)
+            # Índices depois das linhas: montados de uma vez em vez de atualizados a cada INSERT
+            for tipo, nome, sql in schema:
+                if tipo == 'index' and nome not in existentes:
+                    telemetria.execute(sql)
+            self._analisar(telemetria)
+        
+        for tabela in tabelas:
+            cursor.execute(f'DROP TABLE main.{tabela}')
+        cursor.execute("DELETE FROM main.sqlite_sequence WHERE name = 'ip_logs'")
+    
+    def _migracao_011_rollups_por_hora(self, cursor: sqlite3.Cursor):
+        """
+        A migração comum, aplicada pela conexão do banco de telemetria, onde estão os rollups. O commit
+        dela vem antes do desta transação: user_version do banco de telemetria, gravado no mesmo commit,
+        impede que uma interrupção entre os dois faça a próxima execução descontar as horas de novo.
+        """
+        with self.conexao('telemetria') as telemetria:
+            if telemetria.execute('PRAGMA user_version').fetchone()[0] >= 11:
+                return
+            super()._migracao_011_rollups_por_hora(telemetria.cursor())
+            telemetria.execute('PRAGMA user_version = 11')
+    
+    def criar_banco_personalizado(self, nome_banco: str) -> Dict:
+        """Cria um novo banco de dados personalizado"""
+        try:
+            if not nome_banco.endswith('.db'):
+                nome_banco += '.db'
+            
+            # Criar novo banco
+            temp_db = Database(nome_banco)
+            return {
+                'sucesso': True,
+                'mensagem': f'Banco de dados "{nome_banco}" criado com sucesso!',
+                'nome': nome_banco
+            }
+        except Exception as e:
+            return {
+                'sucesso': False,
+                'mensagem': f'Erro ao criar banco: {str(e)}',
+                'nome': nome_banco
+            }
+    
+    def listar_bancos_disponiveis(self) -> List[str]:
+        """Lista todos os arquivos .db no diretório"""
+        import glob
+        bancos = glob.glob("*.db")
+        return bancos
+    
+    def deletar_banco(self, nome_banco: str) -> Dict:
+        """Deleta um banco de dados"""
+        try:
+            if os.path.exists(nome_banco):
+                os.remove(nome_banco)
+                return {
+                    'sucesso': True,
+                    'mensagem': f'Banco de dados "{nome_banco}" deletado com sucesso!'
+                }
+            else:
+                return {
+                    'sucesso': False,
+                    'mensagem': f'Banco de dados "{nome_banco}" não encontrado!'
+                }
+        except Exception as e:
+            return {
+                'sucesso': False,
+                'mensagem': f'Erro ao deletar banco: {str(e)}'
+            }
+    
+    def caminho_arquivo(self, mes: str) -> str:
+        """Caminho do arquivo mensal de `mes` (AAAA-MM)"""
+        base = os.path.splitext(os.path.basename(self.caminho))[0]
+        return os.path.join(self.pasta_arquivos, f'{base}_{mes}.db')
+    
+    def _arquivos(self, conn, tabela: str) -> List[tuple]:
+        """(mes, data_min, data_max, id_min, id_max) de cada mês arquivado de `tabela`"""
+        return conn.execute('''
+            SELECT mes, data_min, data_max, id_min, id_max FROM arquivos WHERE tabela = ? ORDER BY mes
+        ''', (tabela,)).fetchall()
+    
+    def _anexar(self, mes: str) -> Optional[str]:
+        """
+        Anexa (ATTACH) o arquivo mensal de `mes` à conexão da thread e retorna o nome do
+        esquema (ex.: arquivo_2025_01), ou None se o arquivo não existir. Cada chamada pede um
+        _liberar; anexos livres continuam abertos para as próximas leituras e os usados há mais
+        tempo são desanexados quando a conexão chega a ARQUIVOS_ANEXADOS_MAX.
+        """
+        if not self.MES_ARQUIVO.fullmatch(mes):
+            raise ValueError(f'Invalid archive month: {mes}')
+        conn = self._conexao_da_thread()
+        anexados = self._local.anexados
+        esquema = 'arquivo_' + mes.replace('-', '_')
+        if esquema not in anexados:
+            caminho = self.caminho_arquivo(mes)
+            if not os.path.exists(caminho):
+                print(f"Archive not found: {caminho}")
+                return None
+            excedentes = len(anexados) + 1 - self.ARQUIVOS_ANEXADOS_MAX
+            for livre in [outro for outro, em_uso in anexados.items() if not em_uso][:max(excedentes, 0)]:
+                try:
+                    conn.execute(f'DETACH DATABASE {livre}')
+                    del anexados[livre]
+                except sqlite3.OperationalError:
+                    pass
+            conn.execute(f'ATTACH DATABASE ? AS {esquema}', (caminho,))
+            anexados[esquema] = 0
+        anexados[esquema] += 1
+        anexados.move_to_end(esquema)
+        return esquema
+    
+    def _liberar(self, esquema: str):
+        """Encerra um uso do esquema obtido em _anexar"""
+        anexados = getattr(self._local, 'anexados', {})
+        if esquema in anexados:
+            anexados[esquema] -= 1
+    
+    def _preparar_arquivo(self, mes: str):
+        """Cria o arquivo mensal, ou completa o schema de um existente, a partir do banco principal e do de telemetria"""
+        tabelas = [tabela for tabela, _ in self.TABELAS_ARQUIVADAS] + ['blobs']
+        with self.conexao() as conn:
+            schema = conn.execute(' UNION ALL '.join(f'''
+                SELECT type, name, sql FROM {esquema}.sqlite_master
+                WHERE tbl_name IN ({', '.join('?' * len(tabelas))}) AND type IN ('table', 'index') AND sql IS NOT NULL
+            ''' for esquema in (self.ESQUEMA, self.ESQUEMA_TELEMETRIA)), tabelas * 2).fetchall()
+            colunas = {tabela: conn.execute(f'PRAGMA table_info({tabela})').fetchall() for tabela in tabelas}
+        
+        os.makedirs(self.pasta_arquivos, exist_ok=True)
+        with closing(sqlite3.connect(self.caminho_arquivo(mes))) as destino:
+            destino.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            destino.execute('PRAGMA journal_mode = WAL')
+            existentes = {nome for (nome,) in destino.execute('SELECT name FROM sqlite_master')}
+            for tipo, nome, sql in schema:
+                if tipo == 'table' and nome not in existentes:
+                    destino.execute(sql)
+            # Colunas acrescentadas ao banco principal depois que o arquivo foi criado
+            for tabela, info in colunas.items():
+                presentes = {coluna[1] for coluna in destino.execute(f'PRAGMA table_info({tabela})')}
+                for _, coluna, tipo, _, _, _ in info:
+                    if coluna not in presentes:
+                        destino.execute(f'ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}')
+            for tipo, nome, sql in schema:
+                if tipo == 'index' and nome not in existentes:
+                    destino.execute(sql)
+            destino.commit()
+    
+    def arquivar(self, dias: int = None, lote: int = 5000) -> Dict[str, int]:
+        """
+        Move as linhas das TABELAS_ARQUIVADAS mais antigas que `dias` para arquivos mensais
+        (um .db por mês em pasta_arquivos, com o mesmo schema), em lotes de até `lote` linhas
+        com commit entre eles. As leituras do histórico, dos IPs e das exportações continuam
+        vendo as linhas arquivadas, os contadores não mudam e o espaço liberado no banco principal
+        volta ao sistema (vacuum_incremental).
+        Sem `dias`, usa ARQUIVO_DIAS (0 ou ausente = não arquivar). Retorna {tabela: linhas movidas}.
+        """
+        if dias is None:
+            dias = int(os.getenv('ARQUIVO_DIAS', 0))
+        if dias <= 0:
+            return {}
+        
+        corte = (datetime.now(timezone.utc) - timedelta(days=dias)).strftime('%Y-%m-%d %H:%M:%S')
+        preparados = set()
+        movidas = {}
+        for tabela, coluna_data in self.TABELAS_ARQUIVADAS:
+            movidas[tabela] = 0
+            while True:
+                # Lote mais antigo primeiro; datas fora do formato AAAA-MM ficam no banco principal
+                with self.conexao() as conn:
+                    linhas = conn.execute(f'''
+                        SELECT id, {coluna_data} FROM {tabela}
+                        WHERE {coluna_data} < ? AND {coluna_data} GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]*'
+                        ORDER BY {coluna_data} LIMIT ?
+                    ''', (corte, lote)).fetchall()
+                for mes, grupo in itertools.groupby(linhas, key=lambda linha: linha[1][:7]):
+                    if mes not in preparados:
+                        self._preparar_arquivo(mes)
+                        preparados.add(mes)
+                    movidas[tabela] += self._mover_para_arquivo(tabela, mes, list(grupo))
+                if len(linhas) < lote:
+                    break
+        if any(movidas.values()):
+            self.vacuum_incremental()
+        return movidas
+    
+    def _mover_para_arquivo(self, tabela: str, mes: str, linhas: List[tuple]) -> int:
+        """
+        Move as linhas [(id, data)] de `tabela` para o arquivo de `mes` e retorna quantas saíram do
+        banco principal. A cópia é confirmada no arquivo antes de as linhas serem apagadas do banco
+        principal: uma interrupção entre os dois commits deixa o lote nos dois lados (as leituras o
+        entregam uma vez) e a próxima execução termina a movimentação.
+        """
+        esquema = self._anexar(mes)
+        if esquema is None:
+            raise FileNotFoundError(self.caminho_arquivo(mes))
+        origem = self._esquema(tabela)
+        try:
+            # O registro passa a cobrir o lote antes da cópia: enquanto o lote estiver nos dois
+            # lados, as leituras já consultam o arquivo no intervalo certo
+            ids = [linha[0] for linha in linhas]
+            with self.conexao() as conn:
+                conn.execute('''
+                    INSERT INTO arquivos (tabela, mes, linhas, data_min, data_max, id_min, id_max)
+                    VALUES (?, ?, 0, ?, ?, ?, ?)
+                    ON CONFLICT (tabela, mes) DO UPDATE SET
+                        data_min = MIN(data_min, excluded.data_min), data_max = MAX(data_max, excluded.data_max),
+                        id_min = MIN(id_min, excluded.id_min), id_max = MAX(id_max, excluded.id_max)
+                ''', (tabela, mes, linhas[0][1], linhas[-1][1], min(ids), max(ids)))
+            
+            with self.conexao() as conn:
+                # BEGIN simples: a cópia só grava no arquivo e não precisa do lock de escrita do banco principal
+                conn.execute('BEGIN')
+                conn.execute('CREATE TEMP TABLE IF NOT EXISTS arquivo_lote (id INTEGER PRIMARY KEY)')
+                conn.execute('DELETE FROM temp.arquivo_lote')
+                conn.executemany('INSERT INTO temp.arquivo_lote (id) VALUES (?)', [(id_linha,) for id_linha in ids])
+                colunas = ', '.join(coluna[1] for coluna in conn.execute(f'PRAGMA {origem}.table_info({tabela})'))
+                conn.execute(f'''
+                    INSERT OR REPLACE INTO {esquema}.{tabela} ({colunas})
+                    SELECT {colunas} FROM {origem}.{tabela} WHERE id IN (SELECT id FROM temp.arquivo_lote)
+                ''')
+                for tabela_blob, _, coluna_hash in self.COLUNAS_BLOB:
+                    if tabela_blob == tabela:
+                        conn.execute(f'''
+                            INSERT OR IGNORE INTO {esquema}.blobs (hash, dados, tamanho)
+                            SELECT hash, dados, tamanho FROM main.blobs WHERE hash IN (
+                                SELECT {coluna_hash} FROM main.{tabela} WHERE id IN (SELECT id FROM temp.arquivo_lote)
+                            )
+                        ''')
+            
+            if self._banco(tabela) == 'telemetria':
+                return self._apagar_arquivadas_telemetria(tabela, mes, ids)
+            
+            with self.conexao() as conn:
+                # IMMEDIATE: outro processo arquivando o mesmo lote espera este terminar
+                conn.execute('BEGIN IMMEDIATE')
+                por_usuario = Counter()
+                if tabela == 'historico_buscas':
+                    por_usuario.update(conn.execute('''
+                        SELECT usuario_id, tipo_busca FROM main.historico_buscas
+                        WHERE id IN (SELECT id FROM temp.arquivo_lote) AND usuario_id IS NOT NULL
+                    '''))
+                movidas = conn.execute(f'''
+                    DELETE FROM main.{tabela} WHERE id IN (SELECT id FROM temp.arquivo_lote)
+                ''').rowcount
+                if not movidas:
+                    return 0
+                
+                # Os triggers de DELETE descontaram as linhas; arquivadas, elas continuam contando
+                if tabela in self.TABELAS_CONTADAS:
+                    conn.execute('UPDATE contadores SET total = total + ? WHERE tabela = ?', (movidas, tabela))
+                conn.executemany('''
+                    UPDATE contadores_usuario SET total = total + ? WHERE usuario_id = ? AND tipo_busca = ?
+                ''', [(total, usuario_id, tipo) for (usuario_id, tipo), total in por_usuario.items()])
+                
+                # Blobs que só as linhas movidas usavam saem do banco principal
+                for tabela_blob, _, coluna_hash in self.COLUNAS_BLOB:
+                    if tabela_blob == tabela:
+                        sem_uso = ' '.join(f'AND NOT EXISTS (SELECT 1 FROM main.{outra} WHERE {outra_hash} = blobs.hash)'
+                                           for outra, _, outra_hash in self.COLUNAS_BLOB)
+                        conn.execute(f'''
+                            DELETE FROM main.blobs WHERE hash IN (
+                                SELECT {coluna_hash} FROM {esquema}.{tabela} WHERE id IN (SELECT id FROM temp.arquivo_lote)
+                            ) {sem_uso}
+                        ''')
+                
+                conn.execute('UPDATE arquivos SET linhas = linhas + ? WHERE tabela = ? AND mes = ?', (movidas, tabela, mes))
+            return movidas
+        finally:
+            self._liberar(esquema)
+    
+    def _apagar_arquivadas_telemetria(self, tabela: str, mes: str, ids: List[int]) -> int:
+        """
+        Última etapa de _mover_para_arquivo para uma tabela de telemetria: as linhas saem pela conexão
+        do banco de telemetria e o registro do mês é atualizado no principal antes do commit delas. Uma
+        interrupção entre os dois commits faz o registro contar linhas a mais, nunca a menos (ele não
+        some enquanto o arquivo tiver linhas), e o lote volta a ser movido na próxima execução.
+        """
+        with self.conexao('telemetria') as conn:
+            # IMMEDIATE: outro processo arquivando o mesmo lote espera este terminar
+            conn.execute('BEGIN IMMEDIATE')
+            movidas = conn.executemany(f'DELETE FROM {tabela} WHERE id = ?', [(id_linha,) for id_linha in ids]).rowcount
+            if movidas:
+                with self.conexao() as principal:
+                    principal.execute('UPDATE arquivos SET linhas = linhas + ? WHERE tabela = ? AND mes = ?',
+                                      (movidas, tabela, mes))
+        return movidas
+    
+    def listar_arquivos(self) -> List[Dict]:
+        """Meses arquivados, com linhas e intervalo de datas por tabela e o tamanho de cada arquivo"""
+        with self.conexao() as conn:
+            linhas = conn.execute('''
+                SELECT tabela, mes, linhas, data_min, data_max FROM arquivos ORDER BY tabela, mes
+            ''').fetchall()
+        meses = {}
+        for tabela, mes, total, data_min, data_max in linhas:
+            if mes not in meses:
+                caminho = self.caminho_arquivo(mes)
+                tamanho = os.path.getsize(caminho) if os.path.exists(caminho) else 0
+                meses[mes] = {'mes': mes, 'arquivo': os.path.basename(caminho),
+                              'tamanho_mb': round(tamanho / (1024 * 1024), 2), 'tabelas': {}}
+            meses[mes]['tabelas'][tabela] = {'linhas': total, 'data_min': data_min, 'data_max': data_max}
+        return [meses[mes] for mes in sorted(meses)]
+    
+    def backup(self, destino: str, paginas: int = None, pausa_ms: float = None, arquivos: bool = True,
+               progresso: Callable[[int, int], None] = None) -> Dict:
+        """
+        Cópia consistente do banco em `destino` pela API de backup online do SQLite, sem parar as
+        escritas: `paginas` páginas por passo (BACKUP_PAGINAS, -1 = tudo de uma vez) e uma pausa de
+        `pausa_ms` entre os passos (BACKUP_PAUSA_MS). O destino só aparece quando a cópia termina.
+        O banco de telemetria vai junto (<destino>_telemetria.db) e, com `arquivos`, os arquivos mensais
+        vão para <pasta do destino>/arquivo, com os nomes que um Database(destino) procura.
+        progresso(restantes, total) é chamado a cada passo e pode interromper a cópia levantando uma exceção.
+        """
+        paginas = paginas or int(os.getenv('BACKUP_PAGINAS', 1024))
+        pausa = (pausa_ms if pausa_ms is not None else float(os.getenv('BACKUP_PAUSA_MS', 10))) / 1000
+        destino = os.path.abspath(destino)
+        if destino == self.caminho:
+            raise ValueError('Backup destination is the database itself')
+        inicio = time.monotonic()
+        passos = 0
+        
+        def passo(status, restantes, total):
+            nonlocal passos
+            passos += 1
+            if progresso:
+                progresso(restantes, total)
+            if restantes and pausa > 0:
+                time.sleep(pausa)
+        
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        with closing(sqlite3.connect(self.caminho)) as origem:
+            # Uma transação de leitura aberta durante toda a cópia fixa o instantâneo (no modo WAL
+            # ela não bloqueia quem escreve). Sem ela, cada commit de outra conexão entre dois
+            # passos faz a cópia recomeçar do zero e, com escritas contínuas, nunca terminar
+            origem.execute('BEGIN')
+            try:
+                registro = origem.execute('SELECT tabela, mes, data_min, data_max FROM arquivos ORDER BY mes').fetchall()
+            except sqlite3.OperationalError:
+                registro = []  # antes da migração 8
+            total_paginas = origem.execute('PRAGMA page_count').fetchone()[0]
+            self._copiar_banco(origem, destino, paginas, passo)
+        
+        # O banco de telemetria vai para o lado do destino, onde um Database(destino) o procura. Nada
+        # nele depende do banco principal, então ele não precisa ser copiado no mesmo instante
+        if os.path.exists(self.caminho_telemetria):
+            with closing(sqlite3.connect(self.caminho_telemetria)) as origem:
+                origem.execute('BEGIN')
+                origem.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+                self._copiar_banco(origem, caminho_telemetria(destino), paginas, passo)
+        
+        # Os arquivos mensais são copiados depois do banco principal: um lote arquivado no meio
+        # do caminho está na cópia principal (ainda não tinha sido apagado) e talvez também no
+        # arquivo; o recorte pelas datas do registro tira do arquivo o que o registro copiado
+        # ainda não cobre, e o resto as leituras já tratam como lote interrompido
+        copiados = []
+        if arquivos:
+            colunas_data = dict(self.TABELAS_ARQUIVADAS)
+            base = os.path.splitext(os.path.basename(destino))[0]
+            for mes, grupo in itertools.groupby(registro, key=operator.itemgetter(1)):
+                caminho = self.caminho_arquivo(mes)
+                if not os.path.exists(caminho):
+                    continue
+                recortes = [(tabela, colunas_data[tabela], data_min, data_max) for tabela, _, data_min, data_max in grupo]
+                with closing(sqlite3.connect(caminho)) as origem:
+                    origem.execute('BEGIN')
+                    origem.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+                    self._copiar_banco(origem, os.path.join(os.path.dirname(destino), 'arquivo', f'{base}_{mes}.db'),
+                                       paginas, passo, recortes)
+                copiados.append(mes)
+        
+        return {
+            'arquivo': destino,
+            'tamanho_mb': round(os.path.getsize(destino) / (1024 * 1024), 2),
+            'paginas': total_paginas,
+            'passos': passos,
+            'arquivos': copiados,
+            'segundos': round(time.monotonic() - inicio, 2)
+        }
+    
+    def _copiar_banco(self, origem: sqlite3.Connection, caminho: str, paginas: int, passo: Callable,
+                      recortes: List[tuple] = ()):
+        """
+        Copia `origem` para `caminho` passando por um arquivo temporário. `recortes`:
+        [(tabela, coluna de data, data_min, data_max)], linhas fora do intervalo saem da cópia.
+        """
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        temporario = caminho + '.tmp'
+        try:
+            with closing(sqlite3.connect(temporario)) as copia:
+                origem.backup(copia, pages=paginas, progress=passo)
+                # Cópia em um arquivo só, sem -wal; o Database volta a WAL ao abri-la
+                copia.execute('PRAGMA journal_mode = DELETE')
+                for tabela, coluna_data, data_min, data_max in recortes:
+                    copia.execute(f'DELETE FROM {tabela} WHERE {coluna_data} < ? OR {coluna_data} > ?',
+                                  (data_min, data_max))
+                copia.commit()
+            os.replace(temporario, caminho)
+        except BaseException:
+            for sufixo in ('', '-journal', '-wal', '-shm'):
+                if os.path.exists(temporario + sufixo):
+                    os.remove(temporario + sufixo)
+            raise
+    
+    def snapshot(self, instante: datetime = None, manter: int = None, **opcoes) -> Optional[Dict]:
+        """
+        backup() em pasta_backups/<nome do banco>_AAAAMMDD-HHMMSS.db (UTC de `instante`, padrão agora)
+        seguido da rotação: ficam os `manter` snapshots mais recentes (BACKUP_MANTER). Processos que
+        pedem o mesmo `instante` gravam um snapshot só; quem chega depois recebe None.
+        """
+        instante = instante or datetime.now(timezone.utc)
+        manter = manter or int(os.getenv('BACKUP_MANTER', 7))
+        base = os.path.splitext(os.path.basename(self.caminho))[0]
+        destino = os.path.join(self.pasta_backups, f"{base}_{instante.strftime('%Y%m%d-%H%M%S')}.db")
+        os.makedirs(self.pasta_backups, exist_ok=True)
+        # A criação exclusiva do .lock decide qual processo grava
+        try:
+            os.close(os.open(destino + '.lock', os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return None
+        try:
+            if os.path.exists(destino):
+                return None
+            resultado = self.backup(destino, **opcoes)
+        finally:
+            os.remove(destino + '.lock')
+        
+        for antigo in self.listar_snapshots()[manter:]:
+            caminho = os.path.join(self.pasta_backups, antigo['arquivo'])
+            nome = os.path.splitext(antigo['arquivo'])[0]
+            for mes in antigo['arquivos']:
+                os.remove(os.path.join(self.pasta_backups, 'arquivo', f'{nome}_{mes}.db'))
+            if os.path.exists(caminho_telemetria(caminho)):
+                os.remove(caminho_telemetria(caminho))
+            os.remove(caminho)
+        return resultado
+    
+    def listar_snapshots(self) -> List[Dict]:
+        """Snapshots em pasta_backups, do mais recente para o mais antigo"""
+        base = os.path.splitext(os.path.basename(self.caminho))[0]
+        padrao = re.compile(re.escape(base) + r'_(\d{8}-\d{6})\.db')
+        pasta_arquivos = os.path.join(self.pasta_backups, 'arquivo')
+        copias = os.listdir(pasta_arquivos) if os.path.isdir(pasta_arquivos) else []
+        snapshots = []
+        nomes = os.listdir(self.pasta_backups) if os.path.isdir(self.pasta_backups) else []
+        for nome in sorted(nomes, reverse=True):
+            encontrado = padrao.fullmatch(nome)
+            if not encontrado:
+                continue
+            prefixo = os.path.splitext(nome)[0] + '_'
+            meses = sorted(copia[len(prefixo):-3] for copia in copias
+                           if copia.startswith(prefixo) and self.MES_ARQUIVO.fullmatch(copia[len(prefixo):-3]))
+            tamanho = os.path.getsize(os.path.join(self.pasta_backups, nome))
+            telemetria = caminho_telemetria(os.path.join(self.pasta_backups, nome))
+            tamanho += os.path.getsize(telemetria) if os.path.exists(telemetria) else 0
+            tamanho += sum(os.path.getsize(os.path.join(pasta_arquivos, f'{prefixo}{mes}.db')) for mes in meses)
+            snapshots.append({
+                'arquivo': nome,
+                'data': datetime.strptime(encontrado.group(1), '%Y%m%d-%H%M%S').strftime('%Y-%m-%d %H:%M:%S'),
+                'tamanho_mb': round(tamanho / (1024 * 1024), 2),
+                'arquivos': meses
+            })
+        return snapshots
+    
+    def vacuum_incremental(self, paginas: int = None, pausa_ms: float = None) -> Dict:
+        """
+        Devolve ao sistema as páginas livres do banco (e dos de telemetria e arquivos mensais) com
+        PRAGMA incremental_vacuum, `paginas` por transação (VACUUM_PAGINAS) e uma pausa entre elas,
+        sem o lock longo de um VACUUM.
+        Só tem efeito com auto_vacuum=INCREMENTAL (bancos novos; ver ativar_vacuum_incremental).
+        """
+        paginas = paginas or int(os.getenv('VACUUM_PAGINAS', 1000))
+        pausa = (pausa_ms if pausa_ms is not None else float(os.getenv('LIMPEZA_PAUSA_MS', 20))) / 1000
+        with self.conexao() as conn:
+            try:
+                meses = sorted({mes for (mes,) in conn.execute('SELECT mes FROM arquivos')})
+            except sqlite3.OperationalError:
+                meses = []
+        caminhos = [self.caminho, self.caminho_telemetria] + [self.caminho_arquivo(mes) for mes in meses if os.path.exists(self.caminho_arquivo(mes))]
+        
+        liberadas = 0
+        incrementais = 0
+        for caminho in caminhos:
+            with closing(sqlite3.connect(caminho)) as conn:
+                if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                    continue
+                incrementais += 1
+                while True:
+                    livres = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                    if not livres:
+                        break
+                    # executescript executa o PRAGMA até o fim (execute liberaria uma página só)
+                    conn.executescript(f'PRAGMA incremental_vacuum({paginas})')
+                    liberadas += min(livres, paginas)
+                    if livres > paginas and pausa > 0:
+                        time.sleep(pausa)
+                # As páginas saem do arquivo quando o WAL é transferido para ele
+                conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+        return {'liberadas': liberadas, 'bancos': len(caminhos), 'incrementais': incrementais}
+    
+    def ativar_vacuum_incremental(self) -> Dict:
+        """
+        Passa para auto_vacuum=INCREMENTAL um banco criado antes dele (e os de telemetria e arquivos mensais).
+        A mudança exige um VACUUM completo, que reescreve o arquivo e bloqueia as escritas
+        enquanto roda: use uma única vez, em uma janela de manutenção.
+        """
+        with self.conexao() as conn:
+            try:
+                meses = sorted({mes for (mes,) in conn.execute('SELECT mes FROM arquivos')})
+            except sqlite3.OperationalError:
+                meses = []
+        convertidos = []
+        for caminho in [self.caminho, self.caminho_telemetria] + [self.caminho_arquivo(mes) for mes in meses]:
+            if not os.path.exists(caminho):
+                continue
+            with closing(sqlite3.connect(caminho, isolation_level=None)) as conn:
+                if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+                    continue
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                conn.execute('VACUUM')
+            convertidos.append(os.path.basename(caminho))
+        return {'sucesso': True, 'convertidos': convertidos}
+
+
+_instancias = {}
+_instancias_lock = threading.Lock()
+
+def obter_database(db_name: str = "osint_database.db", url: str = None) -> Armazenamento:
+    """
+    Retorna a instância de Database compartilhada pelo processo para o arquivo informado.
+    Com `url` (padrão: DATABASE_URL) apontando para um PostgreSQL (postgresql://...), todos os
+    processos e nós do app usam esse servidor e o arquivo é ignorado (ver database_postgres).
+    """
+    url = os.getenv('DATABASE_URL', '') if url is None else url
+    postgres = url.startswith(('postgres://', 'postgresql://'))
+    chave = url if postgres else db_name
+    db = _instancias.get(chave)
+    if db is None:
+        with _instancias_lock:
+            db = _instancias.get(chave)
+            if db is None:
+                if postgres:
+                    # psycopg só é importado com o PostgreSQL configurado
+                    from database_postgres import DatabasePostgres
+                    db = DatabasePostgres(url)
+                else:
+                    db = Database(db_name)
+                _instancias[chave] = db
+    return db
@@ -0,0 +1,49 @@
+"""
+Configuração do gunicorn para produção (usada pelo Procfile)
+Workers gthread: cada processo atende várias requisições ao mesmo tempo em threads,
+o que combina com as conexões SQLite por thread do Database e com as chamadas de
+rede das buscas. preload_app cria o app (e roda as migrações) uma vez no master;
+os hooks abaixo fecham as conexões antes do fork e reiniciam o estado por processo
+em cada worker.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = 'gthread'
+# WEB_CONCURRENCY é a convenção do Heroku/Render para o número de processos. As rotas
+# são quase todas CPU + SQLite local: um processo por núcleo e poucas threads por
+# processo (o GIL serializa o Python); as threads cobrem esperas de rede e de disco
+workers = int(os.getenv('WEB_CONCURRENCY', os.cpu_count() or 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+preload_app = True
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+# Reciclar workers de tempos em tempos limita o efeito de vazamentos de memória
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+
+
+def pre_fork(server, worker):
+    """No master: conexões SQLite (ou o pool do PostgreSQL) não podem ser herdadas pelo worker"""
+    import app
+    if app.db is not None:
+        app.db.fechar_conexoes()
+
+
+def post_fork(server, worker):
+    """No worker recém-criado: estado por processo novo (conexões, threads, locks, caches)"""
+    import app
+    if app.db is not None:
+        app.reiniciar_apos_fork()
+
+
+def worker_exit(server, worker):
+    """Grava logs de acesso e ultimo_acesso pendentes antes de o worker sair"""
+    import app
+    if app.db is not None:
+        app.parar_worker()
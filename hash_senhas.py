@@ -0,0 +1,107 @@
+"""
+Hash de senhas (werkzeug) em um pool de threads limitado, com controle de admissão
+scrypt/pbkdf2 são caros em CPU; executá-los direto na thread da requisição deixa uma
+rajada de logins ocupar todos os workers. Aqui no máximo HASH_WORKERS hashes rodam
+ao mesmo tempo e no máximo HASH_FILA_MAX ficam em andamento (rodando ou aguardando);
+acima disso a chamada falha na hora com SobrecargaHash, que as rotas traduzem em 503.
+O padrão de HASH_FILA_MAX é uma vaga a menos que as threads do worker (GUNICORN_THREADS):
+cada vaga prende uma thread de requisição, e ao menos uma fica livre para as outras rotas.
+"""
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+class SobrecargaHash(Exception):
+    """Pool de hash saturado; retry_after é a espera sugerida em segundos"""
+    def __init__(self, retry_after: int):
+        super().__init__('Too many password operations in progress, try again shortly')
+        self.retry_after = retry_after
+
+class PoolHash:
+    def __init__(self, workers: int = None, fila_max: int = None):
+        # Configuração via variáveis de ambiente, com os argumentos tendo precedência
+        self.workers = workers or int(os.getenv('HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+        self.fila_max = fila_max or int(os.getenv('HASH_FILA_MAX', max(1, int(os.getenv('GUNICORN_THREADS', 4)) - 1)))
+        self._vagas = threading.BoundedSemaphore(self.fila_max)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        
+        # Média móvel da duração de um hash, usada para estimar o Retry-After
+        self._duracao_media = 0.1
+        self.em_andamento = 0
+        self.executados = 0
+        self.rejeitados = 0
+    
+    def _obter_executor(self) -> ThreadPoolExecutor:
+        """Cria o executor no primeiro uso (e de novo depois de um fork)"""
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hash-senhas')
+                    self._pid = os.getpid()
+        return self._executor
+    
+    def reiniciar_apos_fork(self):
+        """No processo filho: executor, locks e vagas novos (as threads do pai não existem aqui)"""
+        self._lock = threading.Lock()
+        self._vagas = threading.BoundedSemaphore(self.fila_max)
+        self._executor = None
+        self.em_andamento = 0
+    
+    def _retry_after(self) -> int:
+        """Tempo estimado para esvaziar a fila atual, em segundos inteiros (mínimo 1)"""
+        return max(1, math.ceil(self.em_andamento * self._duracao_media / self.workers))
+    
+    def executar(self, funcao, *args):
+        """Executa funcao(*args) no pool e aguarda o resultado; SobrecargaHash se não houver vaga"""
+        if not self._vagas.acquire(blocking=False):
+            with self._lock:
+                self.rejeitados += 1
+            raise SobrecargaHash(self._retry_after())
+        
+        with self._lock:
+            self.em_andamento += 1
+        
+        def tarefa():
+            inicio = time.perf_counter()
+            try:
+                return funcao(*args)
+            finally:
+                duracao = time.perf_counter() - inicio
+                with self._lock:
+                    self._duracao_media = 0.8 * self._duracao_media + 0.2 * duracao
+                    self.executados += 1
+        
+        try:
+            return self._obter_executor().submit(tarefa).result()
+        finally:
+            with self._lock:
+                self.em_andamento -= 1
+            self._vagas.release()
+    
+    def estatisticas(self) -> dict:
+        """Contadores do pool, para diagnóstico"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'fila_max': self.fila_max,
+                'em_andamento': self.em_andamento,
+                'executados': self.executados,
+                'rejeitados': self.rejeitados,
+                'duracao_media_ms': round(self._duracao_media * 1000, 1),
+            }
+
+pool_hash = PoolHash()
+
+def gerar_hash(senha: str) -> str:
+    """generate_password_hash executado no pool limitado"""
+    return pool_hash.executar(generate_password_hash, senha)
+
+def verificar_hash(senha_hash: str, senha: str) -> bool:
+    """check_password_hash executado no pool limitado"""
+    return pool_hash.executar(check_password_hash, senha_hash, senha)
@@ -0,0 +1,68 @@
+"""
+HyperLogLog para contagem aproximada de valores distintos (ex.: IPs únicos)
+Os registradores são serializados em bytes para serem guardados em colunas BLOB.
+"""
+import functools
+import hashlib
+import math
+from typing import Optional, Tuple
+
+@functools.lru_cache(maxsize=None)
+def _mascaras(m: int) -> Tuple[int, int]:
+    """(0x8080...80, 0xffff...ff) com m bytes, para unir"""
+    return int.from_bytes(b'\x80' * m, 'big'), int.from_bytes(b'\xff' * m, 'big')
+
+class HyperLogLog:
+    def __init__(self, precisao: int = 12, registradores: Optional[bytes] = None):
+        # 2^precisao registradores; erro padrão ~ 1.04 / sqrt(2^precisao) (~1,6% com precisao=12)
+        self.precisao = precisao
+        self.m = 1 << precisao
+        if registradores is not None and len(registradores) != self.m:
+            raise ValueError(f'Esperados {self.m} registradores, recebidos {len(registradores)}')
+        self.registradores = bytearray(registradores) if registradores is not None else bytearray(self.m)
+    
+    @classmethod
+    def de_bytes(cls, dados: Optional[bytes]) -> 'HyperLogLog':
+        """Reconstrói a partir do BLOB salvo (None gera um HLL vazio)"""
+        if not dados:
+            return cls()
+        return cls(precisao=len(dados).bit_length() - 1, registradores=dados)
+    
+    def para_bytes(self) -> bytes:
+        return bytes(self.registradores)
+    
+    def adicionar(self, valor: str):
+        """Adiciona um valor ao conjunto"""
+        h = int.from_bytes(hashlib.blake2b(valor.encode('utf-8'), digest_size=8).digest(), 'big')
+        indice = h >> (64 - self.precisao)
+        resto = h & ((1 << (64 - self.precisao)) - 1)
+        # Posição do primeiro bit 1 nos (64 - precisao) bits restantes
+        rank = (64 - self.precisao) - resto.bit_length() + 1
+        if rank > self.registradores[indice]:
+            self.registradores[indice] = rank
+    
+    def unir(self, outro: 'HyperLogLog'):
+        """
+        União com outro HLL de mesma precisão (máximo registrador a registrador), feita de uma vez
+        sobre os registradores como um único inteiro: todos são menores que 0x80, então em
+        (a | 0x80...) - b cada byte fica com o bit alto ligado onde a >= b, sem empréstimo entre bytes.
+        """
+        if outro.precisao != self.precisao:
+            raise ValueError('HyperLogLogs com precisões diferentes')
+        a = int.from_bytes(self.registradores, 'big')
+        b = int.from_bytes(outro.registradores, 'big')
+        altos, todos = _mascaras(self.m)
+        a_maior = ((((a | altos) - b) & altos) >> 7) * 0xff
+        self.registradores = bytearray((a & a_maior | b & (a_maior ^ todos)).to_bytes(self.m, 'big'))
+    
+    def estimativa(self) -> int:
+        """Estimativa do número de valores distintos"""
+        alfa = 0.7213 / (1 + 1.079 / self.m)
+        soma = sum(2.0 ** -r for r in self.registradores)
+        estimativa = alfa * self.m * self.m / soma
+        
+        # Correção para cardinalidades pequenas (contagem linear)
+        vazios = self.registradores.count(0)
+        if estimativa <= 2.5 * self.m and vazios:
+            estimativa = self.m * math.log(self.m / vazios)
+        return int(round(estimativa))
@@ -46,10 +46,11 @@ print("⏹️  Para parar, pressione Ctrl+C")
 print("=" * 60)
 print()
 
-# Importar e executar o app
+# Importar e executar o app (servidor de desenvolvimento, com uma thread por requisição;
+# em produção use: gunicorn -c gunicorn.conf.py "app:create_app()")
 try:
-    from app import app
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    from app import create_app
+    create_app().run(debug=True, host='0.0.0.0', port=5000, threaded=True)
 except KeyboardInterrupt:
     print("\n\n⏹️  Servidor interrompido pelo usuário.")
 except Exception as e:
@@ -0,0 +1,170 @@
+"""
+Controle de admissão em memória: token buckets por IP e por sessão, e descarte de carga
+Cada rota tem um custo em tokens (buscas e estatísticas custam mais). Sem tokens
+suficientes a requisição recebe 429 com Retry-After. Quando há requisições demais em
+andamento ou a latência média sobe além do limite, as rotas de baixa prioridade
+recebem 503 antes de tocar o banco. O estado é por processo (cada worker tem o seu).
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+class BaldeTokens:
+    """Token bucket: até `capacidade` tokens, repostos a `taxa` tokens por segundo"""
+    __slots__ = ('capacidade', 'taxa', 'tokens', 'atualizado_em')
+    
+    def __init__(self, capacidade: float, taxa: float, agora: float):
+        self.capacidade = capacidade
+        self.taxa = taxa
+        self.tokens = capacidade
+        self.atualizado_em = agora
+    
+    def espera(self, custo: float, agora: float) -> float:
+        """Repõe os tokens do período decorrido e retorna os segundos até haver `custo` tokens (0 = já há)"""
+        decorrido = max(0.0, agora - self.atualizado_em)
+        self.tokens = min(self.capacidade, self.tokens + decorrido * self.taxa)
+        self.atualizado_em = agora
+        if self.tokens >= custo:
+            return 0.0
+        if custo > self.capacidade or self.taxa <= 0:
+            return math.inf
+        return (custo - self.tokens) / self.taxa
+    
+    def consumir(self, custo: float, agora: float) -> float:
+        """Retira `custo` tokens se houver; senão não retira nada e retorna a espera em segundos"""
+        espera = self.espera(custo, agora)
+        if not espera:
+            self.tokens -= custo
+        return espera
+
+class LimitadorTaxa:
+    # Prefixo de rota -> custo em tokens (primeiro que casar; demais rotas custam 1)
+    CUSTOS_ROTA = (
+        ('/api/buscar/', 5),
+        ('/api/estatisticas', 3),
+        ('/api/auth/', 3),
+        ('/api/historico', 2),
+        ('/api/admin/export/', 10),
+        ('/api/admin/', 2),
+    )
+    
+    # Rotas descartadas primeiro quando o worker está sobrecarregado
+    BAIXA_PRIORIDADE = ('/api/estatisticas', '/api/historico', '/api/user/profile', '/api/admin/ips',
+                        '/api/admin/export/')
+    
+    # Rotas fora do controle de admissão
+    ISENTAS = ('/static/',)
+    
+    def __init__(self, ativo: bool = None, capacidade_ip: float = None, taxa_ip: float = None,
+                 capacidade_sessao: float = None, taxa_sessao: float = None, max_baldes: int = None,
+                 limite_em_andamento: int = None, limite_latencia_ms: float = None):
+        # Configuração via variáveis de ambiente, com os argumentos tendo precedência
+        self.ativo = ativo if ativo is not None else os.getenv('RATE_LIMIT_ATIVO', '1') != '0'
+        self.capacidade_ip = capacidade_ip or float(os.getenv('RATE_IP_CAPACIDADE', 120))
+        self.taxa_ip = taxa_ip or float(os.getenv('RATE_IP_TAXA', 4))
+        self.capacidade_sessao = capacidade_sessao or float(os.getenv('RATE_SESSAO_CAPACIDADE', 60))
+        self.taxa_sessao = taxa_sessao or float(os.getenv('RATE_SESSAO_TAXA', 2))
+        self.max_baldes = max_baldes or int(os.getenv('RATE_MAX_BALDES', 100000))
+        self.limite_em_andamento = limite_em_andamento or int(os.getenv('RATE_SHED_EM_ANDAMENTO', 64))
+        self.limite_latencia = (limite_latencia_ms or float(os.getenv('RATE_SHED_LATENCIA_MS', 1000))) / 1000
+        
+        # chave ('ip:...' ou 'sessao:...') -> BaldeTokens, em ordem de uso (LRU)
+        self._baldes = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self.em_andamento = 0
+        # Média móvel exponencial da duração das requisições, em segundos
+        self.latencia_media = 0.0
+        self._latencia_em = 0.0
+        self.limitadas = 0
+        self.descartadas = 0
+    
+    def custo(self, path: str) -> int:
+        """Custo em tokens da rota"""
+        for prefixo, custo in self.CUSTOS_ROTA:
+            if path.startswith(prefixo):
+                return custo
+        return 1
+    
+    def sobrecarregado(self) -> bool:
+        """Há requisições demais em andamento ou a latência média recente passou do limite"""
+        if self.em_andamento > self.limite_em_andamento:
+            return True
+        # A média só muda quando requisições terminam; sem conclusões há 5 s ela deixa de valer,
+        # para o descarte não se manter sozinho quando só chegam rotas de baixa prioridade
+        return self.latencia_media > self.limite_latencia and time.monotonic() - self._latencia_em < 5
+    
+    def _balde(self, chave: str, capacidade: float, taxa: float, agora: float) -> BaldeTokens:
+        """Balde da chave (criado cheio no primeiro uso); descarta o menos usado acima de max_baldes"""
+        balde = self._baldes.get(chave)
+        if balde is None:
+            balde = self._baldes[chave] = BaldeTokens(capacidade, taxa, agora)
+            if len(self._baldes) > self.max_baldes:
+                self._baldes.popitem(last=False)
+        else:
+            self._baldes.move_to_end(chave)
+        return balde
+    
+    def admitir(self, path: str, ip: str, sessao: Optional[str]) -> Optional[Tuple[int, int]]:
+        """
+        Decide se a requisição entra. Retorna None para admitir, ou (status, retry_after):
+        (503, s) para descarte por sobrecarga e (429, s) para falta de tokens.
+        """
+        if not self.ativo or path.startswith(self.ISENTAS):
+            return None
+        
+        if self.sobrecarregado() and path.startswith(self.BAIXA_PRIORIDADE):
+            with self._lock:
+                self.descartadas += 1
+            return 503, max(1, math.ceil(self.latencia_media))
+        
+        custo = self.custo(path)
+        agora = time.monotonic()
+        with self._lock:
+            baldes = [self._balde(f'ip:{ip}', self.capacidade_ip, self.taxa_ip, agora)]
+            if sessao:
+                baldes.append(self._balde(f'sessao:{sessao}', self.capacidade_sessao, self.taxa_sessao, agora))
+            
+            # Só debita se todos os baldes tiverem tokens, para uma recusa não consumir nada
+            espera = max(balde.espera(custo, agora) for balde in baldes)
+            if espera:
+                self.limitadas += 1
+                return 429, int(min(math.ceil(espera), 3600))
+            for balde in baldes:
+                balde.tokens -= custo
+        return None
+    
+    def iniciar(self):
+        """Marca o início de uma requisição admitida"""
+        with self._lock:
+            self.em_andamento += 1
+    
+    def finalizar(self, duracao: float):
+        """Marca o fim de uma requisição e atualiza a latência média"""
+        with self._lock:
+            self.em_andamento -= 1
+            self.latencia_media = 0.9 * self.latencia_media + 0.1 * duracao
+            self._latencia_em = time.monotonic()
+    
+    def reiniciar_apos_fork(self):
+        """No processo filho: lock novo, baldes vazios, nenhuma requisição em andamento e sem latência herdada"""
+        self._lock = threading.Lock()
+        self._baldes = OrderedDict()
+        self.em_andamento = 0
+        self.latencia_media = 0.0
+        self._latencia_em = 0.0
+    
+    def estatisticas(self) -> dict:
+        """Contadores do limitador, para diagnóstico"""
+        with self._lock:
+            return {
+                'ativo': self.ativo,
+                'baldes': len(self._baldes),
+                'em_andamento': self.em_andamento,
+                'latencia_media_ms': round(self.latencia_media * 1000, 1),
+                'limitadas': self.limitadas,
+                'descartadas': self.descartadas,
+            }
@@ -0,0 +1,132 @@
+"""
+Manutenção periódica das linhas antigas em uma thread própria, fora da gravação dos logs de acesso
+A cada IP_LOGS_PODA_INTERVALO_S segundos (contados a partir da meia-noite UTC) a thread de cada
+worker tenta reservar a tarefa no banco (Database.reservar_tarefa); só o processo que a reserva
+aplica a retenção de ip_logs (IP_LOGS_RETENCAO_DIAS, Database.podar_ip_logs) e o arquivamento das
+linhas antigas em arquivos mensais (ARQUIVO_DIAS, Database.arquivar, só no SQLite). Os outros
+voltam a dormir.
+"""
+import atexit
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+class AgendadorManutencao:
+    TAREFA = 'manutencao'
+    
+    def __init__(self, db=None, intervalo_s: float = None, retencao_dias: int = None, arquivo_dias: int = None):
+        self.db = db
+        self.intervalo = intervalo_s if intervalo_s is not None else float(os.getenv('IP_LOGS_PODA_INTERVALO_S', 3600))
+        # Retenção: 0 desativa a poda de linhas antigas
+        self.retencao_dias = retencao_dias if retencao_dias is not None else int(os.getenv('IP_LOGS_RETENCAO_DIAS', 0))
+        # Arquivamento: 0 mantém todas as linhas no banco principal
+        self.arquivo_dias = arquivo_dias if arquivo_dias is not None else int(os.getenv('ARQUIVO_DIAS', 0))
+        # Uma reserva de um processo que morreu no meio da passada expira depois disto
+        self.prazo = float(os.getenv('MANUTENCAO_PRAZO_S', 6 * 3600))
+        self._reiniciar_estado()
+        atexit.register(self.parar)
+    
+    def _reiniciar_estado(self):
+        """Contadores, thread e lock (também usado no filho após um fork)"""
+        self.concluidas = 0
+        self.ignoradas = 0  # intervalos reservados por outro processo
+        self.falhas = 0
+        self.ultima = None  # resultado da última passada feita por este processo
+        self.em_andamento = False
+        
+        self._thread = None
+        self._parar = threading.Event()
+        self._lock = threading.Lock()
+    
+    def reiniciar_apos_fork(self):
+        """No processo filho: estado novo (uma passada em andamento no pai continua lá)"""
+        self._reiniciar_estado()
+    
+    def iniciar(self):
+        """Inicia a thread se houver retenção ou arquivamento configurado (chamado a cada requisição)"""
+        if self.intervalo > 0 and (self.retencao_dias > 0 or self.arquivo_dias > 0):
+            self._iniciar()
+    
+    def _iniciar(self):
+        """Inicia a thread no primeiro uso (depois de um eventual fork)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._parar.clear()
+                self._thread = threading.Thread(target=self._executar, name='agendador-manutencao', daemon=True)
+                self._thread.start()
+    
+    def _executar(self):
+        """Loop da thread: espera o início do próximo intervalo e tenta fazer a passada"""
+        while not self._parar.wait(self.intervalo - time.time() % self.intervalo):
+            self.executar()
+    
+    def executar(self) -> Optional[Dict]:
+        """
+        Uma passada de poda e arquivamento, se este processo obtiver a reserva do intervalo atual.
+        Retorna {'podadas': N, 'movidas': {tabela: N}}, ou None quando outro processo a fez.
+        """
+        # Início do intervalo seguinte: o mesmo valor em todos os processos que acordam agora
+        proxima = datetime.fromtimestamp((time.time() // self.intervalo + 1) * self.intervalo, timezone.utc)
+        try:
+            reservada = self.db.reservar_tarefa(self.TAREFA, proxima, self.prazo)
+        except Exception as e:
+            with self._lock:
+                self.falhas += 1
+            print(f"Error reserving maintenance task: {e}")
+            return None
+        if not reservada:
+            with self._lock:
+                self.ignoradas += 1
+            return None
+        
+        with self._lock:
+            self.em_andamento = True
+        resultado = {'podadas': 0, 'movidas': {}}
+        try:
+            if self.retencao_dias > 0:
+                try:
+                    resultado['podadas'] = self.db.podar_ip_logs(self.retencao_dias)
+                except Exception as e:
+                    with self._lock:
+                        self.falhas += 1
+                    print(f"Error pruning ip_logs: {e}")
+            if self.arquivo_dias > 0 and self.db.ARQUIVOS:
+                try:
+                    resultado['movidas'] = self.db.arquivar(self.arquivo_dias)
+                except Exception as e:
+                    with self._lock:
+                        self.falhas += 1
+                    print(f"Error archiving old rows: {e}")
+        finally:
+            try:
+                self.db.concluir_tarefa(self.TAREFA)
+            except Exception as e:
+                print(f"Error releasing maintenance task: {e}")
+            with self._lock:
+                self.em_andamento = False
+                self.concluidas += 1
+                self.ultima = resultado
+        return resultado
+    
+    def parar(self):
+        """Para a thread; uma passada em andamento morre com o processo e a reserva expira pelo prazo"""
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+    
+    def estatisticas(self) -> Dict:
+        """Contadores do agendador"""
+        with self._lock:
+            return {
+                'intervalo_s': self.intervalo,
+                'em_andamento': int(self.em_andamento),
+                'concluidas': self.concluidas,
+                'ignoradas': self.ignoradas,
+                'falhas': self.falhas,
+                'ultima': self.ultima
+            }
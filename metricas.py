@@ -0,0 +1,284 @@
+"""
+Métricas de requisições e de SQL, exportadas no formato texto do Prometheus
+Cada rota é medida pelo middleware (duração, status, consultas, commits e conexões
+abertas por requisição). O SQL é medido pelas conexões do Database: ConexaoMedida
+cronometra cada execute/executemany por instrução (texto normalizado) e o trace
+callback do sqlite3 conta COMMIT/ROLLBACK, inclusive os emitidos pelo próprio módulo.
+O Database informa a espera pelo lock de escrita no início de cada transação de escrita
+e as escritas repetidas (ou abandonadas) por encontrarem o banco travado.
+Instruções acima de SQL_LENTA_MS vão para o log de consultas lentas com o
+EXPLAIN QUERY PLAN. Os valores são por processo (cada worker do gunicorn tem os seus).
+"""
+import bisect
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional
+
+# Limites (segundos) dos buckets de latência
+BUCKETS_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Limites dos buckets de contagens por requisição (consultas, commits, conexões abertas)
+BUCKETS_CONTAGEM = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# Instruções cujo plano faz sentido capturar
+COM_PLANO = re.compile(r'^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b', re.I)
+LISTA_IN = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)', re.I)
+
+class Histograma:
+    def __init__(self, limites: tuple):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)
+        self.soma = 0.0
+    
+    def observar(self, valor: float):
+        # bisect_left: um valor igual ao limite entra no bucket (le = "menor ou igual")
+        self.contagens[bisect.bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+    
+    def linhas(self, nome: str, rotulos: str = ''):
+        """Linhas _bucket/_sum/_count; `rotulos` já formatado (ex.: 'rota="/x"')"""
+        prefixo = rotulos + ',' if rotulos else ''
+        acumulado = 0
+        for limite, quantidade in zip(self.limites, self.contagens):
+            acumulado += quantidade
+            yield f'{nome}_bucket{{{prefixo}le="{limite}"}} {acumulado}'
+        acumulado += self.contagens[-1]
+        yield f'{nome}_bucket{{{prefixo}le="+Inf"}} {acumulado}'
+        sufixo = f'{{{rotulos}}}' if rotulos else ''
+        yield f'{nome}_sum{sufixo} {self.soma:.6f}'
+        yield f'{nome}_count{sufixo} {acumulado}'
+
+def _rotulos(**valores) -> str:
+    def escapar(valor) -> str:
+        return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+    return ','.join(f'{nome}="{escapar(valor)}"' for nome, valor in valores.items())
+
+class Metricas:
+    def __init__(self, ativo: bool = None, lenta_ms: float = None, max_consultas: int = None, max_lentas: int = None):
+        # Configuração via variáveis de ambiente, com os argumentos tendo precedência;
+        # METRICAS_ATIVAS=0 abre as conexões sem instrumentação e SQL_LENTA_MS=0 desliga o log
+        self.ativo = ativo if ativo is not None else os.getenv('METRICAS_ATIVAS', '1') != '0'
+        self.lenta_s = (lenta_ms if lenta_ms is not None else float(os.getenv('SQL_LENTA_MS', 100))) / 1000
+        # Instruções distintas acompanhadas; acima disso entram como "outras"
+        self.max_consultas = max_consultas or int(os.getenv('METRICAS_MAX_CONSULTAS', 300))
+        self.max_lentas = max_lentas or int(os.getenv('SQL_LENTA_MAX', 50))
+        self._local = threading.local()
+        self._normalizadas = {}  # texto original -> chave normalizada
+        self._reiniciar_estado()
+    
+    def _reiniciar_estado(self):
+        self._lock = threading.Lock()
+        self._requisicoes = {}  # (método, rota, status) -> total
+        self._duracoes = {}  # (método, rota) -> Histograma
+        self._consultas = {}  # chave normalizada -> Histograma
+        self._esperas_lock = {}  # banco -> Histograma da espera pelo lock de escrita
+        self._por_requisicao = {nome: Histograma(BUCKETS_CONTAGEM) for nome in ('consultas', 'commits', 'conexoes')}
+        self.lentas = deque(maxlen=self.max_lentas)
+        self.total_lentas = 0
+        self.commits = 0
+        self.rollbacks = 0
+        self.conexoes_abertas = 0
+        self.retentativas = 0
+        self.desistencias = 0
+    
+    # --- Requisições ---------------------------------------------------------
+    
+    def iniciar_requisicao(self, metodo: str, rota: str):
+        """Início de uma requisição na thread atual (antes de qualquer trabalho da rota)"""
+        # [início, consultas, commits, conexões abertas, método, rota]
+        self._local.requisicao = [time.perf_counter(), 0, 0, 0, metodo, rota]
+    
+    def finalizar_requisicao(self, status: int):
+        """Fim da requisição da thread atual (após o corpo, inclusive respostas transmitidas)"""
+        atual = getattr(self._local, 'requisicao', None)
+        if atual is None:
+            return
+        self._local.requisicao = None
+        inicio, consultas, commits, conexoes, metodo, rota = atual
+        duracao = time.perf_counter() - inicio
+        with self._lock:
+            chave = (metodo, rota, status)
+            self._requisicoes[chave] = self._requisicoes.get(chave, 0) + 1
+            histograma = self._duracoes.get((metodo, rota))
+            if histograma is None:
+                histograma = self._duracoes[(metodo, rota)] = Histograma(BUCKETS_LATENCIA)
+            histograma.observar(duracao)
+            self._por_requisicao['consultas'].observar(consultas)
+            self._por_requisicao['commits'].observar(commits)
+            self._por_requisicao['conexoes'].observar(conexoes)
+    
+    def _contar(self, indice: int):
+        atual = getattr(self._local, 'requisicao', None)
+        if atual is not None:
+            atual[indice] += 1
+    
+    # --- SQL -----------------------------------------------------------------
+    
+    def conexao_aberta(self):
+        with self._lock:
+            self.conexoes_abertas += 1
+        self._contar(3)
+    
+    def espera_lock(self, banco: str, duracao: float):
+        """Tempo que uma transação de escrita esperou pelo lock de escrita de `banco` (BEGIN IMMEDIATE)"""
+        with self._lock:
+            histograma = self._esperas_lock.get(banco)
+            if histograma is None:
+                histograma = self._esperas_lock[banco] = Histograma(BUCKETS_LATENCIA)
+            histograma.observar(duracao)
+    
+    def escrita_travada(self, desistiu: bool):
+        """Escrita que encontrou o banco travado: repetida ou, esgotadas as tentativas, abandonada"""
+        with self._lock:
+            if desistiu:
+                self.desistencias += 1
+            else:
+                self.retentativas += 1
+    
+    def rastrear(self, sql: str):
+        """Trace callback das conexões: conta COMMIT/ROLLBACK (explícitos ou do módulo sqlite3)"""
+        if sql.startswith('COMMIT'):
+            with self._lock:
+                self.commits += 1
+            self._contar(2)
+        elif sql.startswith('ROLLBACK'):
+            with self._lock:
+                self.rollbacks += 1
+    
+    def _normalizar(self, sql: str) -> str:
+        chave = self._normalizadas.get(sql)
+        if chave is None:
+            # Espaços colapsados e listas IN (?, ?, ...) de qualquer tamanho na mesma chave
+            chave = LISTA_IN.sub('IN (?, ...)', ' '.join(sql.split()))
+            if len(self._normalizadas) < self.max_consultas * 10:
+                self._normalizadas[sql] = chave
+        return chave
+    
+    def consulta_executada(self, conn: sqlite3.Connection, sql: str, parametros, duracao: float,
+                           com_plano: bool = True):
+        """Registra uma execução; acima do limite de lentidão grava o plano no log de lentas"""
+        chave = self._normalizar(sql)
+        with self._lock:
+            histograma = self._consultas.get(chave)
+            if histograma is None:
+                if len(self._consultas) >= self.max_consultas:
+                    chave = 'outras'
+                histograma = self._consultas.setdefault(chave, Histograma(BUCKETS_LATENCIA))
+            histograma.observar(duracao)
+        self._contar(1)
+        if self.lenta_s > 0 and duracao >= self.lenta_s:
+            self._registrar_lenta(conn, chave, sql, parametros if com_plano else None, duracao)
+    
+    def _registrar_lenta(self, conn: sqlite3.Connection, chave: str, sql: str, parametros, duracao: float):
+        plano = None
+        if parametros is not None and COM_PLANO.match(sql):
+            try:
+                # Método da classe base: o EXPLAIN não passa pela medição
+                linhas = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, parametros).fetchall()
+                plano = [linha[-1] for linha in linhas]
+            except sqlite3.Error:
+                pass
+        atual = getattr(self._local, 'requisicao', None)
+        registro = {
+            'quando': datetime.now().isoformat(timespec='seconds'),
+            'duracao_ms': round(duracao * 1000, 1),
+            'sql': chave,
+            'plano': plano,
+            'rota': f'{atual[4]} {atual[5]}' if atual else None,
+        }
+        with self._lock:
+            self.lentas.append(registro)
+            self.total_lentas += 1
+        print(f"Slow query ({registro['duracao_ms']} ms, {registro['rota'] or 'background'}): {chave}"
+              + (f" | plan: {' / '.join(plano)}" if plano else ''))
+    
+    # --- Exportação ----------------------------------------------------------
+    
+    def texto_prometheus(self, componentes: Optional[Dict[str, dict]] = None) -> str:
+        """
+        Todas as métricas no formato texto do Prometheus. `componentes` acrescenta os
+        valores numéricos de estatisticas() de outros objetos como gauges
+        (ex.: {'gravador_acessos': {...}} -> osint_gravador_acessos_pendentes).
+        """
+        linhas = []
+        
+        def metrica(nome: str, tipo: str, ajuda: str):
+            linhas.append(f'# HELP {nome} {ajuda}')
+            linhas.append(f'# TYPE {nome} {tipo}')
+        
+        with self._lock:
+            metrica('osint_requisicoes_total', 'counter', 'Requisições por método, rota e status')
+            for (metodo, rota, status), total in sorted(self._requisicoes.items(), key=str):
+                linhas.append(f'osint_requisicoes_total{{{_rotulos(metodo=metodo, rota=rota, status=status)}}} {total}')
+            metrica('osint_requisicao_duracao_segundos', 'histogram', 'Duração das requisições por rota')
+            for (metodo, rota), histograma in sorted(self._duracoes.items()):
+                linhas.extend(histograma.linhas('osint_requisicao_duracao_segundos', _rotulos(metodo=metodo, rota=rota)))
+            for nome, ajuda in (('consultas', 'Instruções SQL executadas por requisição'),
+                                ('commits', 'Commits por requisição'),
+                                ('conexoes', 'Conexões SQLite abertas por requisição')):
+                metrica(f'osint_requisicao_{nome}', 'histogram', ajuda)
+                linhas.extend(self._por_requisicao[nome].linhas(f'osint_requisicao_{nome}'))
+            metrica('osint_sql_duracao_segundos', 'histogram', 'Duração do execute por instrução SQL normalizada')
+            for chave, histograma in sorted(self._consultas.items()):
+                linhas.extend(histograma.linhas('osint_sql_duracao_segundos', _rotulos(consulta=chave)))
+            metrica('osint_sql_espera_lock_segundos', 'histogram', 'Espera pelo lock de escrita no início das transações de escrita')
+            for banco, histograma in sorted(self._esperas_lock.items()):
+                linhas.extend(histograma.linhas('osint_sql_espera_lock_segundos', _rotulos(banco=banco)))
+            for nome, ajuda, valor in (('commits', 'Commits', self.commits),
+                                       ('rollbacks', 'Rollbacks', self.rollbacks),
+                                       ('conexoes_abertas', 'Conexões SQLite abertas', self.conexoes_abertas),
+                                       ('lentas', 'Instruções acima de SQL_LENTA_MS', self.total_lentas),
+                                       ('retentativas', 'Escritas repetidas por encontrarem o banco travado', self.retentativas),
+                                       ('desistencias', 'Escritas abandonadas após ESCRITA_TENTATIVAS tentativas', self.desistencias)):
+                metrica(f'osint_sql_{nome}_total', 'counter', ajuda)
+                linhas.append(f'osint_sql_{nome}_total {valor}')
+        
+        for componente, valores in (componentes or {}).items():
+            for chave, valor in valores.items():
+                if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                    metrica(f'osint_{componente}_{chave}', 'gauge', f'{componente}.estatisticas()["{chave}"]')
+                    linhas.append(f'osint_{componente}_{chave} {valor}')
+        return '\n'.join(linhas) + '\n'
+    
+    def consultas_lentas(self) -> list:
+        """Registros mais recentes do log de consultas lentas (mais novo primeiro)"""
+        with self._lock:
+            return list(reversed(self.lentas))
+    
+    def reiniciar_apos_fork(self):
+        """No processo filho: lock novo e contadores zerados (os do master não são deste worker)"""
+        self._local = threading.local()
+        self._reiniciar_estado()
+
+class CursorMedido(sqlite3.Cursor):
+    """Cursor que cronometra execute/executemany (até a primeira linha, sem os fetch)"""
+    def execute(self, sql, parametros=()):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            metricas.consulta_executada(self.connection, sql, parametros, time.perf_counter() - inicio)
+    
+    def executemany(self, sql, parametros):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, parametros)
+        finally:
+            metricas.consulta_executada(self.connection, sql, None, time.perf_counter() - inicio, com_plano=False)
+
+class ConexaoMedida(sqlite3.Connection):
+    """Conexão cujos cursores (inclusive os de conn.execute) são CursorMedido"""
+    def cursor(self, factory=CursorMedido):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+    
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+metricas = Metricas()
@@ -1,20 +1,80 @@
-from flask import request, session
-from database import Database
+from flask import request, session, g, jsonify
 from auth_system import get_user_info as get_user_from_session
+from access_log import GravadorAcessos
+from cache_permissoes import CachePermissoes
+from limitador import LimitadorTaxa
+from metricas import metricas
 import re
+import secrets
+import time
 
-db = Database()
+# O banco é escolhido por create_app (ver configurar)
+db = None
+# Modo configurável por IP_LOG_MODE (async|sync)
+gravador_acessos = GravadorAcessos()
+# TTL/tamanho configuráveis por PERMISSOES_CACHE_TTL_S e PERMISSOES_CACHE_MAX
+cache_permissoes = CachePermissoes()
+# Limites configuráveis por RATE_* (RATE_LIMIT_ATIVO=0 desativa)
+limitador = LimitadorTaxa()
+
+def configurar(banco):
+    """Liga o middleware (gravador de acessos e cache de permissões) ao Database do app"""
+    global db
+    db = banco
+    gravador_acessos.db = banco
+    cache_permissoes.db = banco
 
 def get_client_ip():
-    """Obtém o IP real do cliente"""
-    # Verifica headers de proxy
-    if request.headers.get('X-Forwarded-For'):
-        ip = request.headers.get('X-Forwarded-For').split(',')[0].strip()
-    elif request.headers.get('X-Real-IP'):
-        ip = request.headers.get('X-Real-IP')
-    else:
-        ip = request.remote_addr
-    return ip
+    """
+    Obtém o IP real do cliente: o endereço do par da conexão. Os headers X-Forwarded-For e
+    X-Real-IP vêm do cliente e não são lidos aqui; atrás de proxy, PROXY_SALTOS (create_app)
+    liga o ProxyFix, que põe em remote_addr o IP informado pelo último proxy confiável.
+    """
+    return request.remote_addr
+
+def obter_session_id():
+    """Id da sessão (anônima ou não), criado na primeira requisição"""
+    if 'session_id' not in session:
+        session['session_id'] = secrets.token_hex(16)
+    return session['session_id']
+
+def limitar_requisicao():
+    """
+    Controle de admissão (antes de qualquer trabalho da rota).
+    Retorna a resposta 429/503 quando a requisição deve ser recusada, ou None.
+    """
+    user = session.get('user') or {}
+    # O id é criado antes da admissão para o balde por sessão valer também para anônimos
+    sessao = user.get('id') or obter_session_id()
+    recusa = limitador.admitir(request.path, get_client_ip(), sessao)
+    if recusa:
+        status, retry_after = recusa
+        erro = 'Too many requests' if status == 429 else 'Server overloaded, try again shortly'
+        return jsonify({'erro': erro}), status, {'Retry-After': str(retry_after)}
+    
+    g.inicio_requisicao = time.perf_counter()
+    limitador.iniciar()
+    return None
+
+def iniciar_medicao():
+    """Abre a medição da requisição (duração, consultas, commits e conexões abertas)"""
+    rota = request.url_rule.rule if request.url_rule is not None else 'nao_encontrada'
+    metricas.iniciar_requisicao(request.method, rota)
+
+def registrar_status(resposta):
+    """after_request: guarda o status para a medição, que só fecha no teardown"""
+    g.status_resposta = resposta.status_code
+    return resposta
+
+def finalizar_medicao():
+    """Fecha a medição; no teardown, depois de transmitido o corpo (500 se não houve resposta)"""
+    metricas.finalizar_requisicao(g.pop('status_resposta', 500))
+
+def finalizar_requisicao():
+    """Contabiliza o fim de uma requisição admitida (duração e requisições em andamento)"""
+    inicio = g.pop('inicio_requisicao', None)
+    if inicio is not None:
+        limitador.finalizar(time.perf_counter() - inicio)
 
 def log_request():
     """Registra o acesso no banco de dados"""
@@ -32,14 +92,10 @@ def log_request():
         method = request.method
         user_id = session.get('user', {}).get('id') if 'user' in session else None
         
-        # Gerar ou obter session_id
-        if 'session_id' not in session:
-            import secrets
-            session['session_id'] = secrets.token_hex(16)
-        session_id = session.get('session_id', '')
+        session_id = obter_session_id()
         
-        # Registrar no banco
-        db.registrar_ip(
+        # Registrar no banco (em lote, fora da requisição, no modo async)
+        gravador_acessos.registrar(
             ip_address=ip,
             user_agent=user_agent,
             path=path,
@@ -50,40 +106,36 @@ def log_request():
     except Exception as e:
         print(f"Error logging request: {e}")
 
-def is_admin(user_email: str = None) -> bool:
-    """Verifica se o usuário é admin"""
+def permissao_usuario(user_email: str = None) -> str:
+    """
+    Permissão do usuário (da sessão quando user_email não é informado), via cache_permissoes.
+    Retorna None se o usuário não existir.
+    """
+    user = get_user_from_session()
     if not user_email:
-        user = get_user_from_session()
         if not user:
-            return False
+            return None
         user_email = user.get('email')
     
     if not user_email:
-        return False
-    
-    usuario = db.obter_usuario_por_email(user_email)
-    if usuario and usuario.get('permissao') == 'admin':
-        return True
+        return None
     
-    return False
+    # O cache é indexado pelo id, conhecido apenas para o usuário da sessão
+    usuario_id = None
+    if user and user.get('email') == user_email and user.get('id'):
+        usuario_id = int(user['id'])
+    return cache_permissoes.permissao(usuario_id, user_email)
+
+def is_admin(user_email: str = None) -> bool:
+    """Verifica se o usuário é admin"""
+    return permissao_usuario(user_email) == 'admin'
 
 def has_permission(user_email: str, required_permission: str) -> bool:
     """Verifica se o usuário tem a permissão necessária"""
-    if not user_email:
-        user = get_user_from_session()
-        if not user:
-            return False
-        user_email = user.get('email')
-    
-    if not user_email:
+    permissao = permissao_usuario(user_email)
+    if not permissao:
         return False
     
-    usuario = db.obter_usuario_por_email(user_email)
-    if not usuario:
-        return False
-    
-    permissao = usuario.get('permissao', 'user')
-    
     # Hierarquia de permissões
     permissoes = {
         'user': 0,
@@ -1,17 +1,23 @@
-import requests
 import json
 from typing import Dict, List, Optional
 import hashlib
 import base64
 from urllib.parse import quote
-from cpf_api import CPFAPIClient
 
 class OSINTTools:
     def __init__(self):
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
-        self.cpf_api = CPFAPIClient()
+        self._cpf_api = None
+    
+    @property
+    def cpf_api(self):
+        """Cliente das APIs de CPF, criado na primeira consulta (importa requests)"""
+        if self._cpf_api is None:
+            from cpf_api import CPFAPIClient
+            self._cpf_api = CPFAPIClient()
+        return self._cpf_api
     
     def buscar_nome(self, nome: str) -> Dict:
         """